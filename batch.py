@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from itertools import count
+
+import budget
+import stack_evaluator
+from closure_compiler import evaluate
+from compiler import compile, CompileError
+from environment import Environment
+from evaluator import Eval
+from mobject import Error, inspect
+from parser import ParseError, parse
+from vm import VM
+
+# Runs lots of independent programs on every core. Each program is parsed and
+# evaluated in a worker process of a ProcessPoolExecutor, and comes back as a
+# BatchResult: the inspect() string of what it evaluated to, or an error,
+# plus how long it took. Results are handed out as they finish, not in the
+# order the programs went in, so a slow program doesn't hold up the rest.
+#
+#   with Batch() as batch:
+#       for r in batch.run(sources, timeout=1.0):
+#           print(r.id, r.result or r.error)
+#
+# Workers import the whole interpreter when they start and then stay up for
+# as long as the Batch does, so a program only pays for itself.
+#
+# A timeout is wall-clock time, for every engine. With the eval engine it's
+# also an execution budget (budget.py), which the evaluator checks as it
+# goes and which leaves the worker usable. Anything the budget doesn't see
+# (a builtin working through a huge array, any other engine) is stopped
+# from here instead, KILL_AFTER seconds past the timeout. There's no
+# stopping one call in a ProcessPoolExecutor, so that means a new pool:
+# whatever else was running starts over on it. With a timeout there are
+# only as many programs out as there are workers, so each one starts as
+# soon as it's handed out and its clock can start then too.
+
+# Monkey recursion is Python recursion for most engines, the default limit
+# is too low for real programs
+RECURSION_LIMIT = 20000
+
+# Programs waiting on a worker, per worker. Enough to keep them all busy
+# without reading in an unbounded iterable all at once.
+QUEUED_PER_WORKER = 4
+
+# Seconds past the timeout that a program gets before its worker is killed,
+# time for the budget to stop it first
+KILL_AFTER = 0.5
+
+@dataclass
+class BatchResult:
+    id: object
+    result: str | None = None
+    error: str | None = None
+    # Seconds, "parse", "eval" and "total", as measured in the worker
+    timings: dict = field(default_factory=dict)
+
+@dataclass
+class Job:
+    id: object
+    source: str | None = None
+    path: str | None = None
+
+def warm_up():
+    # Runs in each worker as it starts. Everything's been imported by the
+    # time this module is, so this is just the interpreter settings.
+    sys.setrecursionlimit(RECURSION_LIMIT)
+
+def run_job(job, engine="eval", limits=None):
+    started = time.perf_counter()
+    timings = {}
+    try:
+        source = job.source
+        if job.path is not None:
+            with open(job.path, encoding="utf-8") as f:
+                source = f.read()
+
+        # Stops at the first syntax error, there's no running a program
+        # that has one anyway
+        program = parse(source, on_error="raise")
+        timings["parse"] = time.perf_counter() - started
+
+        parsed = time.perf_counter()
+        evaluated = run_program(program, engine, limits)
+        timings["eval"] = time.perf_counter() - parsed
+    except ParseError as e:
+        timings["parse"] = time.perf_counter() - started
+        evaluated = Error(f"syntax error: {e}")
+    except RecursionError:
+        evaluated = Error("maximum recursion depth exceeded")
+    except Exception as e:
+        evaluated = Error(f"{type(e).__name__}: {e}")
+    finally:
+        timings["total"] = time.perf_counter() - started
+
+    if isinstance(evaluated, Error):
+        return BatchResult(job.id, error=evaluated.message, timings=timings)
+    return BatchResult(job.id, inspect(evaluated) if evaluated is not None else None, timings=timings)
+
+def run_program(program, engine, limits):
+    match engine:
+        case "vm":
+            try:
+                return VM(compile(program)).run()
+            except CompileError as e:
+                return Error(str(e))
+        case "closure":
+            return evaluate(Environment(), program)
+        case "stack":
+            return stack_evaluator.evaluate(Environment(), program)
+        case _ if limits is not None:
+            return budget.run(program, limits)[0]
+        case _:
+            return Eval(Environment(), program)
+
+class Batch:
+    def __init__(self, workers=None, engine="eval"):
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.executor = ProcessPoolExecutor(self.workers, initializer=warm_up)
+
+    def run(self, sources, timeout=None, limits=None):
+        # sources are source strings, or (id, source) pairs. Plain strings
+        # are numbered in the order they come in.
+        return self.run_jobs(jobs(sources), timeout, limits)
+
+    def run_files(self, paths, timeout=None, limits=None):
+        # Files are read by the workers, and identified by their path
+        return self.run_jobs((Job(path, path=os.fspath(path)) for path in paths), timeout, limits)
+
+    def run_jobs(self, jobs, timeout=None, limits=None):
+        if limits is not None and self.engine != "eval":
+            raise ValueError("budgets need the eval engine")
+        if timeout is not None and self.engine == "eval":
+            limits = budget.Budget(
+                limits.max_steps if limits else None,
+                limits.max_memory if limits else None,
+                timeout,
+            )
+
+        queued = self.workers if timeout is not None else self.workers * QUEUED_PER_WORKER
+        pending = {}
+        deadlines = {}
+        jobs = iter(jobs)
+        exhausted = False
+
+        def submit(job):
+            future = self.executor.submit(run_job, job, self.engine, limits)
+            pending[future] = job
+            if timeout is not None:
+                deadlines[future] = time.monotonic() + timeout + KILL_AFTER
+
+        while True:
+            while not exhausted and len(pending) < queued:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                submit(job)
+
+            if not pending:
+                return
+
+            wait_for = None
+            if timeout is not None:
+                wait_for = max(0, min(deadlines.values()) - time.monotonic())
+            done, _ = wait(pending, wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                deadlines.pop(future, None)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # The worker died (out of memory, a crash in C) rather
+                    # than the program failing
+                    yield BatchResult(job.id, error=f"{type(e).__name__}: {e}")
+
+            now = time.monotonic()
+            overdue = [f for f, deadline in deadlines.items() if deadline <= now and not f.done()]
+            if overdue:
+                for future in overdue:
+                    job = pending.pop(future)
+                    del deadlines[future]
+                    yield BatchResult(job.id, error=f"time budget exceeded: {timeout}s")
+
+                # The rest of what was running goes down with the pool
+                running = {f: job for f, job in pending.items() if not f.done()}
+                for future in running:
+                    del pending[future], deadlines[future]
+                self.restart()
+                for job in running.values():
+                    submit(job)
+
+    def restart(self):
+        # Kills every worker and starts a new pool. The executor has no
+        # public way to stop a running call.
+        for process in list(self.executor._processes.values()):
+            process.terminate()
+        self.executor.shutdown(cancel_futures=True)
+        self.executor = ProcessPoolExecutor(self.workers, initializer=warm_up)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def jobs(sources):
+    numbers = count()
+    for item in sources:
+        if isinstance(item, str):
+            yield Job(next(numbers), item)
+        else:
+            id, source = item
+            yield Job(id, source)
+
+def run_batch(sources, workers=None, engine="eval", timeout=None, limits=None):
+    # One-off version of Batch.run, the pool goes away when the results are
+    # all in
+    with Batch(workers, engine) as batch:
+        yield from batch.run(sources, timeout, limits)
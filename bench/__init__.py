@@ -0,0 +1,5 @@
+# Benchmarks for the lexer, parser and evaluator. Run `python -m bench --help`
+# from the repository root.
+from bench.workloads import workloads
+from bench.runner import bench, bench_workload, engines
+from bench.compare import compare
@@ -0,0 +1,166 @@
+import argparse
+import json
+import sys
+import threading
+
+from bench.workloads import workloads
+from bench.runner import bench, bench_budget, bench_builtins, bench_frames, bench_incremental, bench_int_arrays, bench_strings, bench_lexers, bench_optimizer, engines
+from lexer import lexers
+from bench.compare import compare, format_rows
+from bench.memory import memory_report
+
+# The tree-walking evaluator recurses in Python for every Monkey call, so
+# the recursive workloads need a lot more stack than the defaults give us.
+RECURSION_LIMIT = 200000
+THREAD_STACK_SIZE = 512 * 1024 * 1024
+
+def run_command(args):
+    report = bench(args.workload, args.engine, args.scale, args.repeat, not args.no_memory, args.lexer, args.optimize)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+def optimize_command(args):
+    print(json.dumps(bench_optimizer(args.workload, args.engine, args.scale, args.repeat), indent=2))
+    return 0
+
+def lex_command(args):
+    print(json.dumps(bench_lexers(args.scale, args.repeat), indent=2))
+    return 0
+
+def budget_command(args):
+    print(json.dumps(bench_budget(args.workload, args.scale, args.repeat), indent=2))
+    return 0
+
+def incremental_command(args):
+    print(json.dumps(bench_incremental(args.lines, args.edits), indent=2))
+    return 0
+
+def builtins_command(args):
+    print(json.dumps(bench_builtins(args.size, args.engine, args.repeat), indent=2))
+    return 0
+
+def ints_command(args):
+    print(json.dumps(bench_int_arrays(args.size, args.repeat), indent=2))
+    return 0
+
+def strings_command(args):
+    print(json.dumps(bench_strings(args.size, args.flat_limit, args.repeat), indent=2))
+    return 0
+
+def frames_command(args):
+    print(json.dumps(bench_frames(args.workload, args.engine, args.scale, args.repeat), indent=2))
+    return 0
+
+def memory_command(args):
+    report = memory_report(args.array_size, args.program_lines)
+    print(json.dumps(report, indent=2))
+    return 0
+
+def compare_command(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows = compare(old, new, args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(format_rows(rows))
+
+    return 1 if any(row["regression"] for row in rows) else 0
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog="python -m bench")
+    commands = argparser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run workloads and print a JSON report")
+    run.add_argument("-w", "--workload", action="append", choices=list(workloads),
+                     help="workload to run, can be repeated (default: all)")
+    run.add_argument("-e", "--engine", choices=list(engines), default="eval")
+    run.add_argument("-l", "--lexer", choices=list(lexers), default="char")
+    run.add_argument("-s", "--scale", type=float, default=1.0, help="workload size multiplier")
+    run.add_argument("-r", "--repeat", type=int, default=3, help="timed runs per phase, best is reported")
+    run.add_argument("-o", "--output", help="write the report here instead of stdout")
+    run.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc pass")
+    run.add_argument("-O", "--optimize", action="store_true", help="run the optimizer pass after parsing")
+    run.set_defaults(func=run_command)
+
+    opt = commands.add_parser("optimize", help="node counts and eval time with and without the optimizer")
+    opt.add_argument("-w", "--workload", action="append", choices=list(workloads))
+    opt.add_argument("-e", "--engine", choices=list(engines), default="eval")
+    opt.add_argument("-s", "--scale", type=float, default=1.0)
+    opt.add_argument("-r", "--repeat", type=int, default=3)
+    opt.set_defaults(func=optimize_command)
+
+    lex = commands.add_parser("lex", help="tokens/sec for each lexer backend on big_source")
+    lex.add_argument("-s", "--scale", type=float, default=10.0, help="about 1MB of source per unit (default: 10)")
+    lex.add_argument("-r", "--repeat", type=int, default=3)
+    lex.set_defaults(func=lex_command)
+
+    bud = commands.add_parser("budget", help="eval time with and without an execution budget, and its counters")
+    bud.add_argument("-w", "--workload", action="append", choices=list(workloads))
+    bud.add_argument("-s", "--scale", type=float, default=1.0)
+    bud.add_argument("-r", "--repeat", type=int, default=3)
+    bud.set_defaults(func=budget_command)
+
+    inc = commands.add_parser("incremental", help="Document.edit() against parsing it all again, on big_source")
+    inc.add_argument("--lines", type=int, default=50_000)
+    inc.add_argument("--edits", type=int, default=200, help="edits per kind of edit")
+    inc.set_defaults(func=incremental_command)
+
+    blt = commands.add_parser("builtins", help="the map and reduce builtins against recursive Monkey versions")
+    blt.add_argument("--size", type=int, action="append", help="array length, can be repeated (default: 10k, 100k and 1M)")
+    blt.add_argument("-e", "--engine", choices=["eval", "closure", "stack"], default="eval")
+    blt.add_argument("-r", "--repeat", type=int, default=1)
+    blt.set_defaults(func=builtins_command)
+
+    ints = commands.add_parser("ints", help="the bulk builtins on packed integer arrays against boxed ones")
+    ints.add_argument("--size", type=int, default=1_000_000)
+    ints.add_argument("-r", "--repeat", type=int, default=3)
+    ints.set_defaults(func=ints_command)
+
+    strings = commands.add_parser("strings", help="building a string with + as a rope and as plain copies")
+    strings.add_argument("--size", type=int, action="append", help="pieces, can be repeated (default: 10k, 100k and 1M)")
+    strings.add_argument("--flat-limit", type=int, default=100_000, help="most pieces to build by copying")
+    strings.add_argument("-r", "--repeat", type=int, default=1)
+    strings.set_defaults(func=strings_command)
+
+    frames = commands.add_parser("frames", help="call frames made per call, with and without the frame pool")
+    frames.add_argument("-w", "--workload", action="append", choices=list(workloads),
+                        help="workload to run, can be repeated (default: fib, map_reduce and closures)")
+    frames.add_argument("-e", "--engine", choices=["eval", "closure"], default="eval")
+    frames.add_argument("-s", "--scale", type=float, default=1.0)
+    frames.add_argument("-r", "--repeat", type=int, default=5)
+    frames.set_defaults(func=frames_command)
+
+    memory = commands.add_parser("memory", help="bytes per object for a big array and a big parsed program")
+    memory.add_argument("--array-size", type=int, default=1_000_000)
+    memory.add_argument("--program-lines", type=int, default=100_000)
+    memory.set_defaults(func=memory_command)
+
+    cmp = commands.add_parser("compare", help="compare two reports, exit 1 on regressions")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("-t", "--threshold", type=float, default=0.1,
+                     help="relative slowdown that counts as a regression (default: 0.1)")
+    cmp.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    cmp.set_defaults(func=compare_command)
+
+    args = argparser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(THREAD_STACK_SIZE)
+
+    status = []
+    thread = threading.Thread(target=lambda: status.append(main()))
+    thread.start()
+    thread.join()
+    sys.exit(status[0] if status else 1)
@@ -0,0 +1,48 @@
+# Lower is better for everything we compare. Rates (tokens/sec and friends)
+# are derived from the times, so checking them too would just double up.
+METRICS = [
+    ("lex", "seconds"),
+    ("parse", "seconds"),
+    ("eval", "seconds"),
+    ("lex", "peak_bytes"),
+    ("parse", "peak_bytes"),
+    ("eval", "peak_bytes"),
+    ("eval", "allocations"),
+]
+
+def compare(old, new, threshold=0.1):
+    """Lines up two bench() reports and returns one row per metric present
+    in both. A row is a regression if new/old went past 1 + threshold."""
+    rows = []
+    for name, new_report in new["workloads"].items():
+        old_report = old["workloads"].get(name)
+        if old_report is None:
+            continue
+
+        for phase, metric in METRICS:
+            before = old_report.get(phase, {}).get(metric)
+            after = new_report.get(phase, {}).get(metric)
+            if not before or after is None:
+                continue
+
+            ratio = after / before
+            rows.append({
+                "workload": name,
+                "metric": f"{phase}.{metric}",
+                "old": before,
+                "new": after,
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            })
+
+    return rows
+
+def format_rows(rows):
+    lines = [f"{'workload':<14} {'metric':<18} {'old':>14} {'new':>14} {'ratio':>7}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(
+            f"{row['workload']:<14} {row['metric']:<18} "
+            f"{row['old']:>14.6g} {row['new']:>14.6g} {row['ratio']:>7.3f}{flag}"
+        )
+    return "\n".join(lines)
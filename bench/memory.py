@@ -0,0 +1,86 @@
+import gc
+import os
+import tempfile
+import tracemalloc
+
+import mobject as obj
+from parser import parse
+from bench.runner import count_nodes, lex_all, peak_memory
+from bench.workloads import big_source
+
+def retained_bytes(build):
+    # Bytes still allocated once build() is done, i.e. what the result
+    # itself costs to keep around
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = build()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+def array_report(size):
+    # Integer() directly, the small int cache would hide the per-object cost
+    array, size_bytes = retained_bytes(lambda: obj.Array([obj.Integer(i) for i in range(size)]))
+    return {
+        "elements": len(array.elements),
+        "bytes": size_bytes,
+        "bytes_per_element": size_bytes / size,
+    }
+
+def int_array_report(size):
+    # The same integers packed into an IntArray
+    array, size_bytes = retained_bytes(lambda: obj.IntArray([obj.Integer(i) for i in range(size)]))
+    return {
+        "elements": len(array.elements),
+        "bytes": size_bytes,
+        "bytes_per_element": size_bytes / size,
+    }
+
+def program_report(lines):
+    # big_source writes two lines per block
+    source = big_source(lines / 20000)
+    program, size_bytes = retained_bytes(lambda: parse(source))
+    nodes = count_nodes(program)
+    return {
+        "lines": source.count("\n") + 1,
+        "nodes": nodes,
+        "bytes": size_bytes,
+        "bytes_per_node": size_bytes / nodes,
+    }
+
+def lex_report(lines):
+    # Peak memory lexing a file read into a str first vs streamed from the
+    # file object
+    source = big_source(lines / 20000)
+    with tempfile.NamedTemporaryFile("w", suffix=".monkey", delete=False) as f:
+        f.write(source)
+    del source
+
+    def from_string():
+        with open(f.name) as g:
+            return lex_all(g.read())
+
+    def from_file():
+        with open(f.name) as g:
+            return lex_all(g)
+
+    try:
+        return {
+            "file_bytes": os.path.getsize(f.name),
+            "string_peak_bytes": peak_memory(from_string),
+            "stream_peak_bytes": peak_memory(from_file),
+        }
+    finally:
+        os.unlink(f.name)
+
+def memory_report(array_size=1_000_000, program_lines=100_000):
+    return {
+        "array": array_report(array_size),
+        "int_array": int_array_report(array_size),
+        "program": program_report(program_lines),
+        "lex": lex_report(program_lines),
+    }
@@ -0,0 +1,503 @@
+import dataclasses
+import gc
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import evaluator
+from lexer import lexers
+from parser import parse
+from incremental import Document
+from optimizer import optimize
+import budget
+import environment
+from environment import Environment
+from compiler import compile, CompileError
+from vm import VM
+from closure_compiler import evaluate
+import stack_evaluator
+import mobject as obj
+
+from bench.workloads import workloads
+
+SCHEMA_VERSION = 1
+
+def run_eval(program):
+    return evaluator.Eval(Environment(), program)
+
+def run_closure(program):
+    return evaluate(Environment(), program)
+
+def run_stack(program):
+    return stack_evaluator.evaluate(Environment(), program)
+
+def run_vm(program):
+    try:
+        bytecode = compile(program)
+    except CompileError as e:
+        return obj.Error(str(e))
+    return VM(bytecode).run()
+
+engines = {
+    "eval": run_eval,
+    "closure": run_closure,
+    "stack": run_stack,
+    "vm": run_vm,
+}
+
+def lex_all(source, backend="char"):
+    count = 0
+    for _ in lexers[backend](source):
+        count += 1
+    return count
+
+def parse_all(source, backend="char"):
+    # parse() includes the resolver pass, which is part of parsing as far
+    # as the engines are concerned
+    return parse(source, backend)
+
+def count_nodes(node):
+    # Generic walk over the mast dataclasses, no need to list every kind
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            stack.extend(node.keys())
+            stack.extend(node.values())
+        elif dataclasses.is_dataclass(node):
+            count += 1
+            stack.extend(getattr(node, f.name) for f in dataclasses.fields(node))
+    return count
+
+@contextmanager
+def counting_evals():
+    # Every recursive call inside evaluator goes through the module global,
+    # so swapping it out counts them all.
+    counter = [0]
+    original = evaluator.Eval
+
+    def counted(env, node):
+        counter[0] += 1
+        return original(env, node)
+
+    evaluator.Eval = counted
+    try:
+        yield counter
+    finally:
+        evaluator.Eval = original
+
+@contextmanager
+def counting_frames():
+    # Counts Environments made, which is one per call unless the call got
+    # a frame from the pool
+    counter = [0]
+    original = Environment.__init__
+
+    def __init__(self, *args, **kwargs):
+        counter[0] += 1
+        original(self, *args, **kwargs)
+
+    Environment.__init__ = __init__
+    try:
+        yield counter
+    finally:
+        Environment.__init__ = original
+
+@contextmanager
+def counting_allocations():
+    # Counts constructor calls on every mobject value type. Cached objects
+    # (small integers, interned strings) don't go through __init__, so they
+    # don't count, which is the point.
+    counter = [0]
+    originals = {}
+
+    def counted(original):
+        def __init__(self, *args, **kwargs):
+            counter[0] += 1
+            original(self, *args, **kwargs)
+        return __init__
+
+    for value in vars(obj).values():
+        if isinstance(value, type) and value.__module__ == obj.__name__ and (dataclasses.is_dataclass(value) or value is obj.String):
+            originals[value] = value.__init__
+            value.__init__ = counted(value.__init__)
+
+    try:
+        yield counter
+    finally:
+        for cls, original in originals.items():
+            cls.__init__ = original
+
+def timed(fn, *args, repeat=1):
+    times = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return result, times
+
+def peak_memory(fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def summarize(times):
+    return {
+        "seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "runs": len(times),
+    }
+
+def per_second(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+def bench_workload(name, engine="eval", scale=1.0, repeat=3, memory=True, lexer="char", optimized=False):
+    source = workloads[name](scale)
+    run = engines[engine]
+
+    tokens, lex_times = timed(lex_all, source, lexer, repeat=repeat)
+    program, parse_times = timed(parse_all, source, lexer, repeat=repeat)
+    if optimized:
+        program = optimize(program)
+    nodes = count_nodes(program)
+    result, eval_times = timed(run, program, repeat=repeat)
+
+    lex = summarize(lex_times)
+    lex["tokens_per_sec"] = per_second(tokens, lex["seconds"])
+
+    parse = summarize(parse_times)
+    parse["nodes_per_sec"] = per_second(nodes, parse["seconds"])
+
+    execute = summarize(eval_times)
+    with counting_allocations() as counter:
+        run(program)
+    execute["allocations"] = counter[0]
+
+    if engine == "eval":
+        with counting_evals() as counter:
+            run(program)
+        execute["evals"] = counter[0]
+        execute["evals_per_sec"] = per_second(counter[0], execute["seconds"])
+
+        evaluator.reset_inline_cache_stats()
+        run(program)
+        execute["inline_cache"] = dict(evaluator.inline_cache_stats)
+
+    report = {
+        "source_bytes": len(source.encode()),
+        "tokens": tokens,
+        "nodes": nodes,
+        "result": evaluator.inspect(result) if result is not None else None,
+        "lex": lex,
+        "parse": parse,
+        "eval": execute,
+    }
+
+    if memory:
+        lex["peak_bytes"] = peak_memory(lex_all, source, lexer)
+        parse["peak_bytes"] = peak_memory(parse_all, source, lexer)
+        execute["peak_bytes"] = peak_memory(run, program)
+
+    return report
+
+def bench(names=None, engine="eval", scale=1.0, repeat=3, memory=True, lexer="char", optimized=False):
+    names = names or list(workloads)
+    return {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "engine": engine,
+            "lexer": lexer,
+            "optimized": optimized,
+            "scale": scale,
+            "repeat": repeat,
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+        },
+        "workloads": {
+            name: bench_workload(name, engine, scale, repeat, memory, lexer, optimized)
+            for name in names
+        },
+    }
+
+def bench_optimizer(names=None, engine="eval", scale=1.0, repeat=3):
+    # Node counts and eval time for each workload with and without the
+    # optimizer pass
+    report = {}
+    for name in names or list(workloads):
+        run = engines[engine]
+        program = parse(workloads[name](scale))
+        optimized, optimize_times = timed(optimize, program, repeat=repeat)
+        before, before_times = timed(run, program, repeat=repeat)
+        after, after_times = timed(run, optimized, repeat=repeat)
+
+        plain = summarize(before_times)
+        fast = summarize(after_times)
+        report[name] = {
+            "nodes": count_nodes(program),
+            "optimized_nodes": count_nodes(optimized),
+            "optimize": summarize(optimize_times),
+            "eval": plain,
+            "optimized_eval": fast,
+            "speedup": plain["seconds"] / fast["seconds"] if fast["seconds"] > 0 else None,
+            "same_result": before == after,
+        }
+    return {"engine": engine, "scale": scale, "workloads": report}
+
+def bench_lexers(scale=10.0, repeat=3):
+    # Just lexing, every backend on the same big_source, which is about 1MB
+    # per unit of scale
+    source = workloads["big_source"](scale)
+    report = {"source_bytes": len(source.encode())}
+    for backend in lexers:
+        tokens, times = timed(lex_all, source, backend, repeat=repeat)
+        report[backend] = summarize(times)
+        report[backend]["tokens"] = tokens
+        report[backend]["tokens_per_sec"] = per_second(tokens, report[backend]["seconds"])
+    return report
+
+def bench_budget(names=None, scale=1.0, repeat=3):
+    # Eval time with no budget, and with an unlimited one (all the counting,
+    # none of the stopping), plus what got counted. The cost of budgets when
+    # they're off shows up in the plain eval numbers, compare those across
+    # commits with `compare`.
+    report = {}
+    for name in names or list(workloads):
+        program = parse(workloads[name](scale))
+        _, plain_times = timed(run_eval, program, repeat=repeat)
+        (_, context), counted_times = timed(budget.run, program, budget.Budget(), repeat=repeat)
+
+        plain = summarize(plain_times)
+        counted = summarize(counted_times)
+        counters = context.counters()
+        del counters["seconds"]
+        report[name] = {
+            "eval": plain,
+            "budgeted_eval": counted,
+            "overhead": counted["seconds"] / plain["seconds"] - 1 if plain["seconds"] > 0 else None,
+            "counters": counters,
+        }
+    return {"scale": scale, "workloads": report}
+
+def bench_incremental(lines=50_000, edits=200, seed=0):
+    # A Document on big_source (two lines per block), edited a keystroke at
+    # a time, against parsing it all again. "typing" types and deletes a
+    # character a few lines apart near the middle, "newline" does the same
+    # with line breaks (which moves every statement after it), "jumping"
+    # types at random places all over.
+    source = workloads["big_source"](lines / 20_000)
+    _, full_times = timed(parse_all, source)
+    document, open_times = timed(Document, source)
+
+    rng = random.Random(seed)
+    middle = len(source) // 2
+    places = {
+        "typing": lambda i: middle + (i // 2) * 300,
+        "newline": lambda i: middle + (i // 2) * 300,
+        "jumping": lambda i: rng.randrange(len(source)),
+    }
+
+    report = {
+        "lines": source.count("\n") + 1,
+        "statements": len(document.segments),
+        "full_parse": summarize(full_times),
+        "open": summarize(open_times),
+    }
+    for name, place in places.items():
+        text = "\n" if name == "newline" else "x"
+        edit_times, program_times, reparsed = [], [], []
+        for i in range(edits):
+            if i % 2 == 0:
+                offset = place(i)
+                # Just after a letter, so it's the middle of a name
+                while not document.text.slice(offset - 1, offset).isalpha():
+                    offset += 1
+                edit = (offset, offset, text)
+            else:
+                edit = (offset, offset + 1, "")
+
+            start = time.perf_counter()
+            document.edit(*edit)
+            edited = time.perf_counter()
+            document.program
+            program_times.append(time.perf_counter() - edited)
+            edit_times.append(edited - start)
+            reparsed.append(document.reparsed)
+
+        report[name] = {
+            "edit": summarize(edit_times),
+            "program": summarize(program_times),
+            "max_seconds": max(e + p for e, p in zip(edit_times, program_times)),
+            "statements_reparsed": statistics.mean(reparsed),
+        }
+    return report
+
+# The map and reduce everyone writes in Monkey, one call and one push per
+# element
+RECURSIVE_MAP_REDUCE = """
+let mapr = fn(arr, f) {
+    let iter = fn(arr, acc) {
+        if (len(arr) == 0) { return acc; }
+        iter(rest(arr), push(acc, f(first(arr))));
+    };
+    iter(arr, []);
+};
+
+let reducer = fn(arr, initial, f) {
+    let iter = fn(arr, result) {
+        if (len(arr) == 0) { return result; }
+        iter(rest(arr), f(result, first(arr)));
+    };
+    iter(arr, initial);
+};
+"""
+
+def bench_builtins(sizes=None, engine="eval", repeat=1):
+    # Doubling then summing `numbers` with the map and reduce builtins,
+    # against the recursive versions above. Both get the same array from
+    # range, which isn't timed. The recursive ones need a Python frame per
+    # element and usually run out of them long before 1M.
+    run = {
+        "eval": evaluator.Eval,
+        "closure": evaluate,
+        "stack": stack_evaluator.evaluate,
+    }[engine]
+    native = parse("reduce(map(numbers, fn(x) { x * 2 }), 0, fn(acc, x) { acc + x })")
+    recursive = parse("reducer(mapr(numbers, fn(x) { x * 2 }), 0, fn(acc, x) { acc + x })")
+
+    report = {}
+    for size in sizes or [10_000, 100_000, 1_000_000]:
+        env = Environment()
+        run(env, parse(RECURSIVE_MAP_REDUCE + f"let numbers = range({size});"))
+        expected = obj.Integer(size * (size - 1))
+
+        row = {}
+        for name, program in [("native", native), ("recursive", recursive)]:
+            try:
+                result, times = timed(run, env, program, repeat=repeat)
+            except RecursionError:
+                row[name] = {"error": "RecursionError"}
+                continue
+            if result != expected:
+                row[name] = {"error": obj.inspect(result)}
+                continue
+            row[name] = summarize(times)
+            row[name]["elements_per_sec"] = per_second(size, row[name]["seconds"])
+
+        if "seconds" in row["native"] and "seconds" in row["recursive"]:
+            row["speedup"] = row["recursive"]["seconds"] / row["native"]["seconds"]
+        report[size] = row
+    return {"engine": engine, "sizes": report}
+
+# The bulk builtins, each as a call on `numbers`
+INT_ARRAY_OPS = {
+    "sum": "sum(numbers)",
+    "min": "min(numbers)",
+    "max": "max(numbers)",
+    "sort": "sort(numbers)",
+    "add": "add(numbers, numbers)",
+    "mul": "mul(numbers, 3)",
+    "index": "numbers[500]",
+}
+
+def bench_int_arrays(size=1_000_000, repeat=3, seed=0):
+    # The bulk builtins on an IntArray against the same integers in a plain
+    # Array (boxed, one Integer each), plus what each costs to keep around.
+    # sum also gets the reduce builtin with a Monkey function, which is how
+    # it'd be done without them.
+    from bench.memory import retained_bytes  # It imports us
+
+    rng = random.Random(seed)
+    ints = [rng.randrange(-10**9, 10**9) for _ in range(size)]
+    arrays = {}
+    report = {"size": size}
+    for name, make in [("packed", obj.IntArray), ("boxed", obj.Array)]:
+        arrays[name], size_bytes = retained_bytes(lambda: make([obj.Integer(i) for i in ints]))
+        report[name] = {"bytes": size_bytes, "bytes_per_element": size_bytes / size}
+
+    ops = dict(INT_ARRAY_OPS, reduce_sum="reduce(numbers, 0, fn(acc, x) { acc + x })")
+    for op, source in ops.items():
+        program = parse(source)
+        row = {}
+        for name, array in arrays.items():
+            if op == "reduce_sum" and name == "boxed":
+                continue
+            env = Environment()
+            env.put("numbers", array)
+            _, times = timed(evaluator.Eval, env, program, repeat=repeat)
+            row[name] = summarize(times)
+            row[name]["elements_per_sec"] = per_second(size, row[name]["seconds"])
+        if "boxed" in row:
+            row["speedup"] = row["boxed"]["seconds"] / row["packed"]["seconds"] if row["packed"]["seconds"] > 0 else None
+        report[op] = row
+    return report
+
+def bench_strings(sizes=None, flat_limit=100_000, repeat=1):
+    # Building a string from `size` ten-character pieces with +, as ropes
+    # and as plain copies (ROPE_MIN too big to ever reach, which is how +
+    # used to be). Copying is quadratic, so it's only run up to flat_limit
+    # pieces. "join" is the one-off cost of reading the rope's characters.
+    program = parse('reduce(range(size), "", fn(s, i) { s + "0123456789" })')
+    report = {}
+    for size in sizes or [10_000, 100_000, 1_000_000]:
+        row = {}
+        for name, rope_min in [("rope", obj.ROPE_MIN), ("flat", float("inf"))]:
+            if name == "flat" and size > flat_limit:
+                continue
+            original, obj.ROPE_MIN = obj.ROPE_MIN, rope_min
+            try:
+                env = Environment()
+                env.put("size", obj.Integer(size))
+                result, times = timed(evaluator.Eval, env, program, repeat=repeat)
+            finally:
+                obj.ROPE_MIN = original
+            start = time.perf_counter()
+            length = len(result.value)
+            row[name] = summarize(times)
+            row[name]["join_seconds"] = time.perf_counter() - start
+            row[name]["bytes"] = length
+
+        if "flat" in row:
+            row["speedup"] = row["flat"]["seconds"] / row["rope"]["seconds"]
+        report[size] = row
+    return report
+
+def bench_frames(names=None, engine="eval", scale=1.0, repeat=3):
+    # Environments made per Monkey call, and run time, with frames pooled
+    # and without (MAX_POOLED_FRAMES = 0, every call makes its frame the
+    # way they all used to). The calls come from a budgeted run, which
+    # counts them.
+    report = {}
+    for name in names or ["fib", "map_reduce", "closures"]:
+        program = parse(workloads[name](scale))
+        _, context = budget.run(program)
+        row = {"calls": context.calls}
+        for label, pooled in [("pooled", environment.MAX_POOLED_FRAMES), ("unpooled", 0)]:
+            original, environment.MAX_POOLED_FRAMES = environment.MAX_POOLED_FRAMES, pooled
+            environment.frame_pool.clear()
+            try:
+                with counting_frames() as frames:
+                    engines[engine](program)
+                _, times = timed(engines[engine], program, repeat=repeat)
+            finally:
+                environment.MAX_POOLED_FRAMES = original
+            row[label] = summarize(times)
+            row[label]["frames_made"] = frames[0]
+            row[label]["frames_per_call"] = frames[0] / context.calls if context.calls else None
+        report[name] = row
+    return {"engine": engine, "scale": scale, "workloads": report}
@@ -0,0 +1,140 @@
+# Monkey programs for the benchmarks. Each one is generated from a `scale`
+# factor so the same workload can be made quick for a smoke test or big
+# enough to show up in a profile.
+
+def name(prefix, i):
+    # Monkey identifiers are letters only, so spell the number out in a-j
+    return prefix + "".join(chr(ord("a") + int(d)) for d in str(i))
+
+def fib(scale=1.0):
+    n = 15 + round(4 * scale)
+    return f"""
+let fib = fn(n) {{
+    if (n < 2) {{ return n; }}
+    fib(n - 1) + fib(n - 2);
+}};
+fib({n});
+"""
+
+def map_reduce(scale=1.0):
+    n = max(1, round(300 * scale))
+    return f"""
+let build = fn(arr, i, n) {{
+    if (i == n) {{ return arr; }}
+    build(push(arr, i), i + 1, n);
+}};
+
+let map = fn(arr, f) {{
+    let iter = fn(arr, acc) {{
+        if (len(arr) == 0) {{ return acc; }}
+        iter(rest(arr), push(acc, f(first(arr))));
+    }};
+    iter(arr, []);
+}};
+
+let reduce = fn(arr, initial, f) {{
+    let iter = fn(arr, result) {{
+        if (len(arr) == 0) {{ return result; }}
+        iter(rest(arr), f(result, first(arr)));
+    }};
+    iter(arr, initial);
+}};
+
+let numbers = build([], 0, {n});
+let doubled = map(numbers, fn(x) {{ x * 2 }});
+reduce(doubled, 0, fn(acc, x) {{ acc + x }});
+"""
+
+def hash_lookups(scale=1.0):
+    n = max(1, round(500 * scale))
+    pairs = ", ".join(f'"key{i}": {i}' for i in range(n))
+    return f"""
+let table = {{{pairs}}};
+let keys = [{", ".join(f'"key{i}"' for i in range(n))}];
+
+let lookup = fn(i, n, acc) {{
+    if (i == n) {{ return acc; }}
+    lookup(i + 1, n, acc + table[keys[i]]);
+}};
+lookup(0, {n}, 0);
+"""
+
+def big_hash(scale=1.0):
+    # One big hash literal with integer keys, then every key looked up,
+    # split in halves so the recursion stays shallow. Scale 10 is 1M
+    # entries.
+    n = max(2, round(100_000 * scale))
+    pairs = ", ".join(f"{i}: {i % 7}" for i in range(n))
+    return f"""
+let table = {{{pairs}}};
+
+let total = fn(lo, hi) {{
+    if (hi - lo == 1) {{ return table[lo]; }}
+    let mid = lo + (hi - lo) / 2;
+    total(lo, mid) + total(mid, hi);
+}};
+total(0, {n});
+"""
+
+def closures(scale=1.0):
+    depth = max(1, round(40 * scale))
+    calls = max(1, round(200 * scale))
+
+    # fn(a0) { fn(a1) { ... a0 + a1 + ... } }, so the innermost body reads
+    # every level of the environment chain.
+    body = " + ".join(name("a", i) for i in range(depth))
+    nested = body
+    for i in reversed(range(depth)):
+        nested = f"fn({name('a', i)}) {{ {nested} }}"
+    applied = "nested" + "".join(f"({i})" for i in range(depth - 1))
+
+    return f"""
+let nested = {nested};
+let innermost = {applied};
+
+let repeat = fn(i, n, acc) {{
+    if (i == n) {{ return acc; }}
+    repeat(i + 1, n, acc + innermost(i));
+}};
+repeat(0, {calls}, 0);
+"""
+
+def constants(scale=1.0):
+    # Arithmetic on named constants and a debug flag, the kind of thing
+    # optimizer.py folds away
+    n = max(1, round(2000 * scale))
+    return f"""
+let width = 60 * 2;
+let height = 40 + 8;
+let area = width * height;
+let debug = false;
+
+let sum = fn(i, n, acc) {{
+    if (i == n) {{ return acc; }}
+    let step = if (debug) {{ 0 }} else {{ area / (4 * 2) - (width + height) * 3 }};
+    sum(i + 1, n, acc + step * (1 + 1));
+}};
+sum(0, {n}, 0);
+"""
+
+def big_source(scale=1.0):
+    # Lots of small, unrelated top-level definitions. Roughly 100 bytes per
+    # block, so the default is about 1MB of source.
+    blocks = max(1, round(10000 * scale))
+    lines = []
+    for i in range(blocks):
+        f, v = name("f", i), name("v", i)
+        lines.append(f"let {f} = fn(x, y) {{ if (x < y) {{ x * {i} }} else {{ y + \"s{i}\" }} }};")
+        lines.append(f"let {v} = [{i}, {i} + 1, {{\"k\": {i}}}][0];")
+    lines.append(f"{name('f', blocks - 1)}(1, 2);")
+    return "\n".join(lines)
+
+workloads = {
+    "fib": fib,
+    "map_reduce": map_reduce,
+    "hash_lookups": hash_lookups,
+    "big_hash": big_hash,
+    "closures": closures,
+    "constants": constants,
+    "big_source": big_source,
+}
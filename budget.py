@@ -0,0 +1,144 @@
+import math
+import time
+from dataclasses import dataclass
+
+import mobject as obj
+import evaluator
+from environment import Environment
+from pvector import WIDTH
+
+# Execution budgets for evaluator.Eval, for running code we don't trust. A
+# run gets an ExecutionContext, which Eval finds on the environment (see
+# Environment.context) and tells about every node it evaluates, every call
+# and every object it makes. Going over any of the limits ends the run with
+# an Error, the same way a runtime error would.
+#
+# Steps, calls and memory only depend on the program, so they come out the
+# same on every run. Memory is what the program allocated in total, going by
+# the rough sizes below, not what's alive at the end: there's no way to see
+# frees from here, and it's the allocating that costs. Wall-clock time is
+# only looked at every CLOCK_INTERVAL steps, asking the clock is slower than
+# a step.
+
+CLOCK_INTERVAL = 1024
+
+# Rough CPython sizes, in bytes
+OBJECT_SIZE = 48
+CELL_SIZE = 8
+PAIR_SIZE = 64
+
+@dataclass
+class Budget:
+    max_steps: int | None = None
+    max_memory: int | None = None
+    max_seconds: float | None = None
+
+def allocation_size(value, cells=None):
+    match value:
+        case obj.Integer(v):
+            # Small integers are shared, see mobject.new_integer
+            if obj.SMALL_INT_MIN <= v <= obj.SMALL_INT_MAX:
+                return 0
+            return OBJECT_SIZE
+        case obj.String():
+            return OBJECT_SIZE + value.length
+        case obj.Array(elements):
+            # Arrays from push and rest share all but (at most) a tail's
+            # worth of cells with the one they came from, so that's what
+            # they cost unless the caller knows better
+            if cells is None:
+                cells = min(len(elements), WIDTH)
+            return OBJECT_SIZE + CELL_SIZE * cells
+        case obj.Hash(pairs):
+            return OBJECT_SIZE + PAIR_SIZE * len(pairs)
+        case obj.Function(_, _, _):
+            return OBJECT_SIZE
+    return 0
+
+class ExecutionContext:
+    def __init__(self, budget=None):
+        self.budget = budget or Budget()
+        self.steps = 0
+        self.calls = 0
+        self.allocations = 0
+        self.memory = 0
+        self.started = time.monotonic()
+        self.error = None
+
+        # No limit is the same as a limit that can't be reached, which keeps
+        # the checks below to one comparison
+        budget = self.budget
+        self.max_steps = budget.max_steps if budget.max_steps is not None else math.inf
+        self.max_memory = budget.max_memory if budget.max_memory is not None else math.inf
+        self.deadline = self.started + budget.max_seconds if budget.max_seconds is not None else None
+        self.next_clock = CLOCK_INTERVAL
+
+    def step(self):
+        if self.error is not None:
+            return self.error
+
+        self.steps += 1
+        if self.steps > self.max_steps:
+            return self.exceeded(f"step budget exceeded: {self.budget.max_steps} steps")
+
+        if self.deadline is not None and self.steps >= self.next_clock:
+            self.next_clock += CLOCK_INTERVAL
+            if time.monotonic() > self.deadline:
+                return self.exceeded(f"time budget exceeded: {self.budget.max_seconds}s")
+
+        return None
+
+    def allocate(self, value, cells=None):
+        # Hands back the value, or the error if it didn't fit
+        size = allocation_size(value, cells)
+        if size:
+            self.allocations += 1
+            self.memory += size
+            if self.memory > self.max_memory and self.error is None:
+                return self.exceeded(f"memory budget exceeded: {self.budget.max_memory} bytes")
+        return value
+
+    def reserve(self, cells):
+        # For builtins to ask before making an array of that many new
+        # cells, so one that's too big fails without being built first.
+        # allocate still counts it once it's made.
+        if self.error is not None:
+            return self.error
+        if self.memory + OBJECT_SIZE + CELL_SIZE * cells > self.max_memory:
+            return self.exceeded(f"memory budget exceeded: {self.budget.max_memory} bytes")
+        return None
+
+    def exceeded(self, message):
+        # Every step from here on fails the same way, so whatever doesn't
+        # pass the first error along still stops at the next node
+        self.error = obj.Error(message)
+        return self.error
+
+    def counters(self):
+        return {
+            "steps": self.steps,
+            "calls": self.calls,
+            "allocations": self.allocations,
+            "memory": self.memory,
+            "seconds": time.monotonic() - self.started,
+            "exceeded": self.error.message if self.error is not None else None,
+        }
+
+def run(program, budget=None, env=None):
+    # Evaluates program within budget, giving back the result and the
+    # context with its counters
+    if env is None:
+        env = Environment()
+
+    context = ExecutionContext(budget)
+    env.globals.context = context
+    try:
+        result = evaluator.Eval(env, program)
+    except RecursionError:
+        # Monkey calls are Python calls here, so it's Python's stack that
+        # runs out first. That ends the run like any other limit.
+        result = context.exceeded("maximum recursion depth exceeded")
+    finally:
+        env.globals.context = None
+
+    return result, context
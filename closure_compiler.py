@@ -0,0 +1,376 @@
+import mast as ast
+import mobject as obj
+from mobject import typeof
+from environment import Environment, new_frame, release_frame
+from evaluator import (
+    NULL,
+    TRUE,
+    FALSE,
+    native_boolean_to_object,
+    is_truthy,
+    eval_identifier,
+    eval_prefix_expression,
+    eval_infix_expression,
+    eval_index_expression,
+)
+
+# Same language, same results as evaluator.Eval, but the tree is only matched
+# once: every node is turned into a Python closure taking an Environment,
+# with its children's closures already bound. Running a program is then just
+# calling closures, and a function body compiled once serves every call.
+
+Integer = obj.Integer
+new_integer = obj.new_integer
+Error = obj.Error
+ReturnValue = obj.ReturnValue
+Function = obj.Function
+Builtin = obj.Builtin
+HASHABLE = obj.HASHABLE
+
+def compile_node(node):
+    match node:
+        case ast.Program(statements):
+            return compile_program(statements)
+
+        case ast.ExpressionStatement(expr):
+            return compile_node(expr)
+
+        case ast.ReturnStatement(expr):
+            return compile_return(compile_node(expr))
+
+        case ast.LetStatement(identifier, expr):
+            return compile_let(identifier, compile_node(expr))
+
+        case ast.BlockStatement(statements):
+            return compile_block(statements)
+
+        case ast.IntegerLiteral(value):
+            return constant(new_integer(value))
+
+        case ast.StringLiteral(value):
+            return constant(obj.intern_string(value))
+
+        case ast.Boolean(value):
+            return constant(native_boolean_to_object(value))
+
+        case ast.Identifier(value, depth, slot, fallback):
+            return compile_identifier(value, depth, slot, fallback)
+
+        case ast.PrefixExpression(operator, right):
+            return compile_prefix(operator, compile_node(right))
+
+        case ast.InfixExpression(left, operator, right):
+            return compile_infix(operator, compile_node(left), compile_node(right))
+
+        case ast.IfExpression(condition, consequence, alternative):
+            return compile_if(
+                compile_node(condition),
+                compile_node(consequence),
+                compile_node(alternative) if alternative else None)
+
+        case ast.FunctionLiteral(parameters, body, num_locals):
+            return compile_function(parameters, body, num_locals, node.escapes)
+
+        case ast.CallExpression(function, arguments):
+            return compile_call(compile_node(function), [compile_node(a) for a in arguments])
+
+        case ast.ArrayLiteral(elements):
+            return compile_array([compile_node(e) for e in elements])
+
+        case ast.HashLiteral(pairs):
+            return compile_hash([(compile_node(k), compile_node(v)) for k, v in pairs.items()])
+
+        case ast.IndexExpression(left, index):
+            return compile_index(compile_node(left), compile_node(index))
+
+    # Eval gives back None for anything it doesn't know
+    return constant(None)
+
+def constant(value):
+    return lambda env: value
+
+def compile_program(statements):
+    fns = [compile_node(s) for s in statements]
+
+    def program(env):
+        result = None
+        for fn in fns:
+            result = fn(env)
+            if type(result) is ReturnValue:
+                return result.value
+            if type(result) is Error:
+                return result
+        return result
+
+    return program
+
+def compile_block(statements):
+    fns = [compile_node(s) for s in statements]
+
+    if len(fns) == 1:
+        return fns[0]
+
+    def block(env):
+        result = None
+        for fn in fns:
+            result = fn(env)
+            if type(result) is ReturnValue or type(result) is Error:
+                return result
+        return result
+
+    return block
+
+def compile_return(expr):
+    def return_(env):
+        value = expr(env)
+        if type(value) is Error:
+            return value
+        return ReturnValue(value)
+
+    return return_
+
+def compile_let(identifier, expr):
+    name, slot = identifier.value, identifier.slot
+
+    if slot is None:
+        def let(env):
+            value = expr(env)
+            if type(value) is Error:
+                return value
+            env.put(name, value)
+    else:
+        def let(env):
+            value = expr(env)
+            if type(value) is Error:
+                return value
+            env.slots[slot] = value
+
+    return let
+
+def compile_identifier(name, depth, slot, fallback=None):
+    # Misses go to eval_identifier for the fallback, the builtins and the
+    # error message
+    if depth == 0:
+        def identifier(env):
+            value = env.slots[slot]
+            if value is None:
+                return eval_identifier(env, name, depth, slot, fallback)
+            return value
+    elif slot is not None:
+        def identifier(env):
+            value = env.get_at(depth, slot)
+            if value is None:
+                return eval_identifier(env, name, depth, slot, fallback)
+            return value
+    elif depth == ast.GLOBAL_DEPTH:
+        def identifier(env):
+            value = env.globals.get(name)
+            if value is None:
+                return eval_identifier(env, name, depth)
+            return value
+    else:
+        def identifier(env):
+            return eval_identifier(env, name)
+
+    return identifier
+
+def compile_prefix(operator, right):
+    def prefix(env):
+        value = right(env)
+        if type(value) is Error:
+            return value
+        return eval_prefix_expression(operator, value)
+
+    return prefix
+
+# Integer fast paths, the rest goes through eval_infix_expression
+integer_operators = {
+    "+": lambda a, b: new_integer(a + b),
+    "-": lambda a, b: new_integer(a - b),
+    "*": lambda a, b: new_integer(a * b),
+    "/": lambda a, b: new_integer(a // b),
+    "<": lambda a, b: TRUE if a < b else FALSE,
+    ">": lambda a, b: TRUE if a > b else FALSE,
+    "==": lambda a, b: TRUE if a == b else FALSE,
+    "!=": lambda a, b: TRUE if a != b else FALSE,
+}
+
+def compile_infix(operator, left, right):
+    # The common operators get their own closure, so there's no operator
+    # dispatch left at all when both sides are integers.
+    if operator == "+":
+        def infix(env):
+            l = left(env)
+            if type(l) is Error:
+                return l
+            r = right(env)
+            if type(r) is Error:
+                return r
+            if type(l) is Integer and type(r) is Integer:
+                return new_integer(l.value + r.value)
+            return eval_infix_expression("+", l, r)
+    elif operator == "-":
+        def infix(env):
+            l = left(env)
+            if type(l) is Error:
+                return l
+            r = right(env)
+            if type(r) is Error:
+                return r
+            if type(l) is Integer and type(r) is Integer:
+                return new_integer(l.value - r.value)
+            return eval_infix_expression("-", l, r)
+    elif operator == "<":
+        def infix(env):
+            l = left(env)
+            if type(l) is Error:
+                return l
+            r = right(env)
+            if type(r) is Error:
+                return r
+            if type(l) is Integer and type(r) is Integer:
+                return TRUE if l.value < r.value else FALSE
+            return eval_infix_expression("<", l, r)
+    elif operator == "==":
+        def infix(env):
+            l = left(env)
+            if type(l) is Error:
+                return l
+            r = right(env)
+            if type(r) is Error:
+                return r
+            if type(l) is Integer and type(r) is Integer:
+                return TRUE if l.value == r.value else FALSE
+            return eval_infix_expression("==", l, r)
+    else:
+        op = integer_operators.get(operator)
+
+        def infix(env):
+            l = left(env)
+            if type(l) is Error:
+                return l
+            r = right(env)
+            if type(r) is Error:
+                return r
+            if op is not None and type(l) is Integer and type(r) is Integer:
+                return op(l.value, r.value)
+            return eval_infix_expression(operator, l, r)
+
+    return infix
+
+def compile_if(condition, consequence, alternative):
+    def if_(env):
+        cond = condition(env)
+        if type(cond) is Error:
+            return cond
+
+        if cond is TRUE or (cond is not FALSE and is_truthy(cond)):
+            return consequence(env)
+        elif alternative is not None:
+            return alternative(env)
+        else:
+            return NULL
+
+    return if_
+
+def compile_function(parameters, body, num_locals, escapes):
+    compiled = compile_node(body)
+
+    def function(env):
+        fn = Function(parameters, body, env, num_locals, escapes=escapes)
+        fn.compiled = compiled
+        return fn
+
+    return function
+
+def compile_call(function, arguments):
+    def call(env):
+        fn = function(env)
+        if type(fn) is Error:
+            return fn
+
+        args = []
+        for a in arguments:
+            value = a(env)
+            if type(value) is Error:
+                return value
+            args.append(value)
+
+        return apply_function(fn, args)
+
+    return call
+
+def apply_function(fn, args):
+    if type(fn) is Function:
+        body = fn.compiled
+        if body is None:
+            # Made by the tree-walker (say, in an earlier REPL line)
+            body = fn.compiled = compile_node(fn.body)
+
+        # Pooled frames, as in evaluator.extend_function_env
+        escapes = fn.escapes
+        env = Environment(outer=fn.env, size=fn.num_locals) if escapes else new_frame(fn.env, fn.num_locals)
+        for param, arg in zip(fn.parameters, args):
+            if param.slot is None:
+                env.put(param.value, arg)
+            else:
+                env.slots[param.slot] = arg
+
+        result = body(env)
+        if not escapes:
+            release_frame(env)
+        if type(result) is ReturnValue:
+            return result.value
+        return result
+
+    if type(fn) is Builtin:
+        return fn.fn(*args)
+
+    return obj.Error(f"not a function: {typeof(fn)}")
+
+def compile_array(elements):
+    def array(env):
+        values = []
+        for e in elements:
+            value = e(env)
+            if type(value) is Error:
+                return value
+            values.append(value)
+        return obj.Array(values)
+
+    return array
+
+def compile_hash(pairs):
+    def hash_(env):
+        result = {}
+        for key_fn, value_fn in pairs:
+            key = key_fn(env)
+            if type(key) is Error:
+                return key
+
+            if type(key) not in HASHABLE:
+                return obj.Error(f"unusable as a hash key: {typeof(key)}")
+
+            value = value_fn(env)
+            if type(value) is Error:
+                return value
+
+            result[key] = value
+        return obj.Hash(result)
+
+    return hash_
+
+def compile_index(left, index):
+    def index_(env):
+        l = left(env)
+        if type(l) is Error:
+            return l
+        i = index(env)
+        if type(i) is Error:
+            return i
+        return eval_index_expression(l, i)
+
+    return index_
+
+def evaluate(env, program):
+    return compile_node(program)(env)
@@ -0,0 +1,333 @@
+from dataclasses import dataclass, field
+
+import mast as ast
+import mobject as obj
+import evaluator  # Import before mbuiltins, they're circular
+from mbuiltins import builtinfns
+from mcode import Opcode, make
+from symbol_table import (
+    SymbolTable,
+    GLOBAL_SCOPE,
+    LOCAL_SCOPE,
+    BUILTIN_SCOPE,
+    FREE_SCOPE,
+    FUNCTION_SCOPE,
+)
+
+# Constant indexes are two-byte operands
+MAX_CONSTANTS = 0xFFFF
+
+infix_opcodes = {
+    "+": Opcode.ADD,
+    "-": Opcode.SUB,
+    "*": Opcode.MUL,
+    "/": Opcode.DIV,
+    "==": Opcode.EQUAL,
+    "!=": Opcode.NOT_EQUAL,
+    ">": Opcode.GREATER_THAN,
+    "<": Opcode.LESS_THAN,
+}
+
+prefix_opcodes = {
+    "-": Opcode.MINUS,
+    "!": Opcode.BANG,
+}
+
+class CompileError(Exception):
+    pass
+
+@dataclass
+class EmittedInstruction:
+    opcode: Opcode = None
+    position: int = 0
+
+@dataclass
+class CompilationScope:
+    instructions: bytearray = field(default_factory=bytearray)
+    last_instruction: EmittedInstruction = field(default_factory=EmittedInstruction)
+    previous_instruction: EmittedInstruction = field(default_factory=EmittedInstruction)
+    # How many if branches deep we are, lets in there might not run
+    branches: int = 0
+
+@dataclass
+class Bytecode:
+    instructions: bytes
+    constants: list[obj.Object]
+    # By global index, for error messages
+    global_names: list[str] = field(default_factory=list)
+
+def new_symbol_table():
+    table = SymbolTable()
+    for i, name in enumerate(builtinfns):
+        table.define_builtin(i, name)
+    return table
+
+class Compiler:
+    # Pass the previous symbol table and constants along to keep state
+    # between runs, like the REPL does.
+    def __init__(self, symbol_table=None, constants=None):
+        self.constants = constants if constants is not None else []
+        self.symbol_table = symbol_table or new_symbol_table()
+        self.scopes = [CompilationScope()]
+
+    @property
+    def scope(self):
+        return self.scopes[-1]
+
+    def bytecode(self):
+        names = [None] * self.symbol_table.num_definitions
+        for symbol in self.symbol_table.store.values():
+            if symbol.scope == GLOBAL_SCOPE:
+                names[symbol.index] = symbol.name
+        return Bytecode(bytes(self.scope.instructions), self.constants, names)
+
+    def compile(self, node):
+        match node:
+            case ast.Program(statements):
+                # Top-level lets are hoisted, so functions can refer to globals
+                # defined further down (mutual recursion, mostly).
+                for name in top_level_names(statements):
+                    self.symbol_table.define(name)
+
+                for s in statements:
+                    self.compile(s)
+
+            case ast.ExpressionStatement(expr):
+                self.compile(expr)
+                self.emit(Opcode.POP)
+
+            case ast.BlockStatement(statements):
+                for s in statements:
+                    self.compile(s)
+
+            case ast.LetStatement(identifier, expr):
+                if isinstance(expr, ast.FunctionLiteral):
+                    self.compile_function(expr, identifier.value)
+                else:
+                    self.compile(expr)
+
+                table = self.symbol_table
+                previous = table.store.get(identifier.value)
+                symbol = table.define(identifier.value)
+                if symbol.scope == GLOBAL_SCOPE:
+                    self.emit(Opcode.SET_GLOBAL, symbol.index)
+                else:
+                    self.emit(Opcode.SET_LOCAL, symbol.index)
+                    if not self.scope.branches:
+                        table.unset.discard(symbol.name)
+                    elif previous is None or previous.scope != LOCAL_SCOPE:
+                        table.unset.add(symbol.name)
+
+            case ast.ReturnStatement(expr):
+                self.compile(expr)
+                self.emit(Opcode.RETURN_VALUE)
+
+            case ast.Identifier(value):
+                symbol = self.symbol_table.resolve(value)
+                if symbol is None:
+                    raise CompileError(f"identifier not found: {value}")
+                self.load_symbol(symbol)
+
+            case ast.IntegerLiteral(value):
+                self.emit(Opcode.CONSTANT, self.add_constant(obj.new_integer(value)))
+
+            case ast.StringLiteral(value):
+                self.emit(Opcode.CONSTANT, self.add_constant(obj.intern_string(value)))
+
+            case ast.Boolean(value):
+                self.emit(Opcode.TRUE if value else Opcode.FALSE)
+
+            case ast.PrefixExpression(operator, right):
+                self.compile(right)
+                opcode = prefix_opcodes.get(operator)
+                if opcode is None:
+                    raise CompileError(f"unknown operator: {operator}")
+                self.emit(opcode)
+
+            case ast.InfixExpression(left, operator, right):
+                self.compile(left)
+                self.compile(right)
+                opcode = infix_opcodes.get(operator)
+                if opcode is None:
+                    raise CompileError(f"unknown operator: {operator}")
+                self.emit(opcode)
+
+            case ast.IfExpression(condition, consequence, alternative):
+                self.compile(condition)
+                jump_not_truthy = self.emit(Opcode.JUMP_NOT_TRUTHY, 9999)
+
+                self.compile_branch(consequence)
+                jump = self.emit(Opcode.JUMP, 9999)
+                self.change_operand(jump_not_truthy, len(self.scope.instructions))
+
+                if alternative is None:
+                    self.emit(Opcode.NULL)
+                else:
+                    self.compile_branch(alternative)
+                self.change_operand(jump, len(self.scope.instructions))
+
+            case ast.FunctionLiteral(_, _):
+                self.compile_function(node)
+
+            case ast.CallExpression(function, arguments):
+                self.compile(function)
+                for arg in arguments:
+                    self.compile(arg)
+                self.emit(Opcode.CALL, len(arguments))
+
+            case ast.ArrayLiteral(elements):
+                for e in elements:
+                    self.compile(e)
+                self.emit(Opcode.ARRAY, len(elements))
+
+            case ast.HashLiteral(pairs):
+                for k, v in pairs.items():
+                    self.compile(k)
+                    self.compile(v)
+                self.emit(Opcode.HASH, 2 * len(pairs))
+
+            case ast.IndexExpression(left, index):
+                self.compile(left)
+                self.compile(index)
+                self.emit(Opcode.INDEX)
+
+            case _:
+                raise CompileError(f"cannot compile {node!r}")
+
+    def compile_branch(self, block):
+        # Branches are expressions, so they need to leave exactly one value
+        # behind. The evaluator gives back nothing for a block that ends with
+        # `let` (or is empty); null is the closest thing we have.
+        self.scope.branches += 1
+        self.compile(block)
+        self.scope.branches -= 1
+        if self.last_instruction_is(Opcode.POP):
+            self.remove_last_pop()
+        else:
+            self.emit(Opcode.NULL)
+
+    def compile_function(self, node, name=None):
+        self.enter_scope()
+
+        if name is not None:
+            self.symbol_table.define_function_name(name)
+
+        for param in node.parameters:
+            self.symbol_table.define(param.value)
+
+        try:
+            self.compile(node.body)
+        except CompileError:
+            # Back out to the enclosing scope, the REPL keeps using this
+            # compiler's symbol table after an error
+            self.leave_scope()
+            raise
+
+        if self.last_instruction_is(Opcode.POP):
+            self.replace_last_pop_with_return()
+        if not self.last_instruction_is(Opcode.RETURN_VALUE):
+            self.emit(Opcode.RETURN)
+
+        free_symbols = self.symbol_table.free_symbols
+        num_locals = self.symbol_table.num_definitions
+        instructions = self.leave_scope()
+
+        for symbol in free_symbols:
+            self.load_symbol(symbol)
+
+        fn = obj.CompiledFunction(instructions, num_locals, len(node.parameters))
+        self.emit(Opcode.CLOSURE, self.add_constant(fn), len(free_symbols))
+
+    def load_symbol(self, symbol):
+        match symbol.scope:
+            case "GLOBAL":
+                self.emit(Opcode.GET_GLOBAL, symbol.index)
+            case "LOCAL":
+                fallback = None
+                if symbol.name in self.symbol_table.unset:
+                    fallback = self.symbol_table.outer.resolve(symbol.name)
+                if fallback is None:
+                    self.emit(Opcode.GET_LOCAL, symbol.index)
+                    return
+
+                # The let for it is in an if that might not have run, in
+                # which case the name means whatever it does outside
+                position = self.emit(Opcode.GET_LOCAL_OR, symbol.index, 9999)
+                self.load_symbol(fallback)
+                end = len(self.scope.instructions)
+                self.replace_instruction(position, make(Opcode.GET_LOCAL_OR, symbol.index, end))
+            case "BUILTIN":
+                self.emit(Opcode.GET_BUILTIN, symbol.index)
+            case "FREE":
+                self.emit(Opcode.GET_FREE, symbol.index)
+            case "FUNCTION":
+                self.emit(Opcode.CURRENT_CLOSURE)
+
+    def add_constant(self, value):
+        if len(self.constants) > MAX_CONSTANTS:
+            raise CompileError(f"too many constants, the limit is {MAX_CONSTANTS + 1}")
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+    def emit(self, op, *operands):
+        scope = self.scope
+        position = len(scope.instructions)
+        try:
+            scope.instructions += make(op, *operands)
+        except OverflowError:
+            raise CompileError(f"operand out of range for {op.name}: {operands}")
+
+        scope.previous_instruction = scope.last_instruction
+        scope.last_instruction = EmittedInstruction(op, position)
+        return position
+
+    def last_instruction_is(self, op):
+        if len(self.scope.instructions) == 0:
+            return False
+        return self.scope.last_instruction.opcode == op
+
+    def remove_last_pop(self):
+        scope = self.scope
+        del scope.instructions[scope.last_instruction.position:]
+        scope.last_instruction = scope.previous_instruction
+
+    def replace_instruction(self, position, instruction):
+        self.scope.instructions[position : position + len(instruction)] = instruction
+
+    def replace_last_pop_with_return(self):
+        position = self.scope.last_instruction.position
+        self.replace_instruction(position, make(Opcode.RETURN_VALUE))
+        self.scope.last_instruction.opcode = Opcode.RETURN_VALUE
+
+    def change_operand(self, position, operand):
+        op = Opcode(self.scope.instructions[position])
+        try:
+            self.replace_instruction(position, make(op, operand))
+        except OverflowError:
+            raise CompileError(f"operand out of range for {op.name}: {operand}")
+
+    def enter_scope(self):
+        self.scopes.append(CompilationScope())
+        self.symbol_table = SymbolTable(self.symbol_table)
+
+    def leave_scope(self):
+        instructions = self.scopes.pop().instructions
+        self.symbol_table = self.symbol_table.outer
+        return bytes(instructions)
+
+def top_level_names(statements):
+    # Blocks don't open a new scope, so lets inside top-level ifs count too.
+    # Function bodies do, so don't look in there.
+    for s in statements:
+        match s:
+            case ast.LetStatement(identifier, _):
+                yield identifier.value
+            case ast.ExpressionStatement(ast.IfExpression(_, consequence, alternative)):
+                yield from top_level_names(consequence.statements)
+                if alternative is not None:
+                    yield from top_level_names(alternative.statements)
+
+def compile(program, symbol_table=None, constants=None):
+    compiler = Compiler(symbol_table, constants)
+    compiler.compile(program)
+    return compiler.bytecode()
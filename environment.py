@@ -1,24 +1,108 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from types import MappingProxyType
 
 import mobject as obj
 
+NO_STORE = MappingProxyType({})
+
 @dataclass
 class Environment:
     store: dict[str, obj.Object]
     outer: Environment
+    slots: list[obj.Object]
+
+    # A frame is made on every call (or taken from the pool, see new_frame),
+    # slots make that and every lookup in it cheaper
+    __slots__ = ("store", "outer", "slots", "globals", "version", "caches", "context")
 
-    def __init__(self, store=None, outer=None):
-        self.store = store or dict()
+    # Environments come in two flavours. Without a size, it's a name-based
+    # scope like the global one. With a size, it's a function call frame
+    # whose bindings live in `slots`, indexed the way the resolver said.
+    def __init__(self, store=None, outer=None, size=None):
         self.outer = outer
+        # Bumped by every put(), so anything that remembered a lookup (the
+        # evaluator's inline caches, kept in the global environment's
+        # `caches`) can tell it may have gone stale. Only name-based
+        # environments ever see a put(), and frames of functions that
+        # weren't resolved.
+        self.version = 0
+        if size is None or outer is None:
+            self.store = store or dict()
+            self.slots = [None] * size if size else []
+            self.globals = self
+            self.caches = {}
+
+            # The budget.ExecutionContext of the run going on, if it has
+            # one. Set on the global environment, and picked up from there
+            # by every call frame, so a closure that outlives a run doesn't
+            # drag that run's budget into the next one.
+            self.context = None
+        else:
+            # A frame only gets a store of its own if something puts into
+            # it, which a resolved function never does
+            self.store = store or NO_STORE
+            self.slots = [None] * size
+            self.globals = globals = outer.globals
+            self.context = globals.context
 
     def get(self, key):
         value = self.store.get(key)
-        if not value and self.outer:
+        if value is None and self.outer:
             value = self.outer.get(key)
         
         return value
     
     def put(self, key, value):
+        if self.store is NO_STORE:
+            self.store = {}
         self.store[key] = value
-        return value
\ No newline at end of file
+        self.version += 1
+        return value
+
+    def get_at(self, depth, slot):
+        env = self
+        for _ in range(depth):
+            env = env.outer
+        return env.slots[slot]
+
+    def put_at(self, slot, value):
+        self.slots[slot] = value
+        return value
+
+# Frames of calls that are over, by size, to be used again by the next call
+# that needs one that size. Only for functions whose frames can't outlive
+# their calls, the ones that don't make functions of their own (see
+# mast.FunctionLiteral.escapes): nothing else keeps hold of a frame. Saves
+# making an Environment, with its slots list, on every call.
+MAX_POOLED_FRAMES = 64
+frame_pool = {}
+# Tuples of Nones to clear slots with, by size
+nones = {}
+
+def new_frame(outer, size):
+    frames = frame_pool.get(size)
+    if frames:
+        env = frames.pop()
+        env.outer = outer
+        env.globals = globals = outer.globals
+        env.context = globals.context
+        return env
+    return Environment(outer=outer, size=size)
+
+def release_frame(env):
+    # Hands env back for new_frame, once the call it was made for is done
+    # with it and nothing else can have it
+    if env.store is not NO_STORE:
+        return
+    slots = env.slots
+    size = len(slots)
+    frames = frame_pool.get(size)
+    if frames is None:
+        frames = frame_pool[size] = []
+        nones[size] = (None,) * size
+    if len(frames) < MAX_POOLED_FRAMES:
+        # Nothing the call had is kept alive by the pool
+        slots[:] = nones[size]
+        env.outer = env.globals = env.context = None
+        frames.append(env)
@@ -1,14 +1,25 @@
+from dataclasses import dataclass
+import typing
+
 import mast as ast
 import mobject as obj
 from mobject import inspect, typeof
-from environment import Environment
-from mbuiltins import builtinfns
+from environment import Environment, new_frame, release_frame
+from mbuiltins import builtinfns, FRESH_ARRAYS, TAKES_CONTEXT
 
 NULL = obj.Null()
 TRUE = obj.Boolean(True)
 FALSE = obj.Boolean(False)
 
 def Eval(env, node):
+    # Only set for runs with a budget (see budget.py), everything else
+    # pays for this one check
+    context = env.context
+    if context is not None:
+        error = context.step()
+        if error is not None:
+            return error
+
     match node:
         case ast.Program(statements):
             return eval_program(env, statements)
@@ -24,27 +35,30 @@ def Eval(env, node):
             return Eval(env, expr)
 
         case ast.IntegerLiteral(value):
-            return obj.Integer(value)
+            return obj.new_integer(value)
 
         case ast.StringLiteral(value):
-            return obj.String(value)
+            return obj.intern_string(value)
 
         case ast.Boolean(value):
             return native_boolean_to_object(value)
 
-        case ast.FunctionLiteral(parameters, body):
-            return obj.Function(parameters, body, env)
+        case ast.FunctionLiteral(parameters, body, num_locals):
+            fn = obj.Function(parameters, body, env, num_locals, escapes=node.escapes)
+            return context.allocate(fn) if context is not None else fn
 
         case ast.ArrayLiteral(elements):
             ele = eval_expressions(env, elements)
 
-            if len(ele) == 1 and is_error(elements[0]):
-                return elements[0]
+            if len(ele) == 1 and is_error(ele[0]):
+                return ele[0]
             
-            return obj.Array(ele)
+            array = obj.Array(ele)
+            return context.allocate(array, len(ele)) if context is not None else array
         
         case ast.HashLiteral(_):
-            return eval_hash_literal(env, node)
+            result = eval_hash_literal(env, node)
+            return context.allocate(result) if context is not None else result
         
         case ast.IndexExpression(left, index):
             eval_left = Eval(env, left)
@@ -57,23 +71,16 @@ def Eval(env, node):
             
             return eval_index_expression(eval_left, eval_index)
         
-        case ast.CallExpression(function, arguments):
-            fn = Eval(env, function)
-            if is_error(fn):
-                return fn
-            
-            args = eval_expressions(env, arguments)
-            if len(args) == 1 and is_error(args[0]):
-                return args[0]
-
-            return apply_function(fn, args)
+        case ast.CallExpression(_, _):
+            return eval_call_expression(env, node)
 
         case ast.PrefixExpression(operator, right):
             eval_right = Eval(env, right)
             if is_error(eval_right):
                 return eval_right
 
-            return eval_prefix_expression(operator, eval_right)
+            result = eval_prefix_expression(operator, eval_right)
+            return context.allocate(result) if context is not None else result
 
         case ast.InfixExpression(left, operator, right):
             eval_left = Eval(env, left)
@@ -84,7 +91,8 @@ def Eval(env, node):
             if is_error(eval_right):
                 return eval_right
 
-            return eval_infix_expression(operator, eval_left, eval_right)
+            result = eval_infix_expression(operator, eval_left, eval_right)
+            return context.allocate(result) if context is not None else result
 
         case ast.BlockStatement(statements):
             return eval_block_statement(env, statements)
@@ -97,13 +105,101 @@ def Eval(env, node):
             if is_error(eval_expr):
                     return eval_expr
 
-            env.put(identifier.value, eval_expr)
+            if identifier.slot is None:
+                env.put(identifier.value, eval_expr)
+            else:
+                env.put_at(identifier.slot, eval_expr)
         
-        case ast.Identifier(value):
-            return eval_identifier(env, value)
+        case ast.Identifier(value, depth, slot, fallback):
+            return eval_identifier(env, value, depth, slot, fallback)
     
     return None
 
+# Inline caches for call sites that call a global (or builtin) by name,
+# which is nearly all of them. With a cache hit the callee comes straight
+# from the cache, without going through Eval's match (Identifier is its last
+# case) and eval_identifier, and the kind of callee it is comes along too.
+#
+# The caches live on the global Environment, keyed by the id() of the
+# CallExpression (mast nodes are frozen, so there's nowhere on the node to
+# put it). The entry keeps the node alive, so its id can't be reused while
+# it's there, and a hit checks the node is the same one anyway. An entry is
+# good as long as no global has been bound since it was made, the
+# environment's version says when that happens.
+#
+# A REPL or a long-lived environment keeps parsing new programs, so there
+# are at most MAX_INLINE_CACHES entries. Going over drops all of them, the
+# call sites that are still running fill it up again soon enough.
+
+MAX_INLINE_CACHES = 4096
+
+@dataclass(slots=True)
+class InlineCache:
+    node: typing.Any
+    version: int
+    value: typing.Any
+    kind: type
+
+inline_cache_stats = {"hits": 0, "misses": 0, "deopts": 0}
+
+def reset_inline_cache_stats():
+    for key in inline_cache_stats:
+        inline_cache_stats[key] = 0
+
+def eval_call_expression(env, node):
+    function = node.function
+    if type(function) is ast.Identifier and function.depth == ast.GLOBAL_DEPTH:
+        globals = env.globals
+        caches = globals.caches
+        cache = caches.get(id(node))
+        if cache is not None and cache.version == globals.version and cache.node is node:
+            inline_cache_stats["hits"] += 1
+        else:
+            if cache is not None:
+                inline_cache_stats["deopts"] += 1
+            inline_cache_stats["misses"] += 1
+
+            fn = eval_identifier(env, function.value, function.depth, function.slot)
+            if is_error(fn):
+                return fn
+            if len(caches) >= MAX_INLINE_CACHES:
+                caches.clear()
+            cache = InlineCache(node, globals.version, fn, type(fn))
+            caches[id(node)] = cache
+
+        fn, kind = cache.value, cache.kind
+    else:
+        fn = Eval(env, function)
+        if is_error(fn):
+            return fn
+        kind = type(fn)
+
+    args = eval_expressions(env, node.arguments)
+    if len(args) == 1 and is_error(args[0]):
+        return args[0]
+
+    context = env.context
+    if context is not None:
+        context.calls += 1
+
+    if kind is obj.Function:
+        frame = extend_function_env(fn, args)
+        evaluated = Eval(frame, fn.body)
+        if not fn.escapes:
+            release_frame(frame)
+        return unwrap_return_value(evaluated)
+    if kind is obj.Builtin:
+        if context is None:
+            return fn.fn(*args)
+        if fn.fn in TAKES_CONTEXT:
+            result = fn.fn(*args, context=context)
+        else:
+            result = fn.fn(*args)
+        if fn.fn in FRESH_ARRAYS and isinstance(result, obj.Array):
+            return context.allocate(result, len(result.elements))
+        return context.allocate(result)
+    return obj.Error(f"not a function: {typeof(fn)}")
+
 def eval_program(env, statements):
     for s in statements:
         result = Eval(env, s)
@@ -134,10 +230,18 @@ def eval_expressions(env, exprs):
     return result
 
 def apply_function(function, arguments):
+    # For builtins that call back into Monkey
     match function:
+        case obj.Function(_, _, _) if function.compiled is not None:
+            # Made by the closure compiler, which runs it faster. Imported
+            # here since it imports us.
+            import closure_compiler
+            return closure_compiler.apply_function(function, arguments)
         case obj.Function(_, body, _):
             extended_env = extend_function_env(function, arguments)
             evaluated = Eval(extended_env, body)
+            if not function.escapes:
+                release_frame(extended_env)
             return unwrap_return_value(evaluated)
         case obj.Builtin(fn):
             return fn(*arguments)
@@ -145,9 +249,17 @@ def apply_function(function, arguments):
             return obj.Error(f"not a function: {typeof(function)}")
 
 def extend_function_env(fn, args):
-    env = Environment(outer=fn.env)
+    # A frame from the pool if nothing can keep hold of it, the caller
+    # hands it back with release_frame when the call's done
+    if fn.escapes:
+        env = Environment(outer=fn.env, size=fn.num_locals)
+    else:
+        env = new_frame(fn.env, fn.num_locals)
     for i, param in enumerate(fn.parameters):
-        env.put(param.value, args[i])
+        if param.slot is None:
+            env.put(param.value, args[i])
+        else:
+            env.put_at(param.slot, args[i])
     
     return env
 
@@ -158,13 +270,26 @@ def unwrap_return_value(ret):
         case _:
             return ret
     
-def eval_identifier(env, key):
-    value = env.get(key)
-    if value:
+def eval_identifier(env, key, depth=None, slot=None, fallback=None):
+    if depth == 0:
+        value = env.slots[slot]
+    elif slot is not None:
+        value = env.get_at(depth, slot)
+    elif depth == ast.GLOBAL_DEPTH:
+        value = env.globals.get(key)
+    else:
+        # Not resolved, so do it the slow way
+        value = env.get(key)
+
+    if value is not None:
         return value
+
+    if fallback is not None:
+        # An empty slot, the let for it hasn't run
+        return eval_identifier(env, key, fallback.depth, fallback.slot, fallback.fallback)
     
     builtin = builtinfns.get(key)
-    if builtin:
+    if builtin is not None:
         return builtin
 
     return obj.Error(f"identifier not found: {key}")
@@ -182,7 +307,7 @@ def eval_infix_expression(operator, left, right):
     match (operator, left, right):
         case (_, obj.Integer(_), obj.Integer(_)):
             return eval_integer_infix_expression(operator, left, right)
-        case (_, obj.String(_), obj.String(_)):
+        case (_, obj.String(), obj.String()):
             return eval_string_infix_expression(operator, left, right)
         case (_, left, right) if typeof(left) != typeof(right):
             return obj.Error(f"type mismatch: {typeof(left)} {operator} {typeof(right)}")
@@ -207,7 +332,7 @@ def eval_bang_operator_expression(right):
 def eval_minus_prefix_operator_expression(right):
     match right:
         case obj.Integer(value):
-            return obj.Integer(-value)
+            return obj.new_integer(-value)
         case _:
             return obj.Error(f"unknown operator: -{typeof(right)}")
 
@@ -215,13 +340,13 @@ def eval_integer_infix_expression(operator, left, right):
     leftval, rightval = left.value, right.value
     match operator:
         case "+":
-            return obj.Integer(leftval + rightval)
+            return obj.new_integer(leftval + rightval)
         case "-":
-            return obj.Integer(leftval - rightval)
+            return obj.new_integer(leftval - rightval)
         case "*":
-            return obj.Integer(leftval * rightval)
+            return obj.new_integer(leftval * rightval)
         case "/":
-            return obj.Integer(leftval // rightval)
+            return obj.new_integer(leftval // rightval)
         case "<":
             return native_boolean_to_object(leftval < rightval)
         case ">":
@@ -237,9 +362,7 @@ def eval_string_infix_expression(operator, left, right):
     if operator != "+":
         return obj.Error(f"unknown operator: {typeof(left)} {operator} {typeof(right)}")
     
-    leftval = left.value
-    rightval = right.value
-    return obj.String(leftval + rightval)
+    return obj.concat(left, right)
 
 def eval_if_expression(env, condition, consequence, alternative):
     cond = Eval(env, condition)
@@ -270,15 +393,10 @@ def eval_array_index_expression(left, index):
     return left.elements[index.value]
 
 def eval_hash_index_expression(left, index):
-    key = obj.hash_key(index)
-    if not key:
+    if type(index) not in obj.HASHABLE:
         return obj.Error(f"unusable as hash key: {typeof(index)}")
-    
-    pair = left.pairs.get(key, NULL)
-    if pair == NULL:
-        return NULL
-        
-    return pair.value
+
+    return left.pairs.get(index, NULL)
 
 def eval_hash_literal(env, node):
     pairs = dict()
@@ -287,15 +405,14 @@ def eval_hash_literal(env, node):
         if is_error(key):
             return key
         
-        hashkey = obj.hash_key(key)
-        if not hashkey:
+        if type(key) not in obj.HASHABLE:
             return obj.Error(f"unusable as a hash key: {typeof(key)}")
         
         value = Eval(env, valuenode)
         if is_error(value):
             return value
         
-        pairs[hashkey] = obj.HashPair(key, value)
+        pairs[key] = value
     
     return obj.Hash(pairs)
 
@@ -0,0 +1,398 @@
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from itertools import accumulate, compress
+
+import mast as ast
+from lexer import lexers
+from parser import Parser, ParseError
+from resolver import Resolver
+from tok import TokenType
+
+# Parsing as a document gets edited, for editors that want a fresh tree (or
+# the errors) after every keystroke. A Document remembers where each of its
+# top-level statements is in the source, and what the parser looked at to
+# parse it. An edit only re-lexes and re-parses from the first statement it
+# could have changed, up to the first statement after it that starts where
+# it did before. Everything else is kept as it was, the very same nodes.
+#
+#   doc = Document(source)
+#   doc.edit(120, 125, "total")   # replace source[120:125]
+#   doc.program, doc.errors
+#
+# What a document gives back is what parse() (on_error "recover" or
+# "continue") would give for the whole text, positions included.
+#
+# A statement's parse depends on its own tokens, plus the one after it the
+# parser peeked at, plus the character after that which the lexer read to
+# find where it ended. That last offset is the statement's `stop`, and an
+# edit that starts after it can't change the statement. Stops only go up
+# from one statement to the next, so the first one an edit touches is a
+# bisect away.
+#
+# Offsets after the last edit are kept counting back from the end of the
+# source (and lines back from the last line), which an edit before them
+# doesn't change. So an edit costs what it re-parses plus the distance from
+# the one before it, not the length of the document. The source itself is
+# kept in pieces (see Text) for the same reason. The exception is positions
+# in the tree: an edit that adds or removes lines moves every statement
+# after it, and those get copied with their new lines the next time the
+# program is asked for.
+
+# Characters per piece of a Text
+TEXT_CHUNK = 4096
+
+@dataclass(slots=True)
+class Segment:
+    start: int   # offset of the statement's first token
+    stop: int    # offset of the last character parsing it looked at
+    line: int    # line and column of its first token
+    column: int
+    # Line the statement was at when it was parsed, its node and errors
+    # still have those positions
+    parsed_line: int
+
+def segment_stop(segment):
+    return segment.stop
+
+class Text:
+    """A str kept in pieces of about TEXT_CHUNK characters, so replacing
+    part of it only copies the pieces that part is in."""
+    def __init__(self, text=""):
+        self.chunks = split(text)
+        self.length = len(text)
+        self.ends = None  # offset each chunk ends at, worked out as needed
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return "".join(self.chunks)
+
+    def locate(self, offset):
+        # Index of the chunk offset is in (the last one for the very end),
+        # and the offset it starts at
+        if self.ends is None:
+            self.ends = list(accumulate(map(len, self.chunks)))
+        i = min(bisect_right(self.ends, offset), len(self.chunks) - 1)
+        return i, self.ends[i] - len(self.chunks[i])
+
+    def slice(self, start, end):
+        if start >= end:
+            return ""
+        i, offset = self.locate(start)
+        j, _ = self.locate(end - 1)
+        return "".join(self.chunks[i : j + 1])[start - offset : end - offset]
+
+    def replace(self, start, end, text):
+        if not self.chunks:
+            self.__init__(text)
+            return
+
+        i, first = self.locate(start)
+        j, last = self.locate(end)
+        merged = self.chunks[i][: start - first] + text + self.chunks[j][end - last :]
+        self.chunks[i : j + 1] = split(merged)
+        self.length += len(text) - (end - start)
+        self.ends = None
+
+    def find(self, sub, start):
+        # Like str.find, for a sub that can't be split between chunks (a
+        # single character)
+        if start >= self.length:
+            return -1
+        i, offset = self.locate(start)
+        start -= offset
+        for chunk in self.chunks[i:]:
+            found = chunk.find(sub, start)
+            if found >= 0:
+                return offset + found
+            offset += len(chunk)
+            start = 0
+        return -1
+
+    def reader(self, start):
+        # A file-like object over the text from start on, for Lexer to read
+        # a chunk at a time
+        return TextReader(self, start)
+
+class TextReader:
+    def __init__(self, text, start):
+        if text.chunks:
+            i, offset = text.locate(start)
+            self.chunks = iter(text.chunks[i:])
+            self.skip = start - offset
+        else:
+            self.chunks = iter(())
+            self.skip = 0
+
+    def read(self, size=-1):
+        chunk = next(self.chunks, "")
+        if self.skip:
+            chunk, self.skip = chunk[self.skip :], 0
+        return chunk
+
+def split(text):
+    if len(text) <= 2 * TEXT_CHUNK:
+        return [text] if text else []
+    return [text[i : i + TEXT_CHUNK] for i in range(0, len(text), TEXT_CHUNK)]
+
+class Relexer:
+    """Tokens of a Text from offset start on, which is at line and column,
+    with the positions lexing all of it would have given them."""
+    def __init__(self, text, start, line, column, backend="char"):
+        self.text = text
+        self.start = start
+        self.line = line
+        self.column = column
+        self.lexer = lexers[backend](text.reader(start))
+        # Offset of the start of each line from `line` on, as far as
+        # tokens have got
+        self.line_starts = [start - column + 1]
+
+    def next_token(self):
+        token = self.lexer.next_token()
+        if token.line == 1:
+            token.column += self.column - 1
+        token.line += self.line - 1
+        return token
+
+    def offset(self, token):
+        i = token.line - self.line
+        line_starts = self.line_starts
+        while i >= len(line_starts):
+            newline = self.text.find("\n", max(line_starts[-1], self.start))
+            line_starts.append(newline + 1)
+        return line_starts[i] + token.column - 1
+
+    def end(self, token):
+        # Just past the token. Strings lose their quotes when they're lexed,
+        # an unterminated one is counted as if it had both, which only errs
+        # on the side of re-parsing more.
+        end = self.offset(token) + len(token.text)
+        if token.type is TokenType.STRING:
+            end += 2
+        return end
+
+class Document:
+    def __init__(self, source="", backend="char", iterative=False, on_error="recover"):
+        if on_error == "raise":
+            raise ValueError("a document has to hold on to broken source, on_error can't be 'raise'")
+
+        self.backend = backend
+        self.iterative = iterative
+        self.on_error = on_error
+        self.text = Text()
+        self.line_count = 1
+
+        # One segment per top-level statement (including ones that didn't
+        # parse), and in step with them the resolved statement (None if it
+        # didn't parse) and its errors (None if there weren't any)
+        self.segments = []
+        self.nodes = []
+        self.failures = []
+        # Statements that didn't parse, the Nones in self.nodes
+        self.holes = 0
+        # Segments from here on count back from the end of the source
+        self.gap = 0
+        # Segments from here on may have nodes at the wrong lines
+        self.stale = None
+        # Statements parsed by the last edit
+        self.reparsed = 0
+
+        self.edit(0, 0, source)
+
+    @property
+    def source(self):
+        return str(self.text)
+
+    def edit(self, start, end, text):
+        # Replaces source[start:end] with text
+        source = self.text
+        if not 0 <= start <= end <= len(source):
+            raise ValueError(f"can't replace {start}:{end} of a document {len(source)} long")
+
+        segments = self.segments
+        old_length = len(source)
+        old_lines = self.line_count
+
+        # First statement the edit could change
+        if self.gap and segments[self.gap - 1].stop >= start:
+            first = bisect_left(segments, start, 0, self.gap, key=segment_stop)
+        else:
+            first = bisect_left(segments, start - old_length, self.gap, len(segments), key=segment_stop)
+        self.move_gap(first)
+
+        if first == 0:
+            restart, line, column = 0, 1, 1
+        else:
+            segment = segments[first]
+            restart, line, column = segment.start + old_length, segment.line + old_lines, segment.column
+
+        line_count = old_lines + text.count("\n") - source.slice(start, end).count("\n")
+        source.replace(start, end, text)
+        length = len(source)
+        edited = start + len(text)
+        # Statements that start on a later line than the edit ends on have
+        # the same columns they did, so they can be kept
+        edited_line = line + source.slice(restart, edited).count("\n")
+
+        relexer = Relexer(source, restart, line, column, self.backend)
+        parser = Parser(relexer, self.iterative, self.on_error)
+        resolver = Resolver()
+        new_segments, nodes, failures = [], [], []
+
+        # Old statements from `first` on, up to `kept`, are replaced
+        kept = first
+        while True:
+            token = parser.current
+            if token.type is TokenType.EOF:
+                kept = len(segments)
+                break
+
+            offset = relexer.offset(token)
+            if offset >= edited and token.line > edited_line and self.at_top_level(parser):
+                back = offset - length
+                while kept < len(segments) and segments[kept].start < back:
+                    kept += 1
+                if kept < len(segments) and segments[kept].start == back:
+                    break
+
+            errors = len(parser.errors)
+            node = parser.parse_statement()
+            stop = relexer.end(parser.peek)
+            parser.advance()
+
+            new_segments.append(Segment(offset, stop, token.line, token.column, token.line))
+            nodes.append(resolver.resolve(node) if node is not None else None)
+            failures.append(parser.errors[errors:] or None)
+
+        segments[first:kept] = new_segments
+        self.holes += nodes.count(None) - self.nodes[first:kept].count(None)
+        self.nodes[first:kept] = nodes
+        self.failures[first:kept] = failures
+        self.gap = first + len(new_segments)
+
+        # Keep track of the first statement that could be at the wrong line,
+        # through the renumbering
+        if self.stale is not None and self.stale > first:
+            self.stale = max(self.stale - kept, 0) + self.gap
+        if line_count != old_lines and self.gap < len(segments):
+            self.stale = self.gap if self.stale is None else min(self.stale, self.gap)
+
+        self.line_count = line_count
+        self.reparsed = len(new_segments)
+
+    def at_top_level(self, parser):
+        # A recovering parser counts braces, and a statement only starts
+        # where they're all closed (apart from its own)
+        if self.on_error != "recover":
+            return True
+        return parser.depth == (1 if parser.current_token_is(TokenType.LBRACE) else 0)
+
+    def move_gap(self, index):
+        # Segments before index count from the start, the rest from the end
+        segments = self.segments
+        while self.gap > index:
+            self.gap -= 1
+            segment = segments[self.gap]
+            segment.start -= len(self.text)
+            segment.stop -= len(self.text)
+            segment.line -= self.line_count
+        while self.gap < index:
+            segment = segments[self.gap]
+            segment.start += len(self.text)
+            segment.stop += len(self.text)
+            segment.line += self.line_count
+            self.gap += 1
+
+    def refresh(self):
+        # Moves statements that lines were added or removed before to
+        # their new lines
+        if self.stale is None:
+            return
+
+        for i in range(self.stale, len(self.segments)):
+            lines = self.moved_lines(i)
+            if not lines:
+                continue
+
+            if self.nodes[i] is not None:
+                self.nodes[i] = moved(self.nodes[i], lines)
+            if self.failures[i] is not None:
+                self.failures[i] = [moved_error(e, lines) for e in self.failures[i]]
+            self.segments[i].parsed_line += lines
+
+        self.stale = None
+
+    @property
+    def program(self):
+        self.refresh()
+        if self.holes:
+            return ast.Program([node for node in self.nodes if node is not None])
+        return ast.Program(self.nodes.copy())
+
+    def moved_lines(self, i):
+        # How far statement i has moved since it was parsed
+        segment = self.segments[i]
+        line = segment.line if i < self.gap else segment.line + self.line_count
+        return line - segment.parsed_line
+
+    @property
+    def errors(self):
+        # Doesn't wait for refresh(), errors are few and quick to move
+        errors = []
+        for i in compress(range(len(self.failures)), self.failures):
+            lines = self.moved_lines(i)
+            errors.extend(moved_error(e, lines) if lines else e for e in self.failures[i])
+        return errors
+
+def moved(node, lines):
+    # A copy of node with everything that has a position `lines` further
+    # down (or up)
+    match node:
+        case ast.LetStatement(identifier, expr):
+            return ast.LetStatement(identifier, moved(expr, lines), node.line + lines, node.column)
+
+        case ast.ReturnStatement(expr):
+            return ast.ReturnStatement(moved(expr, lines), node.line + lines, node.column)
+
+        case ast.ExpressionStatement(expr):
+            return ast.ExpressionStatement(moved(expr, lines), node.line + lines, node.column)
+
+        case ast.FunctionLiteral(parameters, body, num_locals):
+            return ast.FunctionLiteral(parameters, moved(body, lines), num_locals, node.line + lines, node.column, node.escapes)
+
+        case ast.CallExpression(function, arguments):
+            return ast.CallExpression(moved(function, lines), moved_list(arguments, lines), node.line + lines, node.column)
+
+        case ast.BlockStatement(statements):
+            return ast.BlockStatement([moved(s, lines) for s in statements])
+
+        case ast.PrefixExpression(operator, right):
+            return ast.PrefixExpression(operator, moved(right, lines))
+
+        case ast.InfixExpression(left, operator, right):
+            return ast.InfixExpression(moved(left, lines), operator, moved(right, lines))
+
+        case ast.IfExpression(condition, consequence, alternative):
+            return ast.IfExpression(moved(condition, lines), moved(consequence, lines), moved(alternative, lines))
+
+        case ast.ArrayLiteral(elements):
+            return ast.ArrayLiteral(moved_list(elements, lines))
+
+        case ast.HashLiteral(pairs):
+            return ast.HashLiteral({ moved(k, lines): moved(v, lines) for k, v in pairs.items() })
+
+        case ast.IndexExpression(left, index):
+            return ast.IndexExpression(moved(left, lines), moved(index, lines))
+
+    # Identifiers, literals and None holes don't have positions
+    return node
+
+def moved_error(error, lines):
+    return ParseError(error.message, error.line + lines, error.column)
+
+def moved_list(nodes, lines):
+    if nodes is None:
+        return None
+    return [moved(n, lines) for n in nodes]
@@ -0,0 +1,91 @@
+from array import array
+
+from pvector import PersistentVector
+
+# The elements of an IntArray: Monkey integers packed into an array('q'),
+# 8 bytes each instead of a pointer to an Integer. They're boxed on the way
+# out, so to everything that isn't looking for it this is one more vector
+# with len, indexing, iteration, push and rest.
+#
+# A vector is values[start:stop], and vectors share values. rest() moves
+# start. push() appends to values in place when the vector ends where
+# values does, nobody else can see past their own stop, otherwise it copies
+# first. Building an array a push at a time is amortized O(1) per push,
+# the same as a list. Pushing anything that isn't an integer that fits in
+# 64 bits gives back a PersistentVector instead, the array becomes a plain
+# Array from there on.
+#
+# mobject imports this module for IntArray, so it's imported where it's
+# used rather than up here, which lets either one be imported first.
+
+INT_MIN = -(1 << 63)
+INT_MAX = (1 << 63) - 1
+
+def packable(value):
+    import mobject as obj
+    return type(value) is obj.Integer and INT_MIN <= value.value <= INT_MAX
+
+class IntVector:
+    __slots__ = ("values", "start", "stop")
+
+    def __init__(self, values=None, start=0, stop=None):
+        self.values = values if values is not None else array("q")
+        self.start = start
+        self.stop = stop if stop is not None else len(self.values)
+
+    @classmethod
+    def from_ints(cls, ints):
+        # Python ints, raises OverflowError if any don't fit
+        return cls(array("q", ints))
+
+    def ints(self):
+        # The packed values, as a new array
+        return self.values[self.start : self.stop]
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        size = self.stop - self.start
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError("vector index out of range")
+        import mobject as obj
+        return obj.new_integer(self.values[self.start + index])
+
+    def __iter__(self):
+        import mobject as obj
+        return map(obj.new_integer, self.ints())
+
+    def push(self, value):
+        if not packable(value):
+            return PersistentVector.from_iterable(self).push(value)
+
+        values = self.values
+        if self.stop == len(values):
+            values.append(value.value)
+            return IntVector(values, self.start, self.stop + 1)
+
+        values = self.ints()
+        values.append(value.value)
+        return IntVector(values)
+
+    def rest(self):
+        if self.start == self.stop:
+            return self
+        return IntVector(self.values, self.start + 1, self.stop)
+
+    def __eq__(self, other):
+        if type(other) is IntVector:
+            return self.ints() == other.ints()
+        if not isinstance(other, (PersistentVector, list, tuple)):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
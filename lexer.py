@@ -1,16 +1,37 @@
+import codecs
+import io
+import re
+
 from tok import TokenType, Token
 
+# How much is read from a file or mmap at a time. The lexer only holds on to
+# the current chunk and the token it's in the middle of, so this, not the
+# size of the file, is what bounds its memory.
+CHUNK_SIZE = 64 * 1024
+
 class Lexer:
-    def __init__(self, buffer):
-        self.buffer = buffer
+    """Tokens from a str, or from anything with a read() (text or binary
+    files, mmaps, which are read chunk_size at a time and decoded as UTF-8)."""
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        if isinstance(source, str):
+            self.buffer = source
+            self.chunks = None
+        else:
+            self.buffer = ""
+            self.chunks = read_chunks(source, chunk_size)
+
+        self.start = 0       # where the current token starts in buffer
+        self.discarded = 0   # characters dropped off the front of buffer
+        self.line = 1
+        self.line_start = 0  # offset into the whole source of the current line
+        self.position = 0
         self.read_position = 0
+        self.ch = ""
         self.finished = False
         self.read_char()
 
     def __iter__(self):
-        self.read_position = 0
-        self.finished = False
-        self.read_char()
+        # Streams can't be rewound, so neither can we
         return self
     
     def __next__(self):
@@ -23,14 +44,36 @@ class Lexer:
 
         return token
 
+    def fill(self):
+        # Out of buffer: everything before the current token is done with,
+        # drop it and append the next chunk
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.chunks = None
+            return False
+
+        drop = self.start
+        self.buffer = self.buffer[drop:] + chunk
+        self.discarded += drop
+        self.start = 0
+        self.position -= drop
+        self.read_position -= drop
+        return True
+
     def peek_char(self):
-        if self.read_position >= len(self.buffer):
+        if self.read_position >= len(self.buffer) and not (self.chunks and self.fill()):
             return ""
         else:
             return self.buffer[self.read_position]
 
+    def newline(self):
+        # Call on a "\n", before reading past it. Newlines only turn up in
+        # whitespace and strings, so that's the only places that need to.
+        self.line += 1
+        self.line_start = self.discarded + self.read_position
+
     def read_char(self):
-        if self.read_position >= len(self.buffer):
+        if self.read_position >= len(self.buffer) and not (self.chunks and self.fill()):
             self.ch = ""
         else:
             self.ch = self.buffer[self.read_position]
@@ -39,62 +82,256 @@ class Lexer:
 
     def skip_whitespace(self):
         while self.ch.isspace():
+            if self.ch == "\n":
+                self.newline()
             self.read_char()
 
+    # These slice from self.start rather than remembering where they began,
+    # since fill() can move things around under them
+
     def read_identifier(self):
-        start = self.position
         while isletter(self.ch):
             self.read_char()
-        return self.buffer[start : self.position]
+        return self.buffer[self.start : self.position]
 
     def read_number(self):
-        start = self.position
         while self.ch.isnumeric():
             self.read_char()
-        return self.buffer[start : self.position]
+        return self.buffer[self.start : self.position]
     
     def read_string(self):
         self.read_char()
 
-        start = self.position
         while self.ch not in { "\"", "" }:
+            if self.ch == "\n":
+                self.newline()
+            self.read_char()
+        text = self.buffer[self.start + 1 : self.position]
+        if self.ch:
             self.read_char()
-        end = self.position
-        self.read_char()
 
-        return self.buffer[start : end]
+        return text
 
     def next_token(self):
         self.skip_whitespace()
 
+        self.start = self.position
+        line = self.line
+        column = self.discarded + self.position - self.line_start + 1
+
         match self.ch:
             case "":
-                token = Token(TokenType.EOF, self.ch)
+                tokentype, text = TokenType.EOF, self.ch
             case "=" if self.peek_char() == "=":
-                token = Token(TokenType.EQ, "==")
+                tokentype, text = TokenType.EQ, "=="
                 self.read_char()
                 self.read_char()
             case "!" if self.peek_char() == "=":
-                token = Token(TokenType.NOT_EQ, "!=")
+                tokentype, text = TokenType.NOT_EQ, "!="
                 self.read_char()
                 self.read_char()
             case "\"":
-                text = self.read_string()
-                token = Token(TokenType.STRING, text)
+                tokentype, text = TokenType.STRING, self.read_string()
             case ch if ch in symbols.keys():
-                token = Token(lookup_symbol(self.ch), self.ch)
+                tokentype, text = lookup_symbol(self.ch), self.ch
                 self.read_char()
             case ch if isletter(ch):
                 text = self.read_identifier()
-                token = Token(lookup_ident(text), text)
+                tokentype = lookup_ident(text)
             case ch if ch.isnumeric():
-                text = self.read_number()
-                token = Token(TokenType.INT, text)
+                tokentype, text = TokenType.INT, self.read_number()
             case _:
-                token = Token(TokenType.ILLEGAL, self.ch)
+                tokentype, text = TokenType.ILLEGAL, self.ch
                 self.read_char()
         
-        return token
+        return Token(tokentype, text, line, column)
+
+def read_chunks(source, chunk_size):
+    # Bytes are decoded as they come in. A character split between two
+    # chunks is held back by the decoder until the rest of it arrives.
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while data := source.read(chunk_size):
+        if not isinstance(data, str):
+            data = decoder.decode(data)
+        if data:
+            yield data
+
+    if data := decoder.decode(b"", final=True):
+        yield data
+
+# The same tokens as Lexer, but each one (and the whitespace before it) is
+# found by a single match of this regex instead of a Python loop over its
+# characters.
+#
+# It only knows ASCII. A token that starts with (or runs into) anything else
+# doesn't match and is handled one character at a time by slow_token, the
+# same way Lexer would, so both give identical results for any input. The
+# possessive ++ is what makes "héllo" fail as a whole rather than match "h".
+TOKEN_PATTERN = re.compile(r"""
+    \s*
+    (?:
+        (?P<ident>[A-Za-z_]++)(?![^\x00-\x7f])
+      | (?P<int>[0-9]++)(?![^\x00-\x7f])
+      | "(?P<string>[^"]*)(?:"|\Z)
+      | (?P<symbol>==|!=|[-=;:(),+{}\[\]!*/<>])
+      | \Z
+    )
+""", re.VERBOSE)
+
+SPACE_PATTERN = re.compile(r"\s*")
+
+# Enum member lookups aren't free, and this is a hot loop
+IDENT = TokenType.IDENT
+INT = TokenType.INT
+STRING = TokenType.STRING
+EOF = TokenType.EOF
+
+class RegexLexer:
+    """Drop-in for Lexer, takes the same sources."""
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        if isinstance(source, str):
+            self.buffer = source
+            self.chunks = None
+        else:
+            self.buffer = ""
+            self.chunks = read_chunks(source, chunk_size)
+
+        self.pos = 0         # where the next token starts in buffer
+        self.discarded = 0   # characters dropped off the front of buffer
+        self.line = 1
+        self.line_start = 0  # offset into the whole source of the current line
+        self.tokens = self.generate()
+
+    def __iter__(self):
+        # The generator itself, which saves a call per token over __next__
+        return self.tokens
+
+    def __next__(self):
+        return next(self.tokens)
+
+    def next_token(self):
+        # After EOF, more EOFs, which is what Lexer does too
+        return next(self.tokens, None) or Token(EOF, "", self.line, self.discarded + self.pos - self.line_start + 1)
+
+    def fill(self):
+        # Drop what's been lexed and append the next chunk
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.chunks = None
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.discarded += self.pos
+        self.pos = 0
+        return True
+
+    def newlines(self, start, end):
+        # Keep line and line_start up to date for buffer[start:end]
+        count = self.buffer.count("\n", start, end)
+        if count:
+            self.line += count
+            self.line_start = self.discarded + self.buffer.rindex("\n", start, end) + 1
+
+    def generate(self):
+        # Works on locals, which is most of what makes this fast. They're
+        # written back to self whenever a method needs to see them.
+        match = TOKEN_PATTERN.match
+        buffer = self.buffer
+        pos = 0
+        line = 1
+        line_start = 0
+
+        while True:
+            m = match(buffer, pos)
+            end = m.end() if m else pos
+
+            # Anything that runs up to the end of the buffer might carry on
+            # in the next chunk, so get that and try again
+            if end == len(buffer) and self.chunks:
+                self.pos = pos
+                if self.fill():
+                    buffer = self.buffer
+                    pos = 0
+                    continue
+
+            if m is None:
+                # Not ASCII, or ILLEGAL. The whitespace in front of it can't
+                # run to the end of the buffer, or \Z would have matched.
+                self.line, self.line_start = line, line_start
+                self.pos = SPACE_PATTERN.match(buffer, pos).end()
+                self.newlines(pos, self.pos)
+                yield self.slow_token()
+                buffer, pos, line, line_start = self.buffer, self.pos, self.line, self.line_start
+                continue
+
+            kind = m.lastgroup
+            if kind is None:
+                start = end
+            elif kind == "string":
+                start = m.start(kind) - 1  # the opening quote
+            else:
+                start = m.start(kind)
+            if start != pos:
+                count = buffer.count("\n", pos, start)
+                if count:
+                    line += count
+                    line_start = self.discarded + buffer.rindex("\n", pos, start) + 1
+
+            column = self.discarded + start - line_start + 1
+            pos = end
+
+            if kind == "ident":
+                text = m.group(kind)
+                yield Token(keywords.get(text, IDENT), text, line, column)
+            elif kind == "symbol":
+                text = m.group(kind)
+                yield Token(operators[text], text, line, column)
+            elif kind == "int":
+                yield Token(INT, m.group(kind), line, column)
+            elif kind == "string":
+                token = Token(STRING, m.group(kind), line, column)
+                if "\n" in token.text:
+                    line += token.text.count("\n")
+                    line_start = self.discarded + buffer.rindex("\n", start, end) + 1
+                yield token
+            else:
+                self.pos, self.line, self.line_start = pos, line, line_start
+                yield Token(EOF, "", line, column)
+                return
+
+    def slow_token(self):
+        line = self.line
+        column = self.discarded + self.pos - self.line_start + 1
+
+        ch = self.buffer[self.pos]
+        if isletter(ch):
+            text = self.scan(isletter)
+            return Token(lookup_ident(text), text, line, column)
+        if ch.isnumeric():
+            return Token(TokenType.INT, self.scan(str.isnumeric), line, column)
+
+        self.pos += 1
+        return Token(TokenType.ILLEGAL, ch, line, column)
+
+    def scan(self, predicate):
+        # Longest run of characters from pos that satisfy predicate, reading
+        # more chunks if it gets to the end of the buffer
+        length = 0
+        while True:
+            buffer = self.buffer
+            end = self.pos + length
+            while end < len(buffer) and predicate(buffer[end]):
+                end += 1
+            length = end - self.pos
+            if end < len(buffer) or not (self.chunks and self.fill()):
+                break
+
+        text = self.buffer[self.pos : self.pos + length]
+        self.pos += length
+        return text
 
 keywords = { 
     "fn": TokenType.FUNCTION,
@@ -126,6 +363,11 @@ symbols = {
     ">": TokenType.GT,
 }
 
+operators = symbols | {
+    "==": TokenType.EQ,
+    "!=": TokenType.NOT_EQ,
+}
+
 def isletter(ch):
     return ch.isalpha() or ch == '_'
 
@@ -135,5 +377,10 @@ def lookup_ident(key):
 def lookup_symbol(key):
     return symbols.get(key, TokenType.ILLEGAL)
 
-def lex(text):
-    return list(Lexer(text))
\ No newline at end of file
+lexers = {
+    "char": Lexer,
+    "regex": RegexLexer,
+}
+
+def lex(source, backend="char"):
+    return list(lexers[backend](source))
\ No newline at end of file
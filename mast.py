@@ -1,13 +1,18 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 
+# Statements, function literals and calls know where they start in the
+# source (1-based line and column, 0 when made by hand), which is enough to
+# say where a running program is without making every node bigger. They
+# don't count toward equality.
+
 # Remark: This implementation bothers me, but I'm not sure how to fix it.
 # - Plain classes mean a lot of boilerplate. I'd like to avoid that if possible.
 # - Dataclasses are more compact, but writing type hints doesn't feel great.
 # - Why not just stick to values (list, tuples and dicts)? I dunno, in too deep I guess.
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class PrefixExpression:
     operator: str
     right: Any
@@ -15,7 +20,7 @@ class PrefixExpression:
     def __repr__(self):
         return f"({str(self.operator)}{str(self.right)})"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class InfixExpression:
     left: Any
     operator: str
@@ -24,7 +29,7 @@ class InfixExpression:
     def __repr__(self):
         return f"({str(self.left)}{str(self.operator)}{str(self.right)})"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class BlockStatement:
     statements: Any
 
@@ -32,7 +37,7 @@ class BlockStatement:
         s = "\n".join(str(x) for x in self.statements)
         return f"{{ {s} }}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class IfExpression:
     condition: Any
     consequence: BlockStatement
@@ -41,44 +46,63 @@ class IfExpression:
     def __repr__(self):
         return f"if ({str(self.condition)}) {str(self.consequence)} else {str(self.alternative)}"
 
-@dataclass(eq=True, frozen=True)
+# Depth the resolver gives to identifiers that live in the global
+# (name-based) scope. Unresolved identifiers have a depth of None.
+GLOBAL_DEPTH = -1
+
+@dataclass(eq=True, frozen=True, slots=True)
 class Identifier:
     value: str
+    # Filled in by the resolver: how many function scopes out the binding
+    # is, and its slot there. Doesn't count toward equality.
+    depth: int = field(default=None, compare=False)
+    slot: int = field(default=None, compare=False)
+    # Where to look when the slot is still empty (its let hasn't run), an
+    # Identifier resolved as if that binding wasn't there
+    fallback: Any = field(default=None, compare=False)
 
     def __repr__(self):
         return f"{self.value}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class IntegerLiteral:
     value: int
 
     def __repr__(self):
         return f"{self.value}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class StringLiteral:
     value: str
 
     def __repr__(self):
         return f"{self.value!r}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class Boolean:
     value: bool
 
     def __repr__(self):
         return f"{str(self.value)}".lower()
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class FunctionLiteral:
     parameters: list[Identifier]
     body: BlockStatement
+    # Slots a call needs (parameters included), filled in by the resolver
+    num_locals: int = field(default=0, compare=False)
+    line: int = field(default=0, compare=False)
+    column: int = field(default=0, compare=False)
+    # Whether a call's frame can outlive the call, which it can when the
+    # body makes a function, that function closes over it. Filled in by the
+    # resolver, until then it's the safe answer.
+    escapes: bool = field(default=True, compare=False)
 
     def __repr__(self):
-        p = ", ".join(str(x) for x in parameters)
+        p = ", ".join(str(x) for x in self.parameters)
         return f"fn ({p}) {{ {str(self.body)} }}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class ArrayLiteral:
     elements: list[Any]
 
@@ -86,7 +110,7 @@ class ArrayLiteral:
         s = ", ".join(str(x) for x in self.elements)
         return f"[{s}]"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class HashLiteral:
     pairs: dict[Any, Any]
     
@@ -94,7 +118,7 @@ class HashLiteral:
         s = ", ".join(f"{str(k)}:{str(v)}" for k, v in self.pairs.items())
         return f"{{{s}}}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class IndexExpression:
     left: Any
     index: Any
@@ -102,38 +126,46 @@ class IndexExpression:
     def __repr__(self):
         return f"({self.left}[{self.index}])"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class CallExpression:
     function: Identifier | FunctionLiteral
     arguments: list[Any]
+    line: int = field(default=0, compare=False)
+    column: int = field(default=0, compare=False)
 
     def __repr__(self):
-        a = ", ".join(str(x) for x in arguments)
+        a = ", ".join(str(x) for x in self.arguments)
         return f"({str(self.function)})({a})"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class LetStatement:
     identifier: str
     expr: Any
+    line: int = field(default=0, compare=False)
+    column: int = field(default=0, compare=False)
 
     def __repr__(self):
         return f"let {str(self.identifier)} = {str(self.expr)};"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class ReturnStatement:
     expr: Any
+    line: int = field(default=0, compare=False)
+    column: int = field(default=0, compare=False)
 
     def __repr__(self):
         return f"return {str(self.expr)}"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class ExpressionStatement:
     expr: Any
+    line: int = field(default=0, compare=False)
+    column: int = field(default=0, compare=False)
 
     def __repr__(self):
         return f"{str(self.expr)};"
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class Program:
     statements: list[Any]
 
@@ -1,13 +1,18 @@
 # Python doesn't like `builtins` as a module name, either
+import operator
+from itertools import repeat
+
 import evaluator
 import mobject as obj
+from intvector import IntVector, packable
+from memo import Memo
 
 def builtin_len(*args):
     match args:
         case [obj.Array(elements)]:
-            return obj.Integer(len(elements))
-        case [obj.String(value)]:
-            return obj.Integer(len(value))
+            return obj.new_integer(len(elements))
+        case [obj.String() as string]:
+            return obj.new_integer(string.length)
         case [x]:
             return obj.Error(f"argument to `len` not supported, got {obj.typeof(x)}")
         case _:
@@ -18,7 +23,7 @@ def first(*args):
         return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
     
     if not isinstance(args[0], obj.Array):
-        return obj.Error(f"argument to `first` must be ARRAY, got {typeof(args[0])}")
+        return obj.Error(f"argument to `first` must be ARRAY, got {obj.typeof(args[0])}")
     
     array = args[0].elements
     if len(array) == 0:
@@ -31,7 +36,7 @@ def last(*args):
         return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
     
     if not isinstance(args[0], obj.Array):
-        return obj.Error(f"argument to `first` must be ARRAY, got {typeof(args[0])}")
+        return obj.Error(f"argument to `last` must be ARRAY, got {obj.typeof(args[0])}")
     
     array = args[0].elements
     if len(array) == 0:
@@ -44,25 +49,27 @@ def rest(*args):
         return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
     
     if not isinstance(args[0], obj.Array):
-        return obj.Error(f"argument to `first` must be ARRAY, got {typeof(args[0])}")
+        return obj.Error(f"argument to `rest` must be ARRAY, got {obj.typeof(args[0])}")
     
     array = args[0].elements
     if len(array) == 0:
         return evaluator.NULL
     
-    return obj.Array(array[1:])
+    return obj.new_array(array.rest())
 
 def push(*args):
     if len(args) != 2:
         return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 2")
     
     if not isinstance(args[0], obj.Array):
-        return obj.Error(f"argument to `first` must be ARRAY, got {typeof(args[0])}")
-    
-    array = args[0].elements[:]
-    array.append(args[1])
+        return obj.Error(f"argument to `push` must be ARRAY, got {obj.typeof(args[0])}")
     
-    return obj.Array(array)
+    elements = args[0].elements
+    if len(elements) == 0 and packable(args[1]):
+        # Arrays built up from [] a push at a time are mostly integers, so
+        # they start out packed
+        return obj.IntArray(IntVector().push(args[1]))
+    return obj.new_array(elements.push(args[1]))
 
 def puts(*args):
     for arg in args:
@@ -70,6 +77,267 @@ def puts(*args):
     
     return obj.Null()
 
+def memo(*args, vm=None):
+    match args:
+        case [obj.Function(_, _, _) | obj.Closure(_, _) as fn]:
+            return obj.Builtin(Memo(fn, vm=vm))
+        case [obj.Function(_, _, _) | obj.Closure(_, _) as fn, obj.Integer(size)] if size > 0:
+            return obj.Builtin(Memo(fn, size, vm))
+        case [obj.Function(_, _, _) | obj.Closure(_, _), x]:
+            return obj.Error(f"size given to `memo` must be a positive INTEGER, got {obj.inspect(x)}")
+        case [x] | [x, _]:
+            return obj.Error(f"argument to `memo` must be FUNCTION, got {obj.typeof(x)}")
+        case _:
+            return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1 or 2")
+
+def memo_stats(*args):
+    match args:
+        case [obj.Builtin(Memo() as m)]:
+            return obj.Hash({
+                obj.intern_string(k): obj.Boolean(v) if type(v) is bool else obj.new_integer(v)
+                for k, v in m.stats().items() if v is not None
+            })
+        case [x]:
+            return obj.Error(f"argument to `memo_stats` must be a function from `memo`, got {obj.typeof(x)}")
+        case _:
+            return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
+
+# map, filter, reduce and each loop here, in Python, calling the function
+# they're given for each element, rather than in Monkey with first, rest
+# and push. That's no recursion and no new array per element, so they work
+# on arrays of any length.
+#
+# Under a budget (see budget.py) the evaluator passes these, and the other
+# builtins in TAKES_CONTEXT, its ExecutionContext. Every callback is a call
+# and a step, and arrays are checked against the memory budget before
+# they're built.
+#
+# The VM passes the builtins in TAKES_VM itself, as `vm`, which is what
+# runs the Closures it hands them (see VM.call).
+
+def fits(context, cells):
+    # The error if a new array of cells doesn't fit the budget
+    if context is None:
+        return None
+    return context.reserve(cells)
+
+def call(context, fn, args, vm=None):
+    if context is not None:
+        error = context.step()
+        if error is not None:
+            return error
+        context.calls += 1
+    if type(fn) is obj.Closure:
+        return vm.call(fn, args)
+    return evaluator.apply_function(fn, args)
+
+def callback(name, fn, arity):
+    # Checks fn can be called with arity arguments, giving back the error
+    # if it can't
+    match fn:
+        case obj.Function(parameters, _, _) if len(parameters) != arity:
+            return obj.Error(f"function given to `{name}` must take {arity} argument{'s' if arity > 1 else ''}, got {len(parameters)}")
+        case obj.Closure(compiled, _) if compiled.num_parameters != arity:
+            return obj.Error(f"function given to `{name}` must take {arity} argument{'s' if arity > 1 else ''}, got {compiled.num_parameters}")
+        case obj.Function(_, _, _) | obj.Builtin(_) | obj.Closure(_, _):
+            return None
+    return obj.Error(f"argument to `{name}` must be FUNCTION, got {obj.typeof(fn)}")
+
+def builtin_map(*args, context=None, vm=None):
+    if len(args) != 2:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 2")
+    array, fn = args
+    if not isinstance(array, obj.Array):
+        return obj.Error(f"argument to `map` must be ARRAY, got {obj.typeof(array)}")
+    error = callback("map", fn, 1) or fits(context, len(array.elements))
+    if error is not None:
+        return error
+
+    result = []
+    for element in array.elements:
+        value = call(context, fn, [element], vm)
+        if type(value) is obj.Error:
+            return value
+        result.append(value)
+    return array_of(result)
+
+def builtin_filter(*args, context=None, vm=None):
+    if len(args) != 2:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 2")
+    array, fn = args
+    if not isinstance(array, obj.Array):
+        return obj.Error(f"argument to `filter` must be ARRAY, got {obj.typeof(array)}")
+    error = callback("filter", fn, 1)
+    if error is not None:
+        return error
+
+    is_truthy = evaluator.is_truthy
+    result = []
+    for element in array.elements:
+        value = call(context, fn, [element], vm)
+        if type(value) is obj.Error:
+            return value
+        if is_truthy(value):
+            result.append(element)
+    return array_of(result)
+
+def builtin_reduce(*args, context=None, vm=None):
+    if len(args) != 3:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 3")
+    array, result, fn = args
+    if not isinstance(array, obj.Array):
+        return obj.Error(f"argument to `reduce` must be ARRAY, got {obj.typeof(array)}")
+    error = callback("reduce", fn, 2)
+    if error is not None:
+        return error
+
+    for element in array.elements:
+        result = call(context, fn, [result, element], vm)
+        if type(result) is obj.Error:
+            return result
+    return result
+
+def each(*args, context=None, vm=None):
+    if len(args) != 2:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 2")
+    array, fn = args
+    if not isinstance(array, obj.Array):
+        return obj.Error(f"argument to `each` must be ARRAY, got {obj.typeof(array)}")
+    error = callback("each", fn, 1)
+    if error is not None:
+        return error
+
+    for element in array.elements:
+        value = call(context, fn, [element], vm)
+        if type(value) is obj.Error:
+            return value
+    return evaluator.NULL
+
+def builtin_range(*args, context=None):
+    # range(end), range(start, end) or range(start, end, step), like Python's
+    for arg in args:
+        if not isinstance(arg, obj.Integer):
+            return obj.Error(f"argument to `range` must be INTEGER, got {obj.typeof(arg)}")
+    match [arg.value for arg in args]:
+        case [end]:
+            numbers = range(end)
+        case [start, end]:
+            numbers = range(start, end)
+        case [_, _, 0]:
+            return obj.Error("step given to `range` can't be 0")
+        case [start, end, step]:
+            numbers = range(start, end, step)
+        case _:
+            return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1, 2 or 3")
+    error = fits(context, len(numbers))
+    if error is not None:
+        return error
+    return ints_array(lambda: numbers)
+
+def array_of(elements):
+    # An IntArray if they're all integers that fit, an Array if not
+    if elements and all(packable(e) for e in elements):
+        return obj.IntArray(IntVector.from_ints(e.value for e in elements))
+    return obj.Array(elements)
+
+def ints_array(ints):
+    # An array of what ints() gives back, packed unless some don't fit (it's
+    # a function so the ints can be worked out again, which is rare)
+    try:
+        return obj.IntArray(IntVector.from_ints(ints()))
+    except OverflowError:
+        return obj.Array(map(obj.new_integer, ints()))
+
+# sum, min, max, sort, add and mul work on an IntArray's packed values
+# directly, which keeps the loop in C. Arrays that are all integers work
+# too, there's just the unboxing first.
+
+def int_values(name, array):
+    # array's integers as Python ints (an array('q') of them, for an
+    # IntArray), or the error saying why not
+    if not isinstance(array, obj.Array):
+        return None, obj.Error(f"argument to `{name}` must be ARRAY, got {obj.typeof(array)}")
+    if type(array) is obj.IntArray:
+        return array.elements.ints(), None
+
+    values = []
+    for element in array.elements:
+        if type(element) is not obj.Integer:
+            return None, obj.Error(f"array given to `{name}` must only have INTEGERs, got {obj.typeof(element)}")
+        values.append(element.value)
+    return values, None
+
+def builtin_sum(*args):
+    if len(args) != 1:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
+    values, error = int_values("sum", args[0])
+    if error is not None:
+        return error
+    return obj.new_integer(sum(values))
+
+def builtin_min(*args):
+    if len(args) != 1:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
+    values, error = int_values("min", args[0])
+    if error is not None:
+        return error
+    if len(values) == 0:
+        return evaluator.NULL
+    return obj.new_integer(min(values))
+
+def builtin_max(*args):
+    if len(args) != 1:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
+    values, error = int_values("max", args[0])
+    if error is not None:
+        return error
+    if len(values) == 0:
+        return evaluator.NULL
+    return obj.new_integer(max(values))
+
+def sort(*args, context=None):
+    if len(args) != 1:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 1")
+    values, error = int_values("sort", args[0])
+    if error is None:
+        error = fits(context, len(values))
+    if error is not None:
+        return error
+    return ints_array(lambda: sorted(values))
+
+def elementwise(name, op, args, context=None):
+    # add(a, b) is [a[0] + b[0], a[1] + b[1], ...], and add(a, n) adds n to
+    # every element
+    if len(args) != 2:
+        return obj.Error(f"wrong number of arguments; got {len(args)} but wanted 2")
+    left, error = int_values(name, args[0])
+    if error is not None:
+        return error
+
+    match args[1]:
+        case obj.Integer(n):
+            # Never runs out, map stops at the end of left
+            right = repeat(n)
+        case obj.Array(_):
+            right, error = int_values(name, args[1])
+            if error is not None:
+                return error
+            if len(left) != len(right):
+                return obj.Error(f"arrays given to `{name}` must be the same length, got {len(left)} and {len(right)}")
+        case x:
+            return obj.Error(f"second argument to `{name}` must be ARRAY or INTEGER, got {obj.typeof(x)}")
+
+    error = fits(context, len(left))
+    if error is not None:
+        return error
+    return ints_array(lambda: map(op, left, right))
+
+def add(*args, context=None):
+    return elementwise("add", operator.add, args, context)
+
+def mul(*args, context=None):
+    return elementwise("mul", operator.mul, args, context)
+
 builtinfns = {
     "len": obj.Builtin(builtin_len),
     "first": obj.Builtin(first),
@@ -77,4 +345,28 @@ builtinfns = {
     "rest": obj.Builtin(rest),
     "push": obj.Builtin(push),
     "puts": obj.Builtin(puts),
-}
\ No newline at end of file
+    "memo": obj.Builtin(memo),
+    "memo_stats": obj.Builtin(memo_stats),
+    "map": obj.Builtin(builtin_map),
+    "filter": obj.Builtin(builtin_filter),
+    "reduce": obj.Builtin(builtin_reduce),
+    "each": obj.Builtin(each),
+    "range": obj.Builtin(builtin_range),
+    "sum": obj.Builtin(builtin_sum),
+    "min": obj.Builtin(builtin_min),
+    "max": obj.Builtin(builtin_max),
+    "sort": obj.Builtin(sort),
+    "add": obj.Builtin(add),
+    "mul": obj.Builtin(mul),
+}
+
+# Builtins whose arrays are all new cells, rather than sharing most of them
+# with an argument the way push and rest do. A budget counts all of them.
+FRESH_ARRAYS = frozenset({builtin_map, builtin_filter, builtin_range, sort, add, mul})
+
+# Builtins that take the run's ExecutionContext as `context`, when there is
+# one
+TAKES_CONTEXT = frozenset({builtin_map, builtin_filter, builtin_reduce, each, builtin_range, sort, add, mul})
+
+# Builtins that take the VM running them as `vm`, to call Closures with
+TAKES_VM = frozenset({builtin_map, builtin_filter, builtin_reduce, each, memo})
\ No newline at end of file
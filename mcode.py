@@ -0,0 +1,136 @@
+# Python already has a `code` module, hence the prefix (same story as mbuiltins)
+from dataclasses import dataclass
+from enum import IntEnum
+
+class Opcode(IntEnum):
+    CONSTANT = 0
+    POP = 1
+
+    # Binary operators. Keep these contiguous, the VM range-checks them.
+    ADD = 2
+    SUB = 3
+    MUL = 4
+    DIV = 5
+    EQUAL = 6
+    NOT_EQUAL = 7
+    GREATER_THAN = 8
+    LESS_THAN = 9
+
+    MINUS = 10
+    BANG = 11
+    TRUE = 12
+    FALSE = 13
+    NULL = 14
+    JUMP_NOT_TRUTHY = 15
+    JUMP = 16
+    GET_GLOBAL = 17
+    SET_GLOBAL = 18
+    GET_LOCAL = 19
+    SET_LOCAL = 20
+    GET_BUILTIN = 21
+    GET_FREE = 22
+    CURRENT_CLOSURE = 23
+    ARRAY = 24
+    HASH = 25
+    INDEX = 26
+    CALL = 27
+    RETURN_VALUE = 28
+    RETURN = 29
+    CLOSURE = 30
+    # A local that might not be set yet, see Compiler.load_symbol
+    GET_LOCAL_OR = 31
+
+@dataclass(frozen=True)
+class Definition:
+    name: str
+    operand_widths: tuple[int, ...]
+
+definitions = {
+    Opcode.CONSTANT: Definition("OpConstant", (2,)),
+    Opcode.POP: Definition("OpPop", ()),
+    Opcode.ADD: Definition("OpAdd", ()),
+    Opcode.SUB: Definition("OpSub", ()),
+    Opcode.MUL: Definition("OpMul", ()),
+    Opcode.DIV: Definition("OpDiv", ()),
+    Opcode.EQUAL: Definition("OpEqual", ()),
+    Opcode.NOT_EQUAL: Definition("OpNotEqual", ()),
+    Opcode.GREATER_THAN: Definition("OpGreaterThan", ()),
+    Opcode.LESS_THAN: Definition("OpLessThan", ()),
+    Opcode.MINUS: Definition("OpMinus", ()),
+    Opcode.BANG: Definition("OpBang", ()),
+    Opcode.TRUE: Definition("OpTrue", ()),
+    Opcode.FALSE: Definition("OpFalse", ()),
+    Opcode.NULL: Definition("OpNull", ()),
+    Opcode.JUMP_NOT_TRUTHY: Definition("OpJumpNotTruthy", (2,)),
+    Opcode.JUMP: Definition("OpJump", (2,)),
+    Opcode.GET_GLOBAL: Definition("OpGetGlobal", (2,)),
+    Opcode.SET_GLOBAL: Definition("OpSetGlobal", (2,)),
+    Opcode.GET_LOCAL: Definition("OpGetLocal", (1,)),
+    Opcode.SET_LOCAL: Definition("OpSetLocal", (1,)),
+    Opcode.GET_BUILTIN: Definition("OpGetBuiltin", (1,)),
+    Opcode.GET_FREE: Definition("OpGetFree", (1,)),
+    Opcode.CURRENT_CLOSURE: Definition("OpCurrentClosure", ()),
+    Opcode.ARRAY: Definition("OpArray", (2,)),
+    Opcode.HASH: Definition("OpHash", (2,)),
+    Opcode.INDEX: Definition("OpIndex", ()),
+    Opcode.CALL: Definition("OpCall", (1,)),
+    Opcode.RETURN_VALUE: Definition("OpReturnValue", ()),
+    Opcode.RETURN: Definition("OpReturn", ()),
+    Opcode.CLOSURE: Definition("OpClosure", (2, 1)),
+    Opcode.GET_LOCAL_OR: Definition("OpGetLocalOr", (1, 2)),
+}
+
+# Binary operators as they're spelled in the source, for error messages and
+# for handing non-integer operands back to the evaluator.
+operators = {
+    Opcode.ADD: "+",
+    Opcode.SUB: "-",
+    Opcode.MUL: "*",
+    Opcode.DIV: "/",
+    Opcode.EQUAL: "==",
+    Opcode.NOT_EQUAL: "!=",
+    Opcode.GREATER_THAN: ">",
+    Opcode.LESS_THAN: "<",
+}
+
+def lookup(op):
+    return definitions.get(op)
+
+def make(op, *operands):
+    definition = definitions.get(op)
+    if definition is None:
+        return b""
+
+    instruction = bytearray([op])
+    for operand, width in zip(operands, definition.operand_widths):
+        instruction += operand.to_bytes(width, "big")
+
+    return bytes(instruction)
+
+def read_operands(definition, ins, offset=0):
+    operands = []
+    for width in definition.operand_widths:
+        operands.append(int.from_bytes(ins[offset : offset + width], "big"))
+        offset += width
+
+    return operands, sum(definition.operand_widths)
+
+def read_uint16(ins, offset):
+    return (ins[offset] << 8) | ins[offset + 1]
+
+def disassemble(ins):
+    lines = []
+    i = 0
+    while i < len(ins):
+        definition = definitions.get(ins[i])
+        if definition is None:
+            lines.append(f"ERROR: opcode {ins[i]} undefined")
+            i += 1
+            continue
+
+        operands, read = read_operands(definition, ins, i + 1)
+        text = " ".join([definition.name, *(str(x) for x in operands)])
+        lines.append(f"{i:04} {text}")
+        i += 1 + read
+
+    return "\n".join(lines)
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+
+import mast as ast
+import mobject as obj
+import evaluator  # Only used at call time, it imports us (by way of mbuiltins)
+
+# The `memo` builtin: memo(f) is f with its results remembered, keyed by its
+# arguments, in a least-recently-used cache of up to MEMO_SIZE results (or
+# memo(f, size)). Recursive functions want the memoized version bound to
+# the name they call themselves by:
+#
+#   let fib = memo(fn(n) { if (n < 2) { n } else { fib(n - 1) + fib(n - 2) } });
+#
+# Results are only remembered when that can't change what the program does,
+# which is worked out from the function's body the first time it's called
+# (by then, `fib` above is bound). The function has to be pure:
+#
+# - Everything it reads is a parameter or a local, or a global or builtin
+#   that's a pure function itself. Other globals can be rebound, and
+#   variables it closes over can be re-let. That goes for what a local
+#   falls back to when its let hasn't run, too.
+# - Everything it calls is one of those functions, or a function literal.
+#   A function that came in as an argument could be anything.
+# - No puts.
+#
+# and a call only hits the cache if its arguments are integers, strings and
+# booleans, the things that can be Hash keys. Anything else is still called,
+# just without the cache. Errors aren't remembered either, a budget running
+# out is one and that's not up to the arguments.
+#
+# The VM's functions are bytecode, with no tree left to check, so memo
+# there calls them every time.
+#
+# Binding a global can change what a function calls, so when one has been
+# bound since the last call, the globals the check looked at are checked
+# again. If any of them are something else now, the function is too: the
+# check is redone and the cache emptied.
+
+MEMO_SIZE = 1024
+
+# Functions can come back with None (a body that ends in a let)
+MISSING = object()
+
+# Builtins that only look at their arguments
+PURE_BUILTINS = frozenset({
+    "len", "first", "last", "rest", "push", "range", "sum", "min", "max", "sort", "add", "mul",
+})
+
+class Purity:
+    def __init__(self, globals):
+        self.globals = globals
+        # Global name -> what it was bound to when it was looked at
+        self.dependencies = {}
+        # Bodies looked at so far. A function that's seen again (say, by
+        # calling itself) has nothing new to say about the answer.
+        self.seen = set()
+
+    def function(self, function):
+        if id(function.body) in self.seen:
+            return True
+        self.seen.add(id(function.body))
+        return self.node(function.body, 0)
+
+    def node(self, node, level):
+        # level is how many function literals in from the function being
+        # checked node is, an identifier any further out than that is a
+        # variable the function closes over
+        match node:
+            case ast.Identifier(value, depth, _, fallback):
+                if depth == ast.GLOBAL_DEPTH:
+                    return self.global_value(value)
+                if depth is None or depth > level:
+                    return False
+                # A slot whose let hasn't run reads whatever the fallback
+                # does, see resolver
+                return fallback is None or self.fallback(fallback, level)
+
+            case ast.CallExpression(function, arguments):
+                match function:
+                    case ast.Identifier(_, depth, _) if depth != ast.GLOBAL_DEPTH:
+                        return False
+                    case ast.Identifier(_) | ast.FunctionLiteral(_, _):
+                        pass
+                    case _:
+                        # Calls whatever some other expression came up with
+                        return False
+                return self.node(function, level) and self.nodes(arguments, level)
+
+            case ast.FunctionLiteral(_, body):
+                return self.node(body, level + 1)
+
+            case ast.Program(statements) | ast.BlockStatement(statements):
+                return self.nodes(statements, level)
+
+            case ast.LetStatement(_, expr) | ast.ReturnStatement(expr) | ast.ExpressionStatement(expr):
+                return self.node(expr, level)
+
+            case ast.PrefixExpression(_, right):
+                return self.node(right, level)
+
+            case ast.InfixExpression(left, _, right):
+                return self.node(left, level) and self.node(right, level)
+
+            case ast.IfExpression(condition, consequence, alternative):
+                return self.nodes([condition, consequence, alternative], level)
+
+            case ast.ArrayLiteral(elements):
+                return self.nodes(elements, level)
+
+            case ast.HashLiteral(pairs):
+                return self.nodes(pairs.keys(), level) and self.nodes(pairs.values(), level)
+
+            case ast.IndexExpression(left, index):
+                return self.node(left, level) and self.node(index, level)
+
+            case ast.IntegerLiteral(_) | ast.StringLiteral(_) | ast.Boolean(_) | None:
+                return True
+
+        return False
+
+    def nodes(self, nodes, level):
+        if nodes is None:
+            return True
+        return all(self.node(n, level) for n in nodes)
+
+    def fallback(self, identifier, level):
+        name = identifier.value
+        if identifier.depth == ast.GLOBAL_DEPTH and name not in evaluator.builtinfns and self.globals.get(name) is None:
+            # Nothing by that name, reading it would be an error (and those
+            # aren't remembered). Binding it later has the check redone.
+            self.dependencies[name] = None
+            return True
+        return self.node(identifier, level)
+
+    def global_value(self, name):
+        value = self.globals.get(name)
+        self.dependencies[name] = value
+
+        match value:
+            case None:
+                return name in PURE_BUILTINS
+            case obj.Function(_, _, _):
+                return self.function(value)
+            case obj.Builtin(Memo() as memo):
+                return self.function(memo.function)
+        # Not a function, or a builtin we don't know anything about
+        return False
+
+class Memo:
+    def __init__(self, function, maxsize=MEMO_SIZE, vm=None):
+        self.function = function
+        self.maxsize = maxsize
+        # What runs function when it's a VM Closure
+        self.vm = vm
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+
+        # Whether the function is pure, None until it's first called. The
+        # globals that went into that, and the version of the globals it
+        # was worked out at.
+        self.pure = None
+        self.dependencies = {}
+        self.version = None
+        if vm is not None:
+            # Bytecode has no tree to check, so it's never known to be pure
+            self.pure = False
+
+    def __call__(self, *args):
+        if self.vm is None:
+            globals = self.function.env.globals
+            if self.version != globals.version:
+                self.check(globals)
+
+        if not self.pure or any(type(a) not in obj.HASHABLE for a in args):
+            self.uncached += 1
+            return self.apply(args)
+
+        result = self.results.get(args, MISSING)
+        if result is not MISSING:
+            self.results.move_to_end(args)
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = self.apply(args)
+        if type(result) is not obj.Error:
+            self.results[args] = result
+            if len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def apply(self, args):
+        if self.vm is not None:
+            return self.vm.call(self.function, list(args))
+        return evaluator.apply_function(self.function, list(args))
+
+    def check(self, globals):
+        if self.pure is not None and all(globals.get(name) is value for name, value in self.dependencies.items()):
+            self.version = globals.version
+            return
+
+        purity = Purity(globals)
+        self.pure = purity.function(self.function)
+        self.dependencies = purity.dependencies
+        self.version = globals.version
+        self.results.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "uncached": self.uncached,
+            "size": len(self.results),
+            "maxsize": self.maxsize,
+            "pure": self.pure,
+        }
@@ -1,69 +1,221 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 import typing
 
 import mast as ast
 import environment as env
+from pvector import PersistentVector
+from intvector import IntVector
 
-@dataclass
+# Integers, strings and booleans are what a Hash can be keyed by, so they
+# hash and compare like the Python value they hold. Equality also checks the
+# type, so 1 and true are different keys. Both are written out rather than
+# generated, the dataclass versions build a tuple per call.
+
+@dataclass(slots=True)
 class Integer:
     value: int
 
-@dataclass
+    def __eq__(self, other):
+        if type(other) is not Integer:
+            return NotImplemented
+        return self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
 class String:
-    value: str
+    # What + makes of two long strings is a rope: the two Strings, with the
+    # characters only joined up (once) when something reads value. length
+    # is always there. See concat.
+    __slots__ = ("_value", "left", "right", "length")
+    __match_args__ = ("value",)
+
+    def __init__(self, value, left=None, right=None):
+        self._value = value
+        self.left, self.right = left, right
+        self.length = len(value) if value is not None else left.length + right.length
+
+    @property
+    def value(self):
+        if self._value is None:
+            self.flatten()
+        return self._value
+
+    def flatten(self):
+        # A string built up a piece at a time is a rope as deep as it has
+        # pieces, so no recursion here
+        pieces = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._value is not None:
+                pieces.append(node._value)
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
+        self._value = "".join(pieces)
+        self.left = self.right = None
+
+    def __eq__(self, other):
+        if type(other) is not String:
+            return NotImplemented
+        return self.length == other.length and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
 
-@dataclass
+    def __repr__(self):
+        return f"String(value={self.value!r})"
+
+    def __reduce__(self):
+        return String, (self.value,)
+
+@dataclass(slots=True)
 class Boolean:
     value: bool
 
-@dataclass
+    def __eq__(self, other):
+        if type(other) is not Boolean:
+            return NotImplemented
+        return self.value == other.value
+
+    def __hash__(self):
+        # Not the same as 0 and 1's, true and false don't collide with them
+        return hash(self.value) ^ BOOLEAN_HASH
+
+BOOLEAN_HASH = 0x5bd1e995
+
+@dataclass(slots=True)
 class Function:
     parameters: list[ast.Identifier]
     body: ast.BlockStatement
     env: env.Environment
+    num_locals: int = field(default=0, compare=False)
+    # The body as a Python closure, for closure_compiler
+    compiled: typing.Any = field(default=None, compare=False, repr=False)
+    # From the literal, see mast.FunctionLiteral.escapes
+    escapes: bool = field(default=True, compare=False, repr=False)
+
+@dataclass(slots=True)
+class CompiledFunction:
+    instructions: bytes
+    num_locals: int = 0
+    num_parameters: int = 0
+
+@dataclass(slots=True)
+class Closure:
+    fn: CompiledFunction
+    free: list[Object]
 
-@dataclass
+@dataclass(slots=True)
 class Builtin:
     fn: typing.Any
 
-@dataclass
+@dataclass(slots=True)
 class Array:
-    elements: list[Object]
+    # Always a PersistentVector (an IntVector, for an IntArray), lists get
+    # converted, so push and rest can share structure instead of copying
+    elements: PersistentVector
 
-@dataclass(eq=True, frozen=True)
-class HashKey:
-    type: str
-    value: int
+    def __post_init__(self):
+        if type(self.elements) is not PersistentVector:
+            self.elements = PersistentVector.from_iterable(self.elements)
 
-@dataclass
-class HashPair:
-    key: Object
-    value: Object
+    def __eq__(self, other):
+        # An IntArray is equal to the Array with the same integers
+        if not isinstance(other, Array):
+            return NotImplemented
+        return self.elements == other.elements
+
+@dataclass(slots=True, eq=False)
+class IntArray(Array):
+    # An Array that's all integers, packed, see intvector.py. Anything that
+    # takes an Array takes one of these. Lists get converted.
+    elements: IntVector
+
+    def __post_init__(self):
+        if type(self.elements) is not IntVector:
+            self.elements = IntVector.from_ints(e.value for e in self.elements)
 
-    def __iter__(self):
-        yield self.key, self.value
+def new_array(elements):
+    # The right kind of Array for elements from push or rest, which give
+    # back a PersistentVector once an IntVector gets a non-integer
+    if type(elements) is IntVector:
+        return IntArray(elements)
+    return Array(elements)
 
-@dataclass
+@dataclass(slots=True)
 class Hash:
-    pairs: dict[HashKey, HashPair]
+    # Keyed by the Monkey objects themselves, see HASHABLE
+    pairs: dict[Object, Object]
 
-@dataclass
+@dataclass(slots=True)
 class Null:
     def __repr__(self):
         return "Null"
 
-@dataclass
+@dataclass(slots=True)
 class ReturnValue:
     value: Object
 
-@dataclass
+@dataclass(slots=True)
 class Error:
     message: str
 
 Object = Integer | Boolean | Function | Null
 
+# Preallocated Integers for a range of small values, like CPython does for
+# its ints. Integers are never mutated, so sharing them is safe. Use
+# set_small_int_range to tune it.
+SMALL_INT_MIN = -256
+SMALL_INT_MAX = 4096
+small_ints = [Integer(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+def set_small_int_range(low, high):
+    global SMALL_INT_MIN, SMALL_INT_MAX, small_ints
+    small_ints = [Integer(i) for i in range(low, high + 1)]
+    SMALL_INT_MIN, SMALL_INT_MAX = low, high
+
+def new_integer(value):
+    if SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return small_ints[value - SMALL_INT_MIN]
+    return Integer(value)
+
+# Strings that come straight from literals are interned, so a literal in a
+# hot function isn't a new String every time it's evaluated. Strings built
+# at runtime aren't, there'd be no end to them.
+MAX_INTERNED_STRINGS = 65536
+interned_strings = {}
+
+def intern_string(value):
+    string = interned_strings.get(value)
+    if string is None:
+        if len(interned_strings) >= MAX_INTERNED_STRINGS:
+            interned_strings.clear()
+        string = interned_strings[value] = String(value)
+    return string
+
+def new_string(value):
+    return String(value)
+
+# Strings shorter than this are joined up straight away, a rope costs more
+# than copying them. It's also how long the last piece of a rope gets: a
+# short string on the end of one is copied onto its last piece, rather than
+# being a node of its own, until that's this long.
+ROPE_MIN = 1024
+
+def concat(left, right):
+    if left.length + right.length < ROPE_MIN:
+        return String(left.value + right.value)
+
+    if left._value is None and right.length < ROPE_MIN:
+        last = left.right
+        if last._value is not None and last.length + right.length <= ROPE_MIN:
+            return String(None, left.left, String(last._value + right.value))
+    return String(None, left, right)
+
 def inspect(obj):
     match obj:
         case Integer(x):
@@ -72,17 +224,21 @@ def inspect(obj):
             return x
         case Boolean(x):
             return f"{x}".lower()
-        case Function(parameters, body, env):
+        case Function(parameters, body, _):
             params = [x.value for x in parameters]
             # Oh no, this is gonna look so bad
             return f"fn({','.join(params)}) {body}"
+        case CompiledFunction(_):
+            return f"CompiledFunction[{id(obj):#x}]"
+        case Closure(fn, _):
+            return f"Closure[{id(obj):#x}]"
         case Builtin(_):
             return "builtin function"
         case Array(elements):
-            ele = ", ".join(str(e) for e in elements)
+            ele = ", ".join(inspect(e) for e in elements)
             return f"[{ele}]"
         case Hash(pairs):
-            p = ", ".join(f"{inspect(x.key)!r}:{inspect(x.value)!r}" for x in pairs.values())
+            p = ", ".join(f"{inspect(k)!r}:{inspect(v)!r}" for k, v in pairs.items())
             return f"{{ {p} }}"
         case Null():
             return "null"
@@ -95,12 +251,18 @@ def typeof(obj):
     match obj:
         case Integer(_):
             return "INTEGER"
-        case String(_):
+        case String():
+            # No value, that'd join up a rope
             return "STRING"
         case Boolean(_):
             return "BOOLEAN"
         case Function(_, _, _):
             return "FUNCTION"
+        case CompiledFunction(_):
+            return "COMPILED_FUNCTION"
+        case Closure(_, _):
+            # Same as Function, so errors read the same on either engine
+            return "FUNCTION"
         case Builtin(_):
             return "BUILTIN"
         case Array(_):
@@ -114,9 +276,5 @@ def typeof(obj):
         case Error(_):
             return "ERROR"
 
-def hash_key(obj):
-    match obj:
-        case Boolean(_) | Integer(_) | String(_):
-            return HashKey(typeof(obj), hash(obj.value))
-        case _:
-            return None
\ No newline at end of file
+# The types that can be Hash keys. Check with `type(key) in HASHABLE`.
+HASHABLE = frozenset({Integer, String, Boolean})
\ No newline at end of file
@@ -0,0 +1,194 @@
+from collections import Counter
+
+import mast as ast
+import mobject as obj
+import evaluator
+from evaluator import eval_infix_expression, eval_prefix_expression, is_truthy
+from resolver import let_names
+
+# Optional pass over a resolved program (parse() output) that does work the
+# evaluator would otherwise redo on every run:
+#
+# - Infix and prefix expressions on literals are folded into a literal, using
+#   the evaluator's own functions. Anything that would be an error at runtime
+#   (type mismatches, unknown operators, division by zero) is left alone, so
+#   it still fails the same way, when and if it runs.
+# - An `if` on a literal loses the branch that can't run. If what's left is
+#   a single expression, that replaces the whole `if`.
+# - References to a `let` of a literal are replaced by the literal, as long
+#   as nothing else binds that name in the same scope, the `let` isn't
+#   inside an `if`, and the reference comes after it. That's exactly the
+#   case where the reference can only ever see that value.
+#
+# Globals are inlined too, so this is for whole programs. The REPL can
+# rebind a global on a later line, which would leave earlier inlined copies
+# of it stale.
+
+LITERALS = (ast.IntegerLiteral, ast.StringLiteral, ast.Boolean)
+
+def literal_value(node):
+    match node:
+        case ast.IntegerLiteral(value):
+            return obj.new_integer(value)
+        case ast.StringLiteral(value):
+            return obj.intern_string(value)
+        case ast.Boolean(value):
+            return evaluator.TRUE if value else evaluator.FALSE
+
+def to_literal(value):
+    match value:
+        case obj.Integer(v):
+            return ast.IntegerLiteral(v)
+        case obj.String(v):
+            return ast.StringLiteral(v)
+        case obj.Boolean(v):
+            return ast.Boolean(v)
+    return None
+
+class FunctionScope:
+    def __init__(self, parameters, body):
+        # How many times each name is bound in this function, only names
+        # bound once can be inlined
+        self.bindings = Counter(p.value for p in parameters)
+        self.bindings.update(let_names(body))
+        self.constants = {}  # slot -> literal
+
+class Optimizer:
+    def __init__(self):
+        self.scopes = []
+        self.global_bindings = Counter()
+        self.globals = {}  # name -> literal
+
+    def optimize(self, node):
+        match node:
+            case ast.Program(statements):
+                for s in statements:
+                    self.global_bindings.update(let_names(s))
+                return ast.Program(self.optimize_body(statements))
+
+            case ast.Identifier(value, depth, slot):
+                if depth == ast.GLOBAL_DEPTH:
+                    literal = self.globals.get(value)
+                elif depth is not None and slot is not None and depth < len(self.scopes):
+                    literal = self.scopes[-1 - depth].constants.get(slot)
+                else:
+                    literal = None
+                return literal if literal is not None else node
+
+            case ast.LetStatement(identifier, expr):
+                return ast.LetStatement(identifier, self.optimize(expr), node.line, node.column)
+
+            case ast.FunctionLiteral(parameters, body, num_locals):
+                self.scopes.append(FunctionScope(parameters or [], body))
+                body = ast.BlockStatement(self.optimize_body(body.statements))
+                self.scopes.pop()
+                return ast.FunctionLiteral(parameters, body, num_locals, node.line, node.column, node.escapes)
+
+            case ast.ReturnStatement(expr):
+                return ast.ReturnStatement(self.optimize(expr), node.line, node.column)
+
+            case ast.ExpressionStatement(expr):
+                return ast.ExpressionStatement(self.optimize(expr), node.line, node.column)
+
+            case ast.BlockStatement(statements):
+                return ast.BlockStatement([self.optimize(s) for s in statements])
+
+            case ast.PrefixExpression(operator, right):
+                right = self.optimize(right)
+                if isinstance(right, LITERALS):
+                    folded = fold(eval_prefix_expression, operator, literal_value(right))
+                    if folded is not None:
+                        return folded
+                return ast.PrefixExpression(operator, right)
+
+            case ast.InfixExpression(left, operator, right):
+                left = self.optimize(left)
+                right = self.optimize(right)
+                if isinstance(left, LITERALS) and isinstance(right, LITERALS):
+                    folded = fold(eval_infix_expression, operator, literal_value(left), literal_value(right))
+                    if folded is not None:
+                        return folded
+                return ast.InfixExpression(left, operator, right)
+
+            case ast.IfExpression(condition, consequence, alternative):
+                return self.optimize_if(condition, consequence, alternative)
+
+            case ast.CallExpression(function, arguments):
+                return ast.CallExpression(self.optimize(function), self.optimize_list(arguments), node.line, node.column)
+
+            case ast.ArrayLiteral(elements):
+                return ast.ArrayLiteral(self.optimize_list(elements))
+
+            case ast.HashLiteral(pairs):
+                optimized = { self.optimize(k): self.optimize(v) for k, v in pairs.items() }
+                if len(optimized) != len(pairs):
+                    # Two keys folded into the same literal. They're both
+                    # still meant to be evaluated, so keep the originals.
+                    optimized = { k: self.optimize(v) for k, v in pairs.items() }
+                return ast.HashLiteral(optimized)
+
+            case ast.IndexExpression(left, index):
+                return ast.IndexExpression(self.optimize(left), self.optimize(index))
+
+        # Literals, and the None holes the parser leaves behind on errors
+        return node
+
+    def optimize_list(self, nodes):
+        if nodes is None:
+            return None
+        return [self.optimize(n) for n in nodes]
+
+    def optimize_body(self, statements):
+        # The statements of a program or function body. A `let` here (as
+        # opposed to one inside an `if`) always runs before whatever comes
+        # after it, so that's where constants get picked up.
+        result = []
+        for s in statements:
+            s = self.optimize(s)
+            match s:
+                case ast.LetStatement(identifier, expr) if isinstance(expr, LITERALS):
+                    self.add_constant(identifier, expr)
+            result.append(s)
+        return result
+
+    def add_constant(self, identifier, literal):
+        if not self.scopes:
+            if identifier.depth == ast.GLOBAL_DEPTH and self.global_bindings[identifier.value] == 1:
+                self.globals[identifier.value] = literal
+            return
+
+        scope = self.scopes[-1]
+        if identifier.slot is not None and scope.bindings[identifier.value] == 1:
+            scope.constants[identifier.slot] = literal
+
+    def optimize_if(self, condition, consequence, alternative):
+        condition = self.optimize(condition)
+        consequence = self.optimize(consequence)
+        alternative = self.optimize(alternative)
+
+        if not isinstance(condition, LITERALS):
+            return ast.IfExpression(condition, consequence, alternative)
+
+        if is_truthy(literal_value(condition)):
+            taken = consequence
+        elif alternative is not None:
+            taken = alternative
+        else:
+            # Nothing runs, and the `if` is null
+            return ast.IfExpression(ast.Boolean(False), ast.BlockStatement([]), None)
+
+        match taken:
+            case ast.BlockStatement([ast.ExpressionStatement(expr)]) if expr is not None:
+                return expr
+        return ast.IfExpression(ast.Boolean(True), taken, None)
+
+def fold(fn, *args):
+    try:
+        value = fn(*args)
+    except Exception:
+        # Division by zero, for one. Leave it to blow up at runtime.
+        return None
+    return to_literal(value)
+
+def optimize(program):
+    return Optimizer().optimize(program)
@@ -1,8 +1,9 @@
 from enum import Enum
 
 from tok import TokenType, Token
-from lexer import Lexer
+from lexer import lexers
 from mast import * 
+from resolver import resolve
 
 LOWEST = 1
 EQUALS = 2
@@ -13,6 +14,18 @@ PREFIX = 6
 CALL = 7
 INDEX = 8
 
+# What parse_expression_iteratively does with an operand once it has one.
+# Frames on its stack are tuples tagged with these, then the precedence the
+# operand's surroundings were being parsed at.
+AFTER_PREFIX = 0    # (precedence, operator)
+AFTER_INFIX = 1     # (precedence, left, operator)
+AFTER_GROUP = 2     # (precedence,)
+AFTER_ELEMENT = 3   # (precedence, elements so far)
+AFTER_ARGUMENT = 4  # (precedence, function, arguments so far, "(" token)
+AFTER_INDEX = 5     # (precedence, left)
+AFTER_KEY = 6       # (precedence, pairs so far)
+AFTER_VALUE = 7     # (precedence, pairs so far, key)
+
 # Note to self: Not happy with this, for a variety of reasons:
 # - It just feels like it could be organized and/or expressed better.
 # - I don't know what `return None` is doing in most cases. They show up when
@@ -23,10 +36,36 @@ INDEX = 8
 # - It's probably too general for this project, but maybe consider accepting
 #   configuration parameters for the parser.
 
+# What the parser does about syntax errors:
+#
+# - "continue" records them in Parser.errors and carries on, leaving None
+#   holes in the tree where something didn't parse. The original behaviour.
+# - "raise" stops at the first one and raises it, so a big bad input isn't
+#   parsed (or run) any further than it has to be.
+# - "recover" records them, then skips to the end of the statement they're
+#   in (its `;`, or the `}` of the block it's in) and carries on from the
+#   next one. Statements with errors are left out of the tree, and there's
+#   one error per bad statement instead of a cascade. See check().
+ON_ERROR = ("continue", "raise", "recover")
+
+class ParseError(Exception):
+    def __init__(self, message, line=0, column=0):
+        super().__init__(message, line, column)
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return f"line {self.line}, column {self.column}: {self.message}"
+
 class Parser:
-    def __init__(self, lexer):
+    def __init__(self, lexer, iterative=False, on_error="continue"):
+        if on_error not in ON_ERROR:
+            raise ValueError(f"on_error should be one of {', '.join(ON_ERROR)}, not {on_error!r}")
+
         self.lexer = lexer
         self.errors = []
+        self.on_error = on_error
         self.current = self.lexer.next_token()
         self.peek = self.lexer.next_token()
         self.prefix_parse_fns = {}
@@ -56,8 +95,30 @@ class Parser:
         self.register_infix(TokenType.LPAREN, self.parse_call_expression)
         self.register_infix(TokenType.LBRACKET, self.parse_index_expression)
 
+        # Everything that parses a subexpression goes through
+        # self.parse_expression, so this switches them all over
+        if iterative:
+            self.parse_expression = self.parse_expression_iteratively
+
+        if on_error == "recover":
+            # Braces open at the current token, and whether synchronize()
+            # left the parser at the token after the statement instead of
+            # its last one
+            self.depth = 1 if self.current_token_is(TokenType.LBRACE) else 0
+            self.hold = False
+            self.next_token = self.next_token_counting
+            self.parse_statement = self.parse_statement_recovering
+
     def __iter__(self):
-        yield from self.parse_program()
+        # Statements as they're parsed, with tokens pulled from the lexer
+        # as needed, so a big file never has to be in memory all at once.
+        # These haven't been through the resolver, that needs the whole
+        # program.
+        while self.current.type != TokenType.EOF:
+            s = self.parse_statement()
+            if s is not None:
+                yield s
+            self.advance()
 
     def register_prefix(self, tokentype, fn):
         self.prefix_parse_fns[tokentype] = fn
@@ -69,6 +130,21 @@ class Parser:
         self.current = self.peek
         self.peek = self.lexer.next_token()
 
+    def next_token_counting(self):
+        self.current = self.peek
+        self.peek = self.lexer.next_token()
+        if self.current.type is TokenType.LBRACE:
+            self.depth += 1
+        elif self.current.type is TokenType.RBRACE and self.depth > 0:
+            self.depth -= 1
+
+    def advance(self):
+        # From the last token of a statement to the first of the next
+        if self.on_error == "recover" and self.hold:
+            self.hold = False
+        else:
+            self.next_token()
+
     def current_token_is(self, tokentype):
         return self.current.type == tokentype
 
@@ -90,16 +166,17 @@ class Parser:
         return precedences.get(self.current.type, LOWEST)
 
     def peek_error(self, tokentype):
-        self.errors.append(f'expected next token to be {self.peek.type}, got {tokentype} instead')
+        self.error(f'expected next token to be {tokentype}, got {self.peek.type} instead', self.peek)
+
+    def error(self, message, token):
+        error = ParseError(message, token.line, token.column)
+        if self.on_error != "continue":
+            # Caught by parse_statement_recovering when recovering
+            raise error
+        self.errors.append(error)
 
     def parse_program(self):
-        statements = []
-        while self.current.type != TokenType.EOF:
-            s = self.parse_statement()
-            if s is not None:
-                statements.append(s)
-            self.next_token()
-        return Program(statements)
+        return Program(list(self))
     
     def parse_statement(self):
         match self.current.type:
@@ -110,7 +187,37 @@ class Parser:
             case _:
                 return self.parse_expression_statement()
 
+    def parse_statement_recovering(self):
+        depth = self.depth
+        if self.current_token_is(TokenType.LBRACE):
+            # That one's the statement's own
+            depth -= 1
+        try:
+            return Parser.parse_statement(self)
+        except ParseError as error:
+            self.errors.append(error)
+            self.synchronize(depth)
+            return None
+
+    def synchronize(self, depth):
+        # Skips what's left of a statement that didn't parse, which started
+        # with `depth` braces open. It ends at a `;`, or just before the `}`
+        # that closes the block it's in. Braces it opened itself (say, a
+        # hash literal it didn't get to the end of) don't count.
+        while True:
+            tokentype = self.current.type
+            if tokentype is TokenType.EOF or (tokentype is TokenType.RBRACE and self.depth < depth):
+                # Already past the end, the error was on that token
+                self.hold = True
+                return
+            if tokentype is TokenType.SEMICOLON and self.depth == depth:
+                return
+            if self.peek.type is TokenType.RBRACE and self.depth == depth and depth > 0:
+                return
+            self.next_token()
+
     def parse_let_statement(self):
+        start = self.current
         if not self.expect_peek(TokenType.IDENT):
             return None
         
@@ -125,9 +232,10 @@ class Parser:
         if self.peek_token_is(TokenType.SEMICOLON):
             self.next_token()
 
-        return LetStatement(identifier, expr)
+        return LetStatement(identifier, expr, start.line, start.column)
     
     def parse_return_statement(self):
+        start = self.current
         self.next_token()
 
         expr = self.parse_expression(LOWEST)
@@ -135,15 +243,16 @@ class Parser:
         if self.peek_token_is(TokenType.SEMICOLON):
             self.next_token()
         
-        return ReturnStatement(expr)
+        return ReturnStatement(expr, start.line, start.column)
     
     def parse_expression_statement(self):
+        start = self.current
         expr = self.parse_expression(LOWEST)
 
         if self.peek_token_is(TokenType.SEMICOLON):
             self.next_token()
 
-        return ExpressionStatement(expr)
+        return ExpressionStatement(expr, start.line, start.column)
     
     def parse_block_statement(self):
         statements = []
@@ -154,14 +263,14 @@ class Parser:
             st = self.parse_statement()
             if st:
                 statements.append(st)
-            self.next_token()
+            self.advance()
         
         return BlockStatement(statements)
 
     def parse_expression(self, precedence):
         prefix = self.prefix_parse_fns.get(self.current.type, None)
         if prefix is None:
-            self.errors.append(f'No prefix parse function for {self.current.type} found')
+            self.error(f'No prefix parse function for {self.current.type} found', self.current)
             return None
         left_expr = prefix()
 
@@ -175,6 +284,156 @@ class Parser:
         
         return left_expr
     
+    def parse_expression_iteratively(self, precedence):
+        # parse_expression without the recursion: operators, groups, calls,
+        # indexes, arrays and hashes keep what they're waiting for on a
+        # stack instead of in Python frames, so nesting them is only limited
+        # by memory. The trees (and errors) are the same as parse_expression
+        # gives. Ifs and function literals still parse their blocks
+        # recursively, it's expressions that get deep.
+        stack = []
+        push = stack.append
+        peek_is = self.peek_token_is
+
+        while True:
+            # At the start of an operand
+            tokentype = self.current.type
+            extend = True
+
+            if tokentype is TokenType.BANG or tokentype is TokenType.MINUS:
+                push((AFTER_PREFIX, precedence, self.current.text))
+                precedence = PREFIX
+                self.next_token()
+                continue
+
+            if tokentype is TokenType.LPAREN:
+                push((AFTER_GROUP, precedence))
+                precedence = LOWEST
+                self.next_token()
+                continue
+
+            if tokentype is TokenType.LBRACKET and not peek_is(TokenType.RBRACKET):
+                push((AFTER_ELEMENT, precedence, []))
+                precedence = LOWEST
+                self.next_token()
+                continue
+
+            if tokentype is TokenType.LBRACE and not peek_is(TokenType.RBRACE):
+                push((AFTER_KEY, precedence, {}))
+                precedence = LOWEST
+                self.next_token()
+                continue
+
+            prefix = self.prefix_parse_fns.get(tokentype, None)
+            if prefix is None:
+                self.error(f'No prefix parse function for {tokentype} found', self.current)
+                left = None
+                # parse_expression gives up on this operand without looking
+                # for operators after it
+                extend = False
+            else:
+                left = prefix()
+
+            # Have an operand. Either an operator binds it tighter than its
+            # surroundings, which starts another operand, or it's done and
+            # goes to the frame on top of the stack.
+            while True:
+                tokentype = self.peek.type
+                if extend and tokentype is not TokenType.SEMICOLON and precedence < precedences.get(tokentype, LOWEST):
+                    if tokentype is TokenType.LPAREN:
+                        self.next_token()
+                        start = self.current
+                        if peek_is(TokenType.RPAREN):
+                            self.next_token()
+                            left = CallExpression(left, [], start.line, start.column)
+                            continue
+                        push((AFTER_ARGUMENT, precedence, left, [], start))
+                        precedence = LOWEST
+                        self.next_token()
+                        break
+
+                    if tokentype is TokenType.LBRACKET:
+                        self.next_token()
+                        push((AFTER_INDEX, precedence, left))
+                        precedence = LOWEST
+                        self.next_token()
+                        break
+
+                    if tokentype in self.infix_parse_fns:
+                        self.next_token()
+                        push((AFTER_INFIX, precedence, left, self.current.text))
+                        precedence = self.current_precedence()
+                        self.next_token()
+                        break
+
+                extend = True
+                if not stack:
+                    return left
+
+                frame = stack.pop()
+                tag = frame[0]
+                precedence = frame[1]
+
+                if tag == AFTER_INFIX:
+                    left = InfixExpression(frame[2], frame[3], left)
+
+                elif tag == AFTER_PREFIX:
+                    left = PrefixExpression(frame[2], left)
+
+                elif tag == AFTER_GROUP:
+                    if not self.expect_peek(TokenType.RPAREN):
+                        left = None
+
+                elif tag == AFTER_ARGUMENT or tag == AFTER_ELEMENT:
+                    items = frame[3] if tag == AFTER_ARGUMENT else frame[2]
+                    items.append(left)
+                    if peek_is(TokenType.COMMA):
+                        self.next_token()
+                        self.next_token()
+                        push(frame)
+                        precedence = LOWEST
+                        break
+
+                    if tag == AFTER_ARGUMENT:
+                        if not self.expect_peek(TokenType.RPAREN):
+                            items = None
+                        start = frame[4]
+                        left = CallExpression(frame[2], items, start.line, start.column)
+                    else:
+                        if not self.expect_peek(TokenType.RBRACKET):
+                            items = None
+                        left = ArrayLiteral(items)
+
+                elif tag == AFTER_INDEX:
+                    if self.expect_peek(TokenType.RBRACKET):
+                        left = IndexExpression(frame[2], left)
+                    else:
+                        left = None
+
+                elif tag == AFTER_KEY:
+                    if self.expect_peek(TokenType.COLON):
+                        self.next_token()
+                        push((AFTER_VALUE, precedence, frame[2], left))
+                        precedence = LOWEST
+                        break
+                    left = None
+
+                elif tag == AFTER_VALUE:
+                    pairs = frame[2]
+                    if not (peek_is(TokenType.RBRACE) or self.expect_peek(TokenType.COMMA)):
+                        left = None
+                        continue
+
+                    pairs[frame[3]] = left
+                    if not peek_is(TokenType.RBRACE):
+                        self.next_token()
+                        push((AFTER_KEY, precedence, pairs))
+                        precedence = LOWEST
+                        break
+
+                    self.next_token()
+                    left = HashLiteral(pairs)
+
     def parse_identifier(self):
         return Identifier(self.current.text)
     
@@ -182,7 +441,7 @@ class Parser:
         try:
             value = int(self.current.text)
         except ValueError:
-            self.errors.append(f'Could not parse {self.current.text!r} as integer')
+            self.error(f'Could not parse {self.current.text!r} as integer', self.current)
             return None
         else:
             return IntegerLiteral(value)
@@ -191,6 +450,7 @@ class Parser:
         return StringLiteral(self.current.text)
     
     def parse_function_literal(self):
+        start = self.current
         if not self.expect_peek(TokenType.LPAREN):
             return None
         
@@ -201,7 +461,7 @@ class Parser:
         
         body = self.parse_block_statement()
 
-        return FunctionLiteral(parameters, body)
+        return FunctionLiteral(parameters, body, 0, start.line, start.column)
     
     def parse_function_parameters(self):
         identifiers = []
@@ -261,6 +521,7 @@ class Parser:
     def parse_expression_list(self, end):
         elements = []
         if self.peek_token_is(end):
+            self.next_token()
             return elements
         
         self.next_token()
@@ -277,9 +538,11 @@ class Parser:
         return elements
 
     def parse_call_expression(self, function):
+        # Positioned at the "(", the callee could be any expression
+        start = self.current
         # arguments = self.parse_call_arguments()
         arguments = self.parse_expression_list(TokenType.RPAREN)
-        return CallExpression(function, arguments)
+        return CallExpression(function, arguments, start.line, start.column)
     
     def parse_call_arguments(self):
         args = []
@@ -350,8 +613,18 @@ class Parser:
         return InfixExpression(left, operator, right)    
 
 
-def parse(text):
-    return Parser(Lexer(text)).parse_program()
+def parse(source, backend="char", iterative=False, on_error="continue"):
+    # source is anything Lexer takes: a str, a file, an mmap. backend picks
+    # the lexer, see lexer.lexers. iterative picks the parser that doesn't
+    # recurse on nested expressions. on_error is one of ON_ERROR.
+    return resolve(Parser(lexers[backend](source), iterative, on_error).parse_program())
+
+def check(source, backend="char"):
+    # Every syntax error in source, in one pass, for linters and editors
+    parser = Parser(lexers[backend](source), on_error="recover")
+    for _ in parser:
+        pass
+    return parser.errors
 
 precedences = dict([
     (TokenType.EQ, EQUALS),
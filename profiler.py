@@ -0,0 +1,182 @@
+import sys
+import threading
+from collections import Counter
+
+import mast as ast
+import evaluator
+from environment import Environment
+from mbuiltins import builtinfns
+
+# Sampling profiler for programs run by evaluator.Eval. A background thread
+# wakes up every `interval` seconds, looks at the Python stack of the thread
+# running the program, and works out which Monkey functions are on it:
+#
+# - An Eval frame whose node is a function's body is where that function
+#   was entered, so it starts a new Monkey frame.
+# - The innermost node with a source position (a statement or a call) below
+#   that is the line the function is on.
+# - Frames of builtins get a frame of their own.
+#
+# Python stacks are walked with nothing added to the evaluator, so a program
+# that isn't being profiled doesn't pay anything for it. Functions are named
+# after the `let` they're bound by, anonymous ones are just "fn", with the
+# line they're defined on to tell them apart.
+
+MAIN = "<main>"
+DEFAULT_INTERVAL = 0.001
+
+EVAL_CODE = evaluator.Eval.__code__
+BUILTIN_CODES = {
+    builtin.fn.__code__: f"builtin {name}"
+    for name, builtin in builtinfns.items()
+    if hasattr(builtin.fn, "__code__")
+}
+
+def function_names(node, name="fn", names=None):
+    # id() of each function body -> (name, line it's defined on)
+    if names is None:
+        names = {}
+
+    match node:
+        case ast.Program(statements) | ast.BlockStatement(statements):
+            for s in statements:
+                function_names(s, names=names)
+        case ast.LetStatement(identifier, expr):
+            function_names(expr, identifier.value, names)
+        case ast.ExpressionStatement(expr) | ast.ReturnStatement(expr):
+            function_names(expr, names=names)
+        case ast.FunctionLiteral(_, body, _):
+            names[id(body)] = (f"{name}:{node.line}", node.line)
+            function_names(body, names=names)
+        case ast.IfExpression(condition, consequence, alternative):
+            for n in (condition, consequence, alternative):
+                function_names(n, names=names)
+        case ast.PrefixExpression(_, right):
+            function_names(right, names=names)
+        case ast.InfixExpression(left, _, right):
+            function_names(left, names=names)
+            function_names(right, names=names)
+        case ast.CallExpression(function, arguments):
+            for n in [function, *(arguments or [])]:
+                function_names(n, names=names)
+        case ast.ArrayLiteral(elements):
+            for n in elements or []:
+                function_names(n, names=names)
+        case ast.HashLiteral(pairs):
+            for k, v in pairs.items():
+                function_names(k, names=names)
+                function_names(v, names=names)
+        case ast.IndexExpression(left, index):
+            function_names(left, names=names)
+            function_names(index, names=names)
+
+    return names
+
+class Profiler:
+    def __init__(self, program, interval=DEFAULT_INTERVAL):
+        self.program = program
+        self.interval = interval
+        self.names = function_names(program)
+        self.samples = 0
+        self.stacks = Counter()  # (function, ...) outermost first -> samples
+        self.lines = Counter()   # (function, line) -> samples
+
+    def run(self, env=None):
+        if env is None:
+            env = Environment()
+
+        target = threading.get_ident()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self.sample_thread, args=(target, stop), daemon=True)
+
+        # The sampler only gets to run when the evaluating thread lets go of
+        # the GIL, which by default is every 5ms
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval))
+        sampler.start()
+        try:
+            return evaluator.Eval(env, self.program)
+        finally:
+            stop.set()
+            sampler.join()
+            sys.setswitchinterval(switch_interval)
+
+    def sample_thread(self, target, stop):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                self.sample(frame)
+
+    def sample(self, frame):
+        # Walks from the innermost frame out, so everything's backwards
+        # until the end
+        stack = []
+        line = 0
+        while frame is not None:
+            code = frame.f_code
+            if code is EVAL_CODE:
+                node = frame.f_locals.get("node")
+                function = self.names.get(id(node))
+                if function is not None:
+                    # Not into the body's first statement yet, that's
+                    # still the line with the `fn` on it
+                    name, defined = function
+                    stack.append((name, line or defined))
+                    line = 0
+                elif not line:
+                    line = getattr(node, "line", 0)
+            elif code in BUILTIN_CODES:
+                stack.append((BUILTIN_CODES[code], line))
+                line = 0
+            frame = frame.f_back
+
+        # Frames from before the program started (the profiler's own, and
+        # whoever called it) don't have Eval in them, so they're ignored
+        stack.append((MAIN, line))
+        stack.reverse()
+
+        self.samples += 1
+        self.stacks[tuple(name for name, _ in stack)] += 1
+        self.lines[stack[-1]] += 1
+
+    def collapsed(self):
+        # One line per distinct stack, the format flamegraph.pl and
+        # speedscope read
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def functions(self):
+        # function -> (self samples, cumulative samples). A recursive
+        # function counts once per sample toward its cumulative time.
+        self_samples = Counter()
+        cumulative = Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack[-1]] += count
+            for name in set(stack):
+                cumulative[name] += count
+        return {name: (self_samples[name], cumulative[name]) for name in cumulative}
+
+    def top(self, n=10):
+        functions = sorted(self.functions().items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+        return [(name, s, c) for name, (s, c) in functions[:n]]
+
+    def top_lines(self, n=10):
+        return [(name, line, count) for (name, line), count in self.lines.most_common(n)]
+
+    def report(self, n=10):
+        total = self.samples or 1
+        out = [f"{self.samples} samples every {self.interval * 1000:g}ms", ""]
+
+        out.append(f"{'self':>7} {'cumulative':>11}  function")
+        for name, s, c in self.top(n):
+            out.append(f"{s / total:7.1%} {c / total:11.1%}  {name}")
+
+        out.append("")
+        out.append(f"{'self':>7}  line")
+        for name, line, count in self.top_lines(n):
+            out.append(f"{count / total:7.1%}  {line:>5}  {name}")
+
+        return "\n".join(out)
+
+def profile(program, env=None, interval=DEFAULT_INTERVAL):
+    profiler = Profiler(program, interval)
+    return profiler.run(env), profiler
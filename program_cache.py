@@ -0,0 +1,152 @@
+import hashlib
+import os
+import pickle
+import struct
+import sys
+import tempfile
+from collections import OrderedDict
+
+from parser import parse
+
+# Parsed programs, keyed by a hash of their source. Kept in memory (least
+# recently used go first) and, given a directory, on disk as well, the same
+# idea as __pycache__.
+#
+# A cache file is a fixed header followed by the pickled mast.Program:
+#
+#   magic        4 bytes   b"MKYC"
+#   format       2 bytes   FORMAT_VERSION, big endian
+#   interpreter  32 bytes  interpreter_version()
+#   source hash  32 bytes  sha256 of the parser's on_error mode and the
+#                          source text, see source_hash()
+#   payload      the rest  pickle of the resolved Program
+#
+# Anything that doesn't match (another format, another interpreter, a file
+# that was cut short) is a miss, and gets overwritten.
+
+MAGIC = b"MKYC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">4sH32s32s")
+CACHE_DIRECTORY = "__monkeycache__"
+
+# The modules that decide what parse() gives back. If any of them change,
+# so does the interpreter version, and old cache files stop matching.
+PARSER_MODULES = ["tok", "lexer", "parser", "mast", "resolver", "program_cache"]
+
+_interpreter_version = None
+
+def interpreter_version():
+    global _interpreter_version
+    if _interpreter_version is None:
+        h = hashlib.sha256(sys.version.encode())
+        for name in PARSER_MODULES:
+            with open(sys.modules[name].__file__, "rb") as f:
+                h.update(f.read())
+        _interpreter_version = h.digest()
+    return _interpreter_version
+
+def source_hash(source, on_error="continue"):
+    # The same source parses differently in "recover" mode, and a broken
+    # program parsed with "continue" isn't what "raise" should get back
+    h = hashlib.sha256(on_error.encode())
+    h.update(b"\0")
+    h.update(source.encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+class ProgramCache:
+    def __init__(self, directory=None, maxsize=128, on_error="continue"):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.on_error = on_error
+        self.programs = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def parse(self, source):
+        key = source_hash(source, self.on_error)
+
+        program = self.programs.get(key)
+        if program is not None:
+            self.programs.move_to_end(key)
+            self.hits += 1
+            return program
+
+        program = self.load(key)
+        if program is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            # With on_error="raise", a syntax error goes straight out of
+            # here and nothing gets cached
+            program = parse(source, on_error=self.on_error)
+            self.store(key, program)
+
+        self.programs[key] = program
+        if len(self.programs) > self.maxsize:
+            self.programs.popitem(last=False)
+        return program
+
+    def path(self, key):
+        return os.path.join(self.directory, key.hex() + ".mkc")
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        if len(data) < HEADER.size:
+            return None
+        magic, version, interpreter, stored_key = HEADER.unpack_from(data)
+        if (magic, version, interpreter, stored_key) != (MAGIC, FORMAT_VERSION, interpreter_version(), key):
+            return None
+
+        try:
+            return pickle.loads(data[HEADER.size:])
+        except Exception:
+            return None
+
+    def store(self, key, program):
+        if self.directory is None:
+            return
+
+        # Very deeply nested programs can be too much for pickle. They still
+        # get cached in memory, there's just no file.
+        try:
+            payload = pickle.dumps(program, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return
+
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, interpreter_version(), key)
+
+        # Write to a temporary file and rename it into place, so another
+        # process never sees half a cache file
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(payload)
+            os.replace(temp, self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        self.programs.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self.programs),
+        }
+
+def cache_directory(path):
+    # Next to the script, like __pycache__
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRECTORY)
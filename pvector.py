@@ -0,0 +1,137 @@
+from itertools import islice
+
+# Persistent vector, the same shape as Clojure's: a 32-way trie of tuples
+# plus a separate tail of up to 32 elements. Nothing is ever modified in
+# place, "changes" give back a new vector sharing all but one path with the
+# old one, so push is O(log32 n) and copies at most a few 32-tuples.
+#
+# `start` makes a vector a view that skips its first elements, which is how
+# rest() gets to be O(1).
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+class PersistentVector:
+    __slots__ = ("count", "shift", "root", "tail", "start")
+
+    def __init__(self, count=0, shift=BITS, root=(), tail=(), start=0):
+        self.count = count
+        self.shift = shift
+        self.root = root
+        self.tail = tail
+        self.start = start
+
+    @classmethod
+    def from_iterable(cls, items):
+        items = tuple(items)
+        count = len(items)
+        if count == 0:
+            return EMPTY
+
+        # Everything except the last (1 to 32) elements goes in the trie,
+        # built bottom up a level at a time
+        tail_offset = ((count - 1) >> BITS) << BITS
+        nodes = [items[i : i + WIDTH] for i in range(0, tail_offset, WIDTH)]
+        shift = BITS
+        while len(nodes) > WIDTH:
+            nodes = [tuple(nodes[i : i + WIDTH]) for i in range(0, len(nodes), WIDTH)]
+            shift += BITS
+
+        return cls(count, shift, tuple(nodes), items[tail_offset:])
+
+    def tail_offset(self):
+        if self.count < WIDTH:
+            return 0
+        return ((self.count - 1) >> BITS) << BITS
+
+    def __len__(self):
+        return self.count - self.start
+
+    def __getitem__(self, index):
+        size = self.count - self.start
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError("vector index out of range")
+
+        i = index + self.start
+        offset = self.tail_offset()
+        if i >= offset:
+            return self.tail[i - offset]
+
+        node = self.root
+        level = self.shift
+        while level > 0:
+            node = node[(i >> level) & MASK]
+            level -= BITS
+        return node[i & MASK]
+
+    def __iter__(self):
+        return islice(self.leaves(), self.start, None)
+
+    def leaves(self):
+        def walk(node, level):
+            if level == 0:
+                yield from node
+            else:
+                for child in node:
+                    yield from walk(child, level - BITS)
+
+        yield from walk(self.root, self.shift)
+        yield from self.tail
+
+    def push(self, value):
+        count = self.count
+
+        # Room in the tail, which is the common case
+        if count - self.tail_offset() < WIDTH:
+            return PersistentVector(count + 1, self.shift, self.root, self.tail + (value,), self.start)
+
+        # Full tail goes into the trie. If the trie's full too, it grows a
+        # level on top.
+        if (count >> BITS) > (1 << self.shift):
+            root = (self.root, new_path(self.shift, self.tail))
+            shift = self.shift + BITS
+        else:
+            root = push_tail(count, self.shift, self.root, self.tail)
+            shift = self.shift
+
+        return PersistentVector(count + 1, shift, root, (value,), self.start)
+
+    def rest(self):
+        if len(self) == 0:
+            return self
+        return PersistentVector(self.count, self.shift, self.root, self.tail, self.start + 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, (PersistentVector, list, tuple)):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        # Looks like the list it replaced, so Array reprs didn't change
+        return repr(list(self))
+
+def new_path(level, node):
+    while level > 0:
+        node = (node,)
+        level -= BITS
+    return node
+
+def push_tail(count, level, parent, tail):
+    subidx = ((count - 1) >> level) & MASK
+    if level == BITS:
+        child = tail
+    elif subidx < len(parent):
+        child = push_tail(count, level - BITS, parent[subidx], tail)
+    else:
+        child = new_path(level - BITS, tail)
+
+    return parent[:subidx] + (child,) + parent[subidx + 1:]
+
+EMPTY = PersistentVector()
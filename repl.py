@@ -1,30 +1,169 @@
 import sys
+import argparse
 
 from lexer import lex
-from parser import parse
+from parser import ParseError, parse, check
 from evaluator import Eval
-from mobject import inspect
+from closure_compiler import evaluate
+import stack_evaluator
+from mobject import inspect, Error
 from environment import Environment
+from compiler import Compiler, CompileError, compile
+from vm import VM, GLOBALS_SIZE
+from program_cache import ProgramCache, cache_directory
+from optimizer import optimize
+from profiler import Profiler
+import budget
 
-def start():
+ENGINES = ("eval", "closure", "stack", "vm")
+
+def start(engine="eval"):
+    match engine:
+        case "vm":
+            start_vm()
+        case "closure":
+            start_eval(evaluate)
+        case "stack":
+            start_eval(stack_evaluator.evaluate)
+        case _:
+            start_eval(Eval)
+
+def start_eval(Eval=Eval):
     env = Environment()
     while True:
         line = input(">> ")
 
         if line == "":
             return
-        
+
         evaluated = Eval(env, parse(line))
 
         if evaluated:
             print(inspect(evaluated))
 
+def start_vm():
+    compiler = Compiler()
+    globals = [None] * GLOBALS_SIZE
+    while True:
+        line = input(">> ")
+
+        if line == "":
+            return
+
+        # Carry the symbol table and constants over, so earlier lines'
+        # globals still resolve to the same slots.
+        compiler = Compiler(compiler.symbol_table, compiler.constants)
+        try:
+            compiler.compile(parse(line))
+        except CompileError as e:
+            print(inspect(Error(str(e))))
+            continue
+
+        evaluated = VM(compiler.bytecode(), globals).run()
+
+        if evaluated:
+            print(inspect(evaluated))
+
+def run_file(path, engine="eval", cache=True, optimized=False, profile=None, limits=None):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+
+    # Nothing runs if the script doesn't parse, so there's no point going
+    # past the first syntax error
+    try:
+        if cache:
+            program = ProgramCache(cache_directory(path), on_error="raise").parse(source)
+        else:
+            program = parse(source, on_error="raise")
+    except ParseError as e:
+        print(f"{path}: {e}", file=sys.stderr)
+        return 1
+
+    if optimized:
+        program = optimize(program)
+
+    match engine:
+        case "vm":
+            try:
+                evaluated = VM(compile(program)).run()
+            except CompileError as e:
+                evaluated = Error(str(e))
+        case "closure":
+            evaluated = evaluate(Environment(), program)
+        case "stack":
+            evaluated = stack_evaluator.evaluate(Environment(), program)
+        case _ if profile:
+            # Collapsed stacks to the file, the summary to stderr
+            profiler = Profiler(program)
+            evaluated = profiler.run()
+            with open(profile, "w", encoding="utf-8") as f:
+                f.write(profiler.collapsed())
+            print(profiler.report(), file=sys.stderr)
+        case _ if limits:
+            evaluated, context = budget.run(program, limits)
+            counters = context.counters()
+            del counters["exceeded"]
+            counters["seconds"] = round(counters["seconds"], 3)
+            print(", ".join(f"{k}={v}" for k, v in counters.items()), file=sys.stderr)
+        case _:
+            evaluated = Eval(Environment(), program)
+
+    if isinstance(evaluated, Error):
+        print(inspect(evaluated), file=sys.stderr)
+        return 1
+    return 0
+
+def check_file(path):
+    # All of a script's syntax errors, without running it
+    with open(path, encoding="utf-8") as f:
+        errors = check(f.read())
+
+    for e in errors:
+        print(f"{path}: {e}", file=sys.stderr)
+    return 1 if errors else 0
+
 if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("file", nargs="?", help="script to run instead of starting the REPL")
+    argparser.add_argument("--engine", choices=ENGINES, default="eval")
+    argparser.add_argument("--no-cache", action="store_true",
+                           help="don't read or write parsed scripts in __monkeycache__")
+    argparser.add_argument("-O", "--optimize", action="store_true",
+                           help="fold constants before running the script")
+    argparser.add_argument("--check", action="store_true",
+                           help="report every syntax error in the script instead of running it")
+    argparser.add_argument("--profile", metavar="OUT",
+                           help="sample the script while it runs (eval engine only) and write "
+                                "flamegraph-style collapsed stacks to OUT")
+    argparser.add_argument("--max-steps", type=int, help="stop the script after this many evaluated nodes")
+    argparser.add_argument("--max-memory", type=int, metavar="BYTES",
+                           help="stop the script once it has allocated about this much")
+    argparser.add_argument("--timeout", type=float, metavar="SECONDS",
+                           help="stop the script after this long")
+    args = argparser.parse_args()
+
+    limits = None
+    if args.max_steps is not None or args.max_memory is not None or args.timeout is not None:
+        limits = budget.Budget(args.max_steps, args.max_memory, args.timeout)
+        if not args.file or args.engine != "eval" or args.profile:
+            argparser.error("budgets need a script and the eval engine, without --profile")
+
+    if args.profile and (not args.file or args.engine != "eval"):
+        argparser.error("--profile needs a script and the eval engine")
+
+    if args.check:
+        if not args.file:
+            argparser.error("--check needs a script")
+        sys.exit(check_file(args.file))
+
+    if args.file:
+        sys.exit(run_file(args.file, args.engine, not args.no_cache, args.optimize, args.profile, limits))
+
     print("Hello! This is the Monkey programming language!")
     print("Feel free to type in commands.")
 
     try:
-        start()
+        start(args.engine)
     except KeyboardInterrupt:
         print("Quitting. Goodbye!")
-        sys.exit(0)
\ No newline at end of file
+        sys.exit(0)
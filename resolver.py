@@ -0,0 +1,188 @@
+import mast as ast
+
+# Works out, once, where every identifier lives so the evaluator doesn't
+# have to go looking through Environment chains on every read.
+#
+# - Globals stay name-based (the REPL keeps adding to them between parses),
+#   and are marked with GLOBAL_DEPTH.
+# - Everything bound inside a function (parameters and `let`s, including
+#   those in nested if blocks) gets a slot in that function's frame.
+#   References get (depth, slot), depth counting function scopes outward.
+#
+# Within a function, a reference only sees the lets that come before it,
+# same as the evaluator. A nested function sees all of the enclosing
+# function's lets, since by the time it's called they've usually run.
+# "Usually" isn't always: the let may be in an if that didn't run, or come
+# after the call. So a slot reference also carries a fallback, what the name
+# resolves to without that binding, for when the slot turns out empty.
+
+class Scope:
+    def __init__(self, names):
+        self.slots = {}
+        self.declared = set()
+        # Whether the function makes any functions, see
+        # ast.FunctionLiteral.escapes
+        self.escapes = False
+        for name in names:
+            self.slots.setdefault(name, len(self.slots))
+
+class Resolver:
+    def __init__(self):
+        self.scopes = []
+
+    def resolve(self, node):
+        match node:
+            case ast.Program(statements):
+                return ast.Program([self.resolve(s) for s in statements])
+
+            case ast.Identifier(value):
+                return self.resolve_identifier(value)
+
+            case ast.LetStatement(identifier, expr):
+                expr = self.resolve(expr)
+                if not self.scopes:
+                    return ast.LetStatement(ast.Identifier(identifier.value, ast.GLOBAL_DEPTH), expr, node.line, node.column)
+
+                scope = self.scopes[-1]
+                scope.declared.add(identifier.value)
+                slot = scope.slots[identifier.value]
+                return ast.LetStatement(ast.Identifier(identifier.value, 0, slot), expr, node.line, node.column)
+
+            case ast.FunctionLiteral(parameters, body):
+                if self.scopes:
+                    self.scopes[-1].escapes = True
+                parameters = parameters or []
+                names = [p.value for p in parameters] + list(let_names(body))
+                scope = Scope(names)
+                self.scopes.append(scope)
+
+                params = []
+                for p in parameters:
+                    scope.declared.add(p.value)
+                    params.append(ast.Identifier(p.value, 0, scope.slots[p.value]))
+                body = self.resolve(body)
+
+                self.scopes.pop()
+                return ast.FunctionLiteral(params, body, len(scope.slots), node.line, node.column, scope.escapes)
+
+            case ast.ReturnStatement(expr):
+                return ast.ReturnStatement(self.resolve(expr), node.line, node.column)
+
+            case ast.ExpressionStatement(expr):
+                return ast.ExpressionStatement(self.resolve(expr), node.line, node.column)
+
+            case ast.BlockStatement(statements):
+                return ast.BlockStatement([self.resolve(s) for s in statements])
+
+            case ast.PrefixExpression() | ast.InfixExpression() | ast.CallExpression() | \
+                 ast.ArrayLiteral() | ast.HashLiteral() | ast.IndexExpression():
+                return self.resolve_expression(node)
+
+            case ast.IfExpression(condition, consequence, alternative):
+                return ast.IfExpression(
+                    self.resolve(condition),
+                    self.resolve(consequence),
+                    self.resolve(alternative))
+
+        # Literals, and the None holes the parser leaves behind on errors
+        return node
+
+    def resolve_expression(self, node):
+        # resolve() for the expressions that nest: operators, calls,
+        # indexes, arrays and hashes. They keep what they're waiting for on
+        # a stack instead of in Python frames, like the iterative parser,
+        # so however deep that parsed, this resolves. Children are still
+        # resolved in order, lets in ifs in there can come before a use.
+        results = []
+        work = [node]
+        while work:
+            item = work.pop()
+            if type(item) is tuple:
+                # All of node's children are resolved, at the end of results
+                node, count = item
+                children = results[len(results) - count:]
+                del results[len(results) - count:]
+                results.append(rebuild(node, children))
+            elif type(item) in NESTED:
+                children = children_of(item)
+                work.append((item, len(children)))
+                work.extend(reversed(children))
+            else:
+                results.append(self.resolve(item))
+        return results[0]
+
+    def resolve_identifier(self, name, start=0):
+        scopes = self.scopes[::-1]
+        for depth in range(start, len(scopes)):
+            scope = scopes[depth]
+            if name not in scope.slots:
+                continue
+            if depth == 0 and name not in scope.declared:
+                # Not bound yet at this point of the function body
+                continue
+            fallback = self.resolve_identifier(name, depth + 1)
+            return ast.Identifier(name, depth, scope.slots[name], fallback)
+
+        return ast.Identifier(name, ast.GLOBAL_DEPTH)
+
+NESTED = frozenset({
+    ast.PrefixExpression, ast.InfixExpression, ast.CallExpression,
+    ast.ArrayLiteral, ast.HashLiteral, ast.IndexExpression,
+})
+
+def children_of(node):
+    # The parser hands back None instead of a list on some errors, those
+    # come back as no children
+    t = type(node)
+    if t is ast.InfixExpression:
+        return [node.left, node.right]
+    if t is ast.CallExpression:
+        return [node.function, *(node.arguments or [])]
+    if t is ast.PrefixExpression:
+        return [node.right]
+    if t is ast.IndexExpression:
+        return [node.left, node.index]
+    if t is ast.ArrayLiteral:
+        return list(node.elements or [])
+    if t is ast.HashLiteral:
+        return [n for pair in node.pairs.items() for n in pair]
+    if t is ast.IfExpression:
+        return [node.condition, node.consequence, node.alternative]
+    if t is ast.BlockStatement:
+        return node.statements
+    if t is ast.ExpressionStatement or t is ast.ReturnStatement or t is ast.LetStatement:
+        return [node.expr]
+    return []
+
+def rebuild(node, children):
+    # node again, with its children_of() swapped for children
+    t = type(node)
+    if t is ast.InfixExpression:
+        return ast.InfixExpression(children[0], node.operator, children[1])
+    if t is ast.CallExpression:
+        arguments = None if node.arguments is None else children[1:]
+        return ast.CallExpression(children[0], arguments, node.line, node.column)
+    if t is ast.PrefixExpression:
+        return ast.PrefixExpression(node.operator, children[0])
+    if t is ast.IndexExpression:
+        return ast.IndexExpression(children[0], children[1])
+    if t is ast.ArrayLiteral:
+        return ast.ArrayLiteral(None if node.elements is None else children)
+    return ast.HashLiteral(dict(zip(children[::2], children[1::2])))
+
+def let_names(node):
+    # Every name a function body binds with `let`, in order. Blocks don't
+    # open a scope, so this looks into ifs (wherever they are), but not
+    # into nested function literals. A stack rather than recursion, the
+    # expressions in there can be deep.
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is ast.FunctionLiteral:
+            continue
+        if type(node) is ast.LetStatement:
+            yield node.identifier.value
+        stack.extend(reversed(children_of(node)))
+
+def resolve(program):
+    return Resolver().resolve(program)
@@ -0,0 +1,303 @@
+import mast as ast
+import mobject as obj
+from mobject import typeof
+from environment import Environment
+from evaluator import (
+    NULL,
+    TRUE,
+    FALSE,
+    is_truthy,
+    eval_identifier,
+    eval_prefix_expression,
+    eval_infix_expression,
+    eval_index_expression,
+)
+
+# Same language as evaluator.Eval, but evaluated by a loop over an explicit
+# stack of continuations instead of Python recursion, so the depth of a
+# Monkey program is only limited by memory.
+#
+# The machine is either evaluating a node in an environment, or handing a
+# value to the continuation on top of the stack. Continuations are tuples
+# tagged with one of the constants below.
+#
+# Returning doesn't wrap values in ReturnValue: a `return` unwinds the stack
+# to the nearest CALL boundary. That also gives us proper tail calls: when a
+# call's continuation is just "return from this function" (`return f(x)`, or
+# a call that's the last thing a body does), the callee reuses the caller's
+# boundary instead of pushing a new one, so tail-recursive loops run in
+# constant space. Errors end evaluation straight away, same as in Eval.
+
+CALL = 0          # function boundary, `return` unwinds to here
+RETURN = 1        # ()
+BLOCK = 2         # (statements, next index, env)
+LET = 3           # (identifier, env)
+PREFIX = 4        # (operator,)
+INFIX_LEFT = 5    # (node, env)
+INFIX_RIGHT = 6   # (operator, left value)
+IF = 7            # (node, env)
+CALL_FUNCTION = 8 # (argument nodes, env)
+CALL_ARGS = 9     # (function, argument nodes, values so far, env)
+ARRAY = 10        # (element nodes, values so far, env)
+HASH_KEY = 11     # (pairs, index, result, env)
+HASH_VALUE = 12   # (pairs, index, result, env, key)
+INDEX_LEFT = 13   # (index node, env)
+INDEX = 14        # (left value,)
+
+Integer = obj.Integer
+Error = obj.Error
+Function = obj.Function
+Builtin = obj.Builtin
+new_integer = obj.new_integer
+HASHABLE = obj.HASHABLE
+
+def evaluate(env, node):
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    value = None
+
+    # The bottom boundary is where a top-level `return` ends up
+    push((CALL,))
+    if type(node) is ast.Program:
+        node = ast.BlockStatement(node.statements)
+
+    while True:
+        # Evaluate `node` in `env`, either producing a value (and clearing
+        # node) or moving on to a child.
+        if node is not None:
+            t = type(node)
+
+            if t is ast.Identifier:
+                value = eval_identifier(env, node.value, node.depth, node.slot, node.fallback)
+                if type(value) is Error:
+                    return value
+                node = None
+
+            elif t is ast.IntegerLiteral:
+                value = new_integer(node.value)
+                node = None
+
+            elif t is ast.InfixExpression:
+                push((INFIX_LEFT, node, env))
+                node = node.left
+
+            elif t is ast.CallExpression:
+                push((CALL_FUNCTION, node.arguments, env))
+                node = node.function
+
+            elif t is ast.ExpressionStatement:
+                node = node.expr
+
+            elif t is ast.BlockStatement:
+                statements = node.statements
+                if not statements:
+                    value = None
+                    node = None
+                else:
+                    if len(statements) > 1:
+                        push((BLOCK, statements, 1, env))
+                    node = statements[0]
+
+            elif t is ast.IfExpression:
+                push((IF, node, env))
+                node = node.condition
+
+            elif t is ast.ReturnStatement:
+                push((RETURN,))
+                node = node.expr
+
+            elif t is ast.LetStatement:
+                push((LET, node.identifier, env))
+                node = node.expr
+
+            elif t is ast.StringLiteral:
+                value = obj.intern_string(node.value)
+                node = None
+
+            elif t is ast.Boolean:
+                value = TRUE if node.value else FALSE
+                node = None
+
+            elif t is ast.PrefixExpression:
+                push((PREFIX, node.operator))
+                node = node.right
+
+            elif t is ast.FunctionLiteral:
+                value = Function(node.parameters, node.body, env, node.num_locals, escapes=node.escapes)
+                node = None
+
+            elif t is ast.ArrayLiteral:
+                if node.elements:
+                    push((ARRAY, node.elements, [], env))
+                    node = node.elements[0]
+                else:
+                    value = obj.Array([])
+                    node = None
+
+            elif t is ast.HashLiteral:
+                pairs = list(node.pairs.items())
+                if pairs:
+                    push((HASH_KEY, pairs, 0, {}, env))
+                    node = pairs[0][0]
+                else:
+                    value = obj.Hash({})
+                    node = None
+
+            elif t is ast.IndexExpression:
+                push((INDEX_LEFT, node.index, env))
+                node = node.left
+
+            else:
+                value = None
+                node = None
+
+            continue
+
+        # Hand `value` to the continuation on top of the stack
+        if not stack:
+            return value
+
+        k = pop()
+        tag = k[0]
+
+        if tag == INFIX_LEFT:
+            _, infix, env = k
+            push((INFIX_RIGHT, infix.operator, value))
+            node = infix.right
+
+        elif tag == INFIX_RIGHT:
+            _, operator, left = k
+            if type(left) is Integer and type(value) is Integer:
+                a, b = left.value, value.value
+                if operator == "+":
+                    value = new_integer(a + b)
+                elif operator == "-":
+                    value = new_integer(a - b)
+                elif operator == "<":
+                    value = TRUE if a < b else FALSE
+                elif operator == "==":
+                    value = TRUE if a == b else FALSE
+                else:
+                    value = eval_infix_expression(operator, left, value)
+            else:
+                value = eval_infix_expression(operator, left, value)
+            if type(value) is Error:
+                return value
+
+        elif tag == BLOCK:
+            _, statements, i, env = k
+            if i + 1 < len(statements):
+                push((BLOCK, statements, i + 1, env))
+            node = statements[i]
+
+        elif tag == IF:
+            _, expr, env = k
+            if value is TRUE or (value is not FALSE and is_truthy(value)):
+                node = expr.consequence
+            elif expr.alternative is not None:
+                node = expr.alternative
+            else:
+                value = NULL
+
+        elif tag == CALL_FUNCTION:
+            _, arguments, env = k
+            if arguments:
+                push((CALL_ARGS, value, arguments, [], env))
+                node = arguments[0]
+            else:
+                node, env, value = apply_function(stack, value, [])
+                if type(value) is Error:
+                    return value
+
+        elif tag == CALL_ARGS:
+            _, fn, arguments, args, env = k
+            args.append(value)
+            if len(args) < len(arguments):
+                push(k)
+                node = arguments[len(args)]
+            else:
+                node, env, value = apply_function(stack, fn, args)
+                if type(value) is Error:
+                    return value
+
+        elif tag == CALL:
+            pass
+
+        elif tag == RETURN:
+            while pop()[0] != CALL:
+                pass
+
+        elif tag == LET:
+            _, identifier, env = k
+            if identifier.slot is None:
+                env.put(identifier.value, value)
+            else:
+                env.put_at(identifier.slot, value)
+            value = None
+
+        elif tag == PREFIX:
+            value = eval_prefix_expression(k[1], value)
+            if type(value) is Error:
+                return value
+
+        elif tag == ARRAY:
+            _, elements, values, env = k
+            values.append(value)
+            if len(values) < len(elements):
+                push(k)
+                node = elements[len(values)]
+            else:
+                value = obj.Array(values)
+
+        elif tag == HASH_KEY:
+            _, pairs, i, result, env = k
+            if type(value) not in HASHABLE:
+                return obj.Error(f"unusable as a hash key: {typeof(value)}")
+            push((HASH_VALUE, pairs, i, result, env, value))
+            node = pairs[i][1]
+
+        elif tag == HASH_VALUE:
+            _, pairs, i, result, env, key = k
+            result[key] = value
+            if i + 1 < len(pairs):
+                push((HASH_KEY, pairs, i + 1, result, env))
+                node = pairs[i + 1][0]
+            else:
+                value = obj.Hash(result)
+
+        elif tag == INDEX_LEFT:
+            _, index, env = k
+            push((INDEX, value))
+            node = index
+
+        elif tag == INDEX:
+            value = eval_index_expression(k[1], value)
+            if type(value) is Error:
+                return value
+
+def apply_function(stack, fn, args):
+    """Starts a call. Gives back the (node, env) to evaluate next, or a
+    value if there's nothing to evaluate (builtins, errors)."""
+    if type(fn) is Function:
+        env = Environment(outer=fn.env, size=fn.num_locals)
+        for param, arg in zip(fn.parameters, args):
+            if param.slot is None:
+                env.put(param.value, arg)
+            else:
+                env.slots[param.slot] = arg
+
+        # Tail call: whatever the caller still had to do is about to be
+        # thrown away by its `return`, so drop it now and share its boundary
+        if stack[-1][0] == RETURN:
+            while stack[-1][0] != CALL:
+                stack.pop()
+        if stack[-1][0] != CALL:
+            stack.append((CALL,))
+
+        return fn.body, env, None
+
+    if type(fn) is Builtin:
+        return None, None, fn.fn(*args)
+
+    return None, None, obj.Error(f"not a function: {typeof(fn)}")
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from dataclasses import dataclass
+
+GLOBAL_SCOPE = "GLOBAL"
+LOCAL_SCOPE = "LOCAL"
+BUILTIN_SCOPE = "BUILTIN"
+FREE_SCOPE = "FREE"
+FUNCTION_SCOPE = "FUNCTION"
+
+@dataclass(eq=True, frozen=True)
+class Symbol:
+    name: str
+    scope: str
+    index: int
+
+class SymbolTable:
+    def __init__(self, outer=None):
+        self.outer = outer
+        self.store = {}
+        self.num_definitions = 0
+        self.free_symbols = []
+        # Locals only bound inside an if so far
+        self.unset = set()
+
+    def define(self, name):
+        # Rebinding a name in the same scope reuses its slot
+        symbol = self.store.get(name)
+        if symbol is not None and symbol.scope in { GLOBAL_SCOPE, LOCAL_SCOPE }:
+            return symbol
+
+        scope = LOCAL_SCOPE if self.outer else GLOBAL_SCOPE
+        symbol = Symbol(name, scope, self.num_definitions)
+        self.store[name] = symbol
+        self.num_definitions += 1
+        return symbol
+
+    def define_builtin(self, index, name):
+        symbol = Symbol(name, BUILTIN_SCOPE, index)
+        self.store[name] = symbol
+        return symbol
+
+    def define_function_name(self, name):
+        symbol = Symbol(name, FUNCTION_SCOPE, 0)
+        self.store[name] = symbol
+        return symbol
+
+    def define_free(self, original):
+        self.free_symbols.append(original)
+        symbol = Symbol(original.name, FREE_SCOPE, len(self.free_symbols) - 1)
+        self.store[original.name] = symbol
+        return symbol
+
+    def resolve(self, name):
+        symbol = self.store.get(name)
+        if symbol is not None or self.outer is None:
+            return symbol
+
+        symbol = self.outer.resolve(name)
+        if symbol is None or symbol.scope in { GLOBAL_SCOPE, BUILTIN_SCOPE }:
+            return symbol
+
+        return self.define_free(symbol)
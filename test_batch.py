@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+import unittest
+
+from batch import Batch, BatchResult, Job, run_batch, run_job
+from budget import Budget
+
+FOREVER = "let fib = fn(n) { if (n < 2) { n } else { fib(n - 1) + fib(n - 2) } }; fib(40);"
+
+class Test_Batch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.batch = Batch(workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.batch.close()
+
+    def results(self, results):
+        return {r.id: (r.result, r.error) for r in results}
+
+    def test_run_job(self):
+        result = run_job(Job("a", "let x = 2; x * 21"))
+        self.assertEqual((result.id, result.result, result.error), ("a", "42", None))
+        self.assertEqual(set(result.timings), {"parse", "eval", "total"})
+
+        tests = [
+            ("let x = ;", "syntax error: line 1, column 9: No prefix parse function for TokenType.SEMICOLON found"),
+            ("len(1)", "argument to `len` not supported, got INTEGER"),
+            ("let f = fn(n) { f(n + 1) }; f(0);", "maximum recursion depth exceeded"),
+        ]
+        for source, expected in tests:
+            result = run_job(Job(0, source))
+            self.assertEqual((result.result, result.error), (None, expected), source)
+
+        self.assertEqual(run_job(Job(0, "[1, true, \"a\"]"), "vm").result, "[1, true, a]")
+        self.assertEqual(run_job(Job(0, "let x = 1;")).result, None)
+
+    def test_run(self):
+        sources = ["1 + 2", ("named", '"a" + "b"'), "len(1)", "[1, 2]"]
+        self.assertEqual(self.results(self.batch.run(sources)), {
+            0: ("3", None),
+            "named": ("ab", None),
+            1: (None, "argument to `len` not supported, got INTEGER"),
+            2: ("[1, 2]", None),
+        })
+
+    def test_many(self):
+        sources = [f"{i} * 2" for i in range(100)]
+        results = self.results(self.batch.run(sources))
+        self.assertEqual(results, {i: (str(i * 2), None) for i in range(100)})
+
+    def test_timeout(self):
+        results = list(self.batch.run([FOREVER, "1"], timeout=0.2))
+        # Finished ones come back first
+        self.assertEqual(results[0].id, 1)
+        self.assertEqual(results[1].error, "time budget exceeded: 0.2s")
+
+        results = self.results(self.batch.run([FOREVER], limits=Budget(max_steps=1000)))
+        self.assertEqual(results, {0: (None, "step budget exceeded: 1000 steps")})
+
+    def test_wall_clock_timeout(self):
+        # Out of the budget's sight, so the worker is killed instead
+        slow = "len(mul(range(5000000), range(5000000)))"
+        started = time.monotonic()
+        results = self.results(self.batch.run([slow, "1"], timeout=0.2))
+        self.assertEqual(results, {0: (None, "time budget exceeded: 0.2s"), 1: ("1", None)})
+        self.assertLess(time.monotonic() - started, 1.5)
+
+        # The pool still works afterwards
+        self.assertEqual(self.results(self.batch.run(["2"])), {0: ("2", None)})
+
+        for engine in ["closure", "stack", "vm"]:
+            with Batch(workers=1, engine=engine) as batch:
+                results = self.results(batch.run([FOREVER, "1"], timeout=0.2))
+                self.assertEqual(results, {0: (None, "time budget exceeded: 0.2s"), 1: ("1", None)}, engine)
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(directory, f"{i}.mk"))
+                with open(paths[-1], "w") as f:
+                    f.write(f"{i} + 1")
+            paths.append(os.path.join(directory, "missing.mk"))
+
+            results = self.results(self.batch.run_files(paths))
+            self.assertEqual(results[paths[2]], ("3", None))
+            self.assertIn("FileNotFoundError", results[paths[3]][1])
+
+    def test_engines(self):
+        for engine in ["closure", "stack", "vm"]:
+            results = list(run_batch(["1 + 1"], workers=1, engine=engine))
+            self.assertEqual(results, [BatchResult(0, "2", None, results[0].timings)], engine)
+
+        with Batch(workers=1, engine="vm") as batch:
+            with self.assertRaises(ValueError):
+                list(batch.run(["1"], limits=Budget(max_steps=10)))
+
+if __name__ == '__main__':
+    unittest.main()
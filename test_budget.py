@@ -0,0 +1,116 @@
+import unittest
+
+import mobject as obj
+from environment import Environment
+from evaluator import Eval
+from parser import parse
+from budget import Budget, ExecutionContext, run, OBJECT_SIZE, CELL_SIZE
+
+LOOP = """
+let loop = fn(n) { if (n == 0) { 0 } else { loop(n - 1) } };
+loop(30);
+"""
+
+# Shallow enough for Python's stack, takes much longer than any test here
+# should
+FOREVER = "let fib = fn(n) { if (n < 2) { n } else { fib(n - 1) + fib(n - 2) } }; fib(40);"
+
+class Test_Budget(unittest.TestCase):
+    def test_unlimited(self):
+        result, context = run(parse(LOOP))
+        self.assertEqual(result, obj.Integer(0))
+        counters = context.counters()
+        self.assertEqual(counters["calls"], 31)
+        self.assertIsNone(counters["exceeded"])
+
+        # Steps only depend on the program
+        _, again = run(parse(LOOP))
+        self.assertEqual(again.steps, context.steps)
+        self.assertGreater(context.steps, 31)
+
+    def test_steps(self):
+        steps = run(parse(LOOP))[1].steps
+
+        result, context = run(parse(LOOP), Budget(max_steps=steps))
+        self.assertEqual(result, obj.Integer(0))
+
+        result, context = run(parse(LOOP), Budget(max_steps=steps - 1))
+        self.assertEqual(result, obj.Error(f"step budget exceeded: {steps - 1} steps"))
+        self.assertEqual(context.counters()["exceeded"], result.message)
+
+        result, _ = run(parse(FOREVER), Budget(max_steps=10000))
+        self.assertEqual(result, obj.Error("step budget exceeded: 10000 steps"))
+
+    def test_memory(self):
+        result, context = run(parse("[1, 2, 3]; [4, 5];"))
+        self.assertEqual(context.allocations, 2)
+        self.assertEqual(context.memory, 2 * OBJECT_SIZE + 5 * CELL_SIZE)
+
+        # Small integers and literal strings are shared, they're free
+        _, context = run(parse('1 + 2; "a"; -5;'))
+        self.assertEqual(context.memory, 0)
+
+        grow = """
+let grow = fn(s, n) { if (n == 0) { s } else { grow(s + "0123456789", n - 1) } };
+len(grow("", 40));
+"""
+        result, _ = run(parse(grow))
+        self.assertEqual(result, obj.Integer(400))
+        result, context = run(parse(grow), Budget(max_memory=1000))
+        self.assertEqual(result, obj.Error("memory budget exceeded: 1000 bytes"))
+        self.assertLess(context.calls, 40)
+
+        # All of a new array from range or map counts, not just its tail
+        _, context = run(parse("let a = range(1000); push(a, 1); map(a, fn(x) { x });"))
+        self.assertEqual(context.memory, 2 * (OBJECT_SIZE + 1000 * CELL_SIZE) + OBJECT_SIZE + 32 * CELL_SIZE + OBJECT_SIZE)
+
+    def test_builtins(self):
+        # Too big for the memory budget, found out before anything's built
+        budget = Budget(max_memory=10000, max_seconds=0.05)
+        for sample in ["len(range(30000000))", "range(10000000000)", "sort(range(1000))",
+                       "add(range(1000), 1)", "mul(range(1000), range(1000))", "map(range(1000), len)"]:
+            result, context = run(parse(sample), budget)
+            self.assertEqual(result, obj.Error("memory budget exceeded: 10000 bytes"), sample)
+            self.assertLess(context.memory, 10000, sample)
+
+        # Every callback is a call and a step, even a builtin
+        for sample in ["map(range(100), range)", "filter(range(100), range)",
+                       "each(range(100), range)", "reduce(range(100), 0, fn(a, x) { a })"]:
+            result, context = run(parse(sample))
+            self.assertEqual(context.calls, 102, sample)
+            self.assertGreater(context.steps, 100, sample)
+            result, context = run(parse(sample), Budget(max_steps=50))
+            self.assertEqual(result, obj.Error("step budget exceeded: 50 steps"), sample)
+
+    def test_recursion(self):
+        result, context = run(parse("let f = fn(x) { f(x) }; f(1)"), Budget(max_steps=10_000_000))
+        self.assertEqual(result, obj.Error("maximum recursion depth exceeded"))
+        self.assertEqual(context.counters()["exceeded"], result.message)
+
+    def test_time(self):
+        result, context = run(parse(FOREVER), Budget(max_seconds=0.01))
+        self.assertEqual(result, obj.Error("time budget exceeded: 0.01s"))
+        self.assertLess(context.counters()["seconds"], 1)
+
+    def test_budget_ends_with_the_run(self):
+        env = Environment()
+        run(parse("let make = fn() { fn() { 1 + 1 } }; let f = make();"), Budget(max_steps=100), env)
+        self.assertIsNone(env.context)
+
+        # The closure's frames don't keep the old budget around
+        self.assertEqual(Eval(env, parse("f()")), obj.Integer(2))
+        result, context = run(parse("f()"), Budget(), env)
+        self.assertEqual(result, obj.Integer(2))
+        self.assertGreater(context.steps, 0)
+
+    def test_context(self):
+        context = ExecutionContext(Budget(max_steps=2))
+        self.assertIsNone(context.step())
+        self.assertIsNone(context.step())
+        error = context.step()
+        self.assertEqual(error, obj.Error("step budget exceeded: 2 steps"))
+        # Stays exceeded
+        self.assertIs(context.step(), error)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import mobject as obj
+from parser import parse
+from evaluator import Eval
+from environment import Environment
+from closure_compiler import evaluate
+
+class Test_ClosureCompiler(unittest.TestCase):
+    def test_same_as_eval(self):
+        samples = [
+            "(5 + 10 * 2 + 15 / 3) * 2 + -10",
+            "1 < 2 == true",
+            "!!5",
+            "if (1 > 2) { 10 } else { 20 }",
+            "if (false) { 10 }",
+            "9; return 2 * 5; 9;",
+            "if (10 > 1) { if (10 > 1) { return 10; } return 1; }",
+            "5 + true; 5;",
+            "-true",
+            "foobar",
+            '"Hello" - "World"',
+            '"Hello" + " " + "World!"',
+            '{"name": "Monkey"}[fn(x) { x }];',
+            "let a = 5; let b = a; let c = a + b + 5; c;",
+            "let add = fn(x, y) { x + y; }; add(5 + 5, add(5, 5));",
+            "fn(x) { x; }(5)",
+            "let newAdder = fn(x) { fn(y) { x + y }; }; let addTwo = newAdder(2); addTwo(2);",
+            "let x = 1; let f = fn() { let y = x; let x = 2; y + x }; f()",
+            "let f = fn() { let g = fn() { h() }; let h = fn() { 7 }; g() }; f()",
+            'len("hello world")',
+            'len("one", "two")',
+            "[1, 2 * 2, 3 + 3]",
+            "[1, 2, 3][-1]",
+            "let myArray = [1, 2, 3]; let i = myArray[0]; myArray[i]",
+            'let two = "two"; {"one": 10 - 9, two: 1 + 1, true: 5}[two]',
+            '{false: 5}[false]',
+            "1(2)",
+        ]
+
+        for i, sample in enumerate(samples):
+            expected = Eval(Environment(), parse(sample))
+            returned = evaluate(Environment(), parse(sample))
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_recursive_fibonacci(self):
+        sample = """
+let fibonacci = fn(x) {
+    if (x < 2) { return x; }
+    fibonacci(x - 1) + fibonacci(x - 2);
+};
+fibonacci(15);
+"""
+        expected = obj.Integer(610)
+        returned = evaluate(Environment(), parse(sample))
+        self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
+
+    def test_body_compiled_once(self):
+        env = Environment()
+        evaluate(env, parse("let f = fn(x) { x * 2 }; f(1);"))
+        compiled = env.get("f").compiled
+        self.assertIsNotNone(compiled)
+
+        evaluate(env, parse("f(2);"))
+        self.assertIs(env.get("f").compiled, compiled)
+
+    def test_functions_from_eval(self):
+        env = Environment()
+        Eval(env, parse("let f = fn(x) { x * 2 };"))
+        returned = evaluate(env, parse("f(21)"))
+        self.assertEqual(returned, obj.Integer(42), f"Expected 42, got {returned}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,10 @@ import unittest
 import mast as ast
 import mobject as obj
 from lexer import lex
+import closure_compiler
+import environment
+import evaluator
+import stack_evaluator
 from evaluator import Eval
 from parser import parse
 from environment import Environment
@@ -170,6 +174,66 @@ addTwo(2);
         returned = Eval(Environment(), parse(sample))
         self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
 
+    def test_lexical_scoping(self):
+        tests = [
+            ("let x = 1; let f = fn() { let y = x; let x = 2; y + x }; f()", obj.Integer(3)),
+            ("let f = fn(x) { let x = x + 1; x }; f(1)", obj.Integer(2)),
+            ("let f = fn() { let g = fn() { h() }; let h = fn() { 7 }; g() }; f()", obj.Integer(7)),
+            ("let f = fn(a) { fn(b) { fn(c) { a + b + c } } }; f(1)(2)(3)", obj.Integer(6)),
+            ("let f = fn() { if (true) { let a = 4; } a }; f()", obj.Integer(4)),
+            ("let a = 10; let f = fn() { a }; let a = 20; f()", obj.Integer(20)),
+            ("let f = fn() { x }; f()", obj.Error("identifier not found: x")),
+            # Reading a slot before its let has run falls back to the outer x
+            ("let x = 10; let f = fn(z) { if (false) { let x = 5; }; x }; f(0)", obj.Integer(10)),
+            ("let x = 10; let f = fn(z) { if (true) { let x = 5; }; x }; f(0)", obj.Integer(5)),
+            ("let x = 1; let f = fn(z) { let g = fn(z) { x }; let r = g(0); let x = 2; r }; f(0)", obj.Integer(1)),
+            ("let f = fn(z) { if (false) { let len = 5; }; len }; f(0)(\"ab\")", obj.Integer(2)),
+        ]
+
+        for engine in [Eval, closure_compiler.evaluate, stack_evaluator.evaluate]:
+            for i, (sample, expected) in enumerate(tests):
+                returned = engine(Environment(), parse(sample))
+                self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_resolved_identifiers(self):
+        program = parse("let a = 1; fn(x) { let y = x; fn() { a + x + y } }")
+        outer = program.statements[1].expr
+        inner = outer.body.statements[1].expr.body.statements[0].expr
+
+        self.assertEqual(outer.num_locals, 2)
+        self.assertEqual((inner.left.left.depth, inner.left.left.slot), (ast.GLOBAL_DEPTH, None))
+        self.assertEqual((inner.left.right.depth, inner.left.right.slot), (1, 0))
+        self.assertEqual((inner.right.depth, inner.right.slot), (1, 1))
+
+    def test_escapes(self):
+        program = parse("let f = fn(x) { let g = fn() { x }; g }; let h = fn(x) { f(x)() + x };")
+        f = program.statements[0].expr
+        self.assertEqual((f.escapes, f.body.statements[0].expr.escapes), (True, False))
+        self.assertFalse(program.statements[1].expr.escapes)
+        self.assertTrue(ast.FunctionLiteral([], ast.BlockStatement([])).escapes)
+
+    def test_frame_pool(self):
+        environment.frame_pool.clear()
+        env = Environment()
+        Eval(env, parse("let fib = fn(n) { if (n < 2) { n } else { fib(n - 1) + fib(n - 2) } }; fib(10);"))
+        frames = environment.frame_pool[1]
+        # One for each call deep it got, they're used again after that
+        self.assertEqual(len(frames), 10)
+        pooled = {id(f) for f in frames}
+        self.assertEqual(Eval(env, parse("fib(10)")), obj.Integer(55))
+        self.assertEqual({id(f) for f in frames}, pooled)
+        self.assertTrue(all(f.slots == [None] and f.outer is None for f in frames))
+
+        tests = [
+            # A let that didn't run this time isn't left over from the last
+            ("let f = fn(x) { if (x) { let y = 1; } y }; f(true); f(false)", obj.Error("identifier not found: y")),
+            # Frames that closures close over aren't pooled
+            ("let adder = fn(x) { fn(y) { x + y } }; let a = adder(1); let b = adder(2); a(10) + b(20)", obj.Integer(33)),
+        ]
+        for engine in [Eval, closure_compiler.evaluate]:
+            for sample, expected in tests:
+                self.assertEqual(engine(Environment(), parse(sample)), expected, sample)
+
     def test_string_literal(self):
         sample = '"Hello World!"'
         expected = obj.String("Hello World!")
@@ -182,6 +246,29 @@ addTwo(2);
         returned = Eval(Environment(), parse(sample))
         self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
 
+    def test_string_ropes(self):
+        env = Environment()
+        sample = 'let s = reduce(range(5000), "", fn(s, i) { s + "abc" }); [s, len(s)]'
+        s, length = Eval(env, parse(sample)).elements
+        self.assertEqual(length, obj.Integer(15000))
+        # len doesn't need the characters, a hash key does
+        self.assertIsNone(s._value)
+        h = Eval(env, parse("{s: 1}"))
+        self.assertEqual(s._value, "abc" * 5000)
+        self.assertEqual(h.pairs[obj.String("abc" * 5000)], obj.Integer(1))
+
+        # Pieces too long to copy onto the last one make a rope as deep as
+        # there are pieces, which still joins up without recursing
+        piece = obj.String("x" * obj.ROPE_MIN)
+        s = piece
+        for _ in range(10000):
+            s = obj.concat(s, piece)
+        self.assertEqual(s.length, 10001 * obj.ROPE_MIN)
+        self.assertEqual(obj.inspect(s), "x" * (10001 * obj.ROPE_MIN))
+
+        # Short strings aren't ropes at all
+        self.assertEqual(obj.concat(obj.String("a"), obj.String("b"))._value, "ab")
+
     def test_builtin_functions(self):
         tests = [
             ('len("")', obj.Integer(0)),
@@ -219,15 +306,149 @@ addTwo(2);
             returned = Eval(Environment(), parse(sample))
             self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
 
+    def test_push_and_rest(self):
+        sample = "let a = [1, 2]; let b = push(a, 3); let c = rest(b); [a, b, c, first(c), last(c), len(c), c[1]]"
+        a, b, c, first, last, length, index = Eval(Environment(), parse(sample)).elements
+        ints = lambda *values: obj.Array([obj.Integer(v) for v in values])
+        self.assertEqual(a, ints(1, 2))
+        self.assertEqual(b, ints(1, 2, 3))
+        self.assertEqual(c, ints(2, 3))
+        self.assertEqual([first, last, length, index], [obj.Integer(2), obj.Integer(3), obj.Integer(2), obj.Integer(3)])
+
+        self.assertEqual(Eval(Environment(), parse("rest([])")), obj.Null())
+        self.assertEqual(Eval(Environment(), parse("push(1, 1)")), obj.Error("argument to `push` must be ARRAY, got INTEGER"))
+
+    def test_higher_order_builtins(self):
+        tests = [
+            ("map([1, 2, 3], fn(x) { x * 2 })", "[2, 4, 6]"),
+            ("map([], fn(x) { x })", "[]"),
+            ('map(["a", [1, 2]], len)', "[1, 2]"),
+            ("filter(range(6), fn(x) { x > 2 })", "[3, 4, 5]"),
+            ("reduce([1, 2, 3], 10, fn(acc, x) { acc + x })", "16"),
+            ("reduce([], 10, fn(acc, x) { acc + x })", "10"),
+            ("let total = 0; each([1, 2], fn(x) { x })", "null"),
+            ("range(3)", "[0, 1, 2]"),
+            ("range(-1, 2)", "[-1, 0, 1]"),
+            ("range(10, 0, -4)", "[10, 6, 2]"),
+            ("range(0)", "[]"),
+            ("let map = fn(a, f) { 1 }; map([1], len)", "1"),
+            ("map(1, len)", "argument to `map` must be ARRAY, got INTEGER"),
+            ("filter([1], 1)", "argument to `filter` must be FUNCTION, got INTEGER"),
+            ("map([1], fn(a, b) { a })", "function given to `map` must take 1 argument, got 2"),
+            ("reduce([1], 0, fn(a) { a })", "function given to `reduce` must take 2 arguments, got 1"),
+            ("each([1], fn(x) { x + true })", "type mismatch: INTEGER + BOOLEAN"),
+            ("reduce([1], 0)", "wrong number of arguments; got 2 but wanted 3"),
+            ('range("a")', "argument to `range` must be INTEGER, got STRING"),
+            ("range(1, 2, 0)", "step given to `range` can't be 0"),
+            ("range(1, 2, 3, 4)", "wrong number of arguments; got 4 but wanted 1, 2 or 3"),
+        ]
+
+        for engine in [Eval, closure_compiler.evaluate, stack_evaluator.evaluate]:
+            for sample, expected in tests:
+                returned = engine(Environment(), parse(sample))
+                if isinstance(returned, obj.Error):
+                    returned = returned.message
+                else:
+                    returned = obj.inspect(returned)
+                self.assertEqual(returned, expected, sample)
+
+        # No recursion, so no limit on the length
+        sample = "reduce(map(range(100000), fn(x) { x * 2 }), 0, fn(acc, x) { acc + x })"
+        self.assertEqual(Eval(Environment(), parse(sample)), obj.Integer(9999900000))
+
+    def test_int_arrays(self):
+        tests = [
+            ("range(3)", "[0, 1, 2]", obj.IntArray),
+            ("push([], 1)", "[1]", obj.IntArray),
+            ("push(push([], 1), true)", "[1, true]", obj.Array),
+            ("rest(push(range(2), 5))", "[1, 5]", obj.IntArray),
+            ("map(range(3), fn(x) { x * x })", "[0, 1, 4]", obj.IntArray),
+            ('map(range(2), fn(x) { "s" })', "[s, s]", obj.Array),
+            ('filter(rest(["a", 1, 3]), fn(x) { x > 1 })', "[3]", obj.IntArray),
+            ("sort([3, -1, 2])", "[-1, 2, 3]", obj.IntArray),
+            ("add(range(3), [10, 20, 30])", "[10, 21, 32]", obj.IntArray),
+            ("mul(range(3), 2)", "[0, 2, 4]", obj.IntArray),
+            ("add([9223372036854775807], 1)", "[9223372036854775808]", obj.Array),
+            ("[sum(range(5)), sum([]), min([4, 2, 9]), max(range(4)), min([])]", "[10, 0, 2, 3, null]", obj.Array),
+            ("let a = range(3); let b = push(a, 3); push(a, 4); [a, b]", "[[0, 1, 2], [0, 1, 2, 3]]", obj.Array),
+            ('sum([1, "a"])', "array given to `sum` must only have INTEGERs, got STRING", obj.Error),
+            ("max(1)", "argument to `max` must be ARRAY, got INTEGER", obj.Error),
+            ("add([1], [1, 2])", "arrays given to `add` must be the same length, got 1 and 2", obj.Error),
+            ("mul([1], true)", "second argument to `mul` must be ARRAY or INTEGER, got BOOLEAN", obj.Error),
+            ("sort([], [])", "wrong number of arguments; got 2 but wanted 1", obj.Error),
+        ]
+
+        for sample, expected, kind in tests:
+            returned = Eval(Environment(), parse(sample))
+            self.assertIs(type(returned), kind, sample)
+            self.assertEqual(returned.message if kind is obj.Error else obj.inspect(returned), expected, sample)
+
+    def test_inline_caches(self):
+        evaluator.reset_inline_cache_stats()
+        sample = "let f = fn(x) { x + 1 }; let g = fn(n) { if (n == 0) { return 0; } f(n) + g(n - 1) }; g(10)"
+        self.assertEqual(Eval(Environment(), parse(sample)), obj.Integer(65))
+        stats = evaluator.inline_cache_stats
+        self.assertEqual((stats["misses"], stats["deopts"]), (3, 0))
+        self.assertEqual(stats["hits"], 18)
+
+        # Binding a global makes every cached callee suspect
+        tests = [
+            ("let f = fn() { 1 }; let g = fn() { f() }; g(); let f = fn() { 2 }; g()", obj.Integer(2)),
+            ('let g = fn() { len("ab") }; g(); let len = fn(x) { 0 }; g()', obj.Integer(0)),
+            ("let f = 1; let g = fn() { f() }; g()", obj.Error("not a function: INTEGER")),
+        ]
+        for i, (sample, expected) in enumerate(tests):
+            evaluator.reset_inline_cache_stats()
+            returned = Eval(Environment(), parse(sample))
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+            if i < 2:
+                self.assertEqual(evaluator.inline_cache_stats["deopts"], 1, f"tests[{i}]")
+
+    def test_inline_caches_are_bounded(self):
+        env = Environment()
+        for i in range(evaluator.MAX_INLINE_CACHES + 10):
+            self.assertEqual(Eval(env, parse(f"len([{i}])")), obj.Integer(1))
+        self.assertLessEqual(len(env.globals.caches), evaluator.MAX_INLINE_CACHES)
+
     def test_string_hash_key(self):
         hello1 = obj.String("Hello World")
         hello2 = obj.String("Hello World")
         diff1 = obj.String("My name is johnny")
         diff2 = obj.String("My name is johnny")
 
-        self.assertEqual(obj.hash_key(hello1), obj.hash_key(hello2))
-        self.assertEqual(obj.hash_key(diff1), obj.hash_key(diff2))
-        self.assertNotEqual(obj.hash_key(hello1), obj.hash_key(diff1))
+        self.assertEqual(hash(hello1), hash(hello2))
+        self.assertEqual(hash(diff1), hash(diff2))
+        self.assertNotEqual(hash(hello1), hash(diff1))
+
+    def test_hash_keys(self):
+        # Keys of different types never match, even when Python's would
+        keys = {obj.Integer(1): "int", obj.Boolean(True): "bool", obj.String("1"): "str"}
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys[obj.new_integer(1)], "int")
+        self.assertEqual(keys[obj.Boolean(True)], "bool")
+        self.assertNotEqual(obj.Integer(1), obj.Boolean(True))
+        self.assertNotEqual(hash(obj.Integer(1)), hash(obj.Boolean(True)))
+
+        big = obj.Integer(10**20)
+        self.assertEqual({big: 1}[obj.Integer(10**20)], 1)
+
+    def test_object_caches(self):
+        self.assertIs(obj.new_integer(5), obj.new_integer(5))
+        self.assertIs(obj.new_integer(obj.SMALL_INT_MAX), obj.new_integer(obj.SMALL_INT_MAX))
+        self.assertIsNot(obj.new_integer(obj.SMALL_INT_MAX + 1), obj.new_integer(obj.SMALL_INT_MAX + 1))
+        self.assertEqual(obj.new_integer(obj.SMALL_INT_MAX + 1), obj.Integer(obj.SMALL_INT_MAX + 1))
+
+        self.assertIs(obj.intern_string("foo"), obj.intern_string("foo"))
+        self.assertIsNot(obj.new_string("foo"), obj.new_string("foo"))
+
+        sample = 'let f = fn() { [1000, "lit"] }; [f(), f()]'
+        a, b = Eval(Environment(), parse(sample)).elements
+        self.assertIs(a.elements[0], b.elements[0])
+        self.assertIs(a.elements[1], b.elements[1])
+
+    def test_compact_objects(self):
+        for value in [obj.Integer(1), obj.String("a"), obj.Array([]), ast.Identifier("x"), parse("1 + 2")]:
+            self.assertFalse(hasattr(value, "__dict__"), f"{type(value).__name__} has a __dict__")
 
     def test_hash_literals(self):
         sample = """
@@ -242,17 +463,18 @@ let two = "two";
 }
 """
         expected = obj.Hash({
-            obj.hash_key(obj.String("one")): obj.HashPair(obj.String("one"), obj.Integer(1)),
-            obj.hash_key(obj.String("two")): obj.HashPair(obj.String("two"), obj.Integer(2)),
-            obj.hash_key(obj.String("three")): obj.HashPair(obj.String("three"), obj.Integer(3)),
-            obj.hash_key(obj.Integer(4)): obj.HashPair(obj.Integer(4), obj.Integer(4)),
-            obj.hash_key(obj.Boolean(True)): obj.HashPair(obj.Boolean(True), obj.Integer(5)),
-            obj.hash_key(obj.Boolean(False)): obj.HashPair(obj.Boolean(False), obj.Integer(6)),
+            obj.String("one"): obj.Integer(1),
+            obj.String("two"): obj.Integer(2),
+            obj.String("three"): obj.Integer(3),
+            obj.Integer(4): obj.Integer(4),
+            obj.Boolean(True): obj.Integer(5),
+            obj.Boolean(False): obj.Integer(6),
         })
         returned = Eval(Environment(), parse(sample))
 
         for i, (r, e) in enumerate(zip(returned.pairs.items(), expected.pairs.items())):
             self.assertEqual(r, e)
+        self.assertEqual(returned, expected)
 
     def test_hash_index_expression(self):
         tests = [
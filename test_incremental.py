@@ -0,0 +1,115 @@
+import random
+import unittest
+from unittest import mock
+
+import incremental
+from incremental import Document, Text
+from parser import Parser, parse
+from lexer import Lexer
+from test_parser import fields
+
+SAMPLE = """let add = fn(a, b) { a + b };
+let s = "two
+lines"; let h = {"a": [1, 2], 3: fn() { add(1, 2) }};
+if (add(1, 2) > 2) { let x = 1; x } else { 0 }
+add(h["a"][0],
+    2);
+"""
+
+PIECES = ["x", " ", "\n", ";", "{", "}", "(", ")", "\"", "let ", "fn(a) { a }", "1", "+", "==", "[", "]", ":", ",", "$"]
+
+def full_parse(source, on_error):
+    parser = Parser(Lexer(source), on_error=on_error)
+    list(parser)
+    return parse(source, on_error=on_error), [str(e) for e in parser.errors]
+
+class Test_Document(unittest.TestCase):
+    def assertParsed(self, document, source, on_error="recover"):
+        program, errors = full_parse(source, on_error)
+        self.assertEqual(document.source, source)
+        self.assertEqual([str(e) for e in document.errors], errors, source)
+        self.assertEqual(fields(document.program), fields(program), source)
+
+    def test_matches_parse(self):
+        # Random edits, some of which break the program (or fix it again),
+        # with small chunks so edits run across them
+        rng = random.Random(0)
+        with mock.patch.object(incremental, "TEXT_CHUNK", 8):
+            for on_error in ["recover", "continue"]:
+                document = Document(SAMPLE * 5, on_error=on_error)
+                source = SAMPLE * 5
+                for _ in range(300):
+                    start = rng.randrange(len(source) + 1)
+                    end = min(len(source), start + rng.choice([0, 0, 1, 3]))
+                    text = "".join(rng.choice(PIECES) for _ in range(rng.choice([0, 1, 2])))
+                    source = source[:start] + text + source[end:]
+                    document.edit(start, end, text)
+                    self.assertParsed(document, source, on_error)
+
+    def test_reuses_statements(self):
+        source = "let a = 1;\nlet b = fn(x) { x };\nlet c = 3;\nlet d = 4;\n"
+        document = Document(source)
+        before = document.program.statements
+
+        document.edit(source.index("x }"), source.index("x }") + 1, "x + 1")
+        after = document.program.statements
+        self.assertEqual(document.reparsed, 1)
+        self.assertIs(after[0], before[0])
+        self.assertIsNot(after[1], before[1])
+        self.assertIs(after[2], before[2])
+        self.assertIs(after[3], before[3])
+        self.assertEqual(str(after[1]), "let b = fn (x) { { (x+1); } };")
+
+    def test_lines_moved(self):
+        source = "let a = 1;\nlet f = fn() { g() };\n"
+        document = Document(source)
+        document.edit(0, 0, "\n\n")
+        self.assertParsed(document, "\n\n" + source)
+        f = document.program.statements[1]
+        self.assertEqual((f.line, f.expr.line, f.expr.body.statements[0].expr.line), (4, 4, 4))
+
+        document.edit(0, 2, "")
+        self.assertEqual(document.program.statements[1].line, 2)
+
+    def test_errors(self):
+        document = Document("let a = 1;\nlet b = 2;\n")
+        document.edit(8, 9, "")
+        self.assertEqual([str(e) for e in document.errors],
+                         ["line 1, column 9: No prefix parse function for TokenType.SEMICOLON found"])
+        self.assertEqual(len(document.program.statements), 1)
+
+        document.edit(0, 0, "\n")
+        self.assertEqual([e.line for e in document.errors], [2])
+        document.edit(9, 9, "5")
+        self.assertEqual(document.errors, [])
+        self.assertParsed(document, "\nlet a = 5;\nlet b = 2;\n")
+
+    def test_raise(self):
+        with self.assertRaises(ValueError):
+            Document("1", on_error="raise")
+        with self.assertRaises(ValueError):
+            Document("1").edit(0, 2, "")
+
+class Test_Text(unittest.TestCase):
+    def test_text(self):
+        rng = random.Random(0)
+        with mock.patch.object(incremental, "TEXT_CHUNK", 4):
+            expected = "let x = 1;\n" * 10
+            text = Text(expected)
+            for _ in range(200):
+                start = rng.randrange(len(expected) + 1)
+                end = min(len(expected), start + rng.randrange(30))
+                s = "".join(rng.choice("ab\n") for _ in range(rng.randrange(20)))
+                expected = expected[:start] + s + expected[end:]
+                text.replace(start, end, s)
+
+                self.assertEqual(str(text), expected)
+                self.assertEqual(len(text), len(expected))
+                a = rng.randrange(len(expected) + 1)
+                b = rng.randrange(a, len(expected) + 1)
+                self.assertEqual(text.slice(a, b), expected[a:b])
+                self.assertEqual(text.find("\n", a), expected.find("\n", a))
+                self.assertEqual(list(Lexer(text.reader(a))), list(Lexer(expected[a:])))
+
+if __name__ == '__main__':
+    unittest.main()
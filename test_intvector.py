@@ -0,0 +1,69 @@
+import subprocess
+import sys
+import unittest
+
+import mobject as obj
+from intvector import IntVector, INT_MAX
+from pvector import PersistentVector
+
+def ints(*values):
+    return [obj.Integer(v) for v in values]
+
+class Test_IntVector(unittest.TestCase):
+    def test_push_shares(self):
+        v = IntVector.from_ints(range(3))
+        w = v.push(obj.Integer(3))
+        # v ended where the buffer did, so w appended to it
+        self.assertIs(w.values, v.values)
+
+        # Now it doesn't, so this one copies
+        x = v.push(obj.Integer(-1))
+        self.assertIsNot(x.values, v.values)
+        self.assertEqual(list(v), ints(0, 1, 2))
+        self.assertEqual(list(w), ints(0, 1, 2, 3))
+        self.assertEqual(list(x), ints(0, 1, 2, -1))
+
+        y = w.rest().push(obj.Integer(4))
+        self.assertEqual(list(y), ints(1, 2, 3, 4))
+        self.assertEqual(list(w.rest().push(obj.Integer(5))), ints(1, 2, 3, 5))
+
+    def test_promotes(self):
+        v = IntVector.from_ints(range(3)).rest()
+        for value in [obj.String("a"), obj.Integer(INT_MAX + 1), obj.Boolean(True)]:
+            w = v.push(value)
+            self.assertIs(type(w), PersistentVector)
+            self.assertEqual(list(w), ints(1, 2) + [value])
+
+    def test_index(self):
+        v = IntVector.from_ints([5, 6, 7]).rest()
+        self.assertEqual((v[0], v[-1], len(v)), (obj.Integer(6), obj.Integer(7), 2))
+        with self.assertRaises(IndexError):
+            v[2]
+        empty = v.rest().rest()
+        with self.assertRaises(IndexError):
+            empty[0]
+        self.assertIs(empty.rest(), empty)
+
+    def test_equality(self):
+        v = IntVector.from_ints([1, 2])
+        self.assertEqual(v, IntVector.from_ints([0, 1, 2]).rest())
+        self.assertEqual(v, PersistentVector.from_iterable(ints(1, 2)))
+        self.assertEqual(PersistentVector.from_iterable(ints(1, 2)), v)
+        self.assertNotEqual(v, ints(1))
+
+    def test_int_array(self):
+        packed = obj.IntArray(ints(1, 2))
+        self.assertIs(type(packed.elements), IntVector)
+        self.assertEqual(packed, obj.Array(ints(1, 2)))
+        self.assertEqual((obj.typeof(packed), obj.inspect(packed)), ("ARRAY", "[1, 2]"))
+        self.assertIs(type(obj.new_array(packed.elements.push(obj.Integer(3)))), obj.IntArray)
+        self.assertIs(type(obj.new_array(packed.elements.push(obj.Null()))), obj.Array)
+
+    def test_imports_on_its_own(self):
+        # In a fresh interpreter, so it's the first to import mobject
+        for module in ["intvector", "mobject"]:
+            result = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
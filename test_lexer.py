@@ -1,9 +1,15 @@
+import io
+import mmap
+import tempfile
 import unittest
 
 from tok import TokenType, Token
-from lexer import Lexer
+from lexer import Lexer, RegexLexer, lex
+from parser import parse
 
 class Test_Lexer(unittest.TestCase):
+    Lexer = Lexer
+
     def test_tokens(self):
         sample = "=+(){}[],;:"
 
@@ -22,7 +28,7 @@ class Test_Lexer(unittest.TestCase):
             Token(TokenType.EOF, ""),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -100,7 +106,7 @@ let result = add(five, ten);
             Token(TokenType.EOF, ""),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -140,7 +146,7 @@ if (5 < 10) {
             Token(TokenType.EOF, ""),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -169,7 +175,7 @@ if (5 < 10) {
             Token(TokenType.EOF, ""),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -188,7 +194,7 @@ if (5 < 10) {
             Token(TokenType.EOF, ""),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -207,7 +213,7 @@ if (5 < 10) {
             (TokenType.SEMICOLON, ";"),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -226,7 +232,7 @@ if (5 < 10) {
             Token(TokenType.EOF, ""),
         ]
 
-        lexer = Lexer(sample)
+        lexer = self.Lexer(sample)
         for i, (t, l) in enumerate(zip(expected, lexer)):
             et, el = t
             lt, ll = l
@@ -234,5 +240,40 @@ if (5 < 10) {
             self.assertEqual(lt, et, f"tests[{i}] - tag wrong. expected={et}, got={lt}")
             self.assertEqual(ll, el, f"tests[{i}] - literal wrong. expected={el}, got={ll}")
 
+    def test_positions(self):
+        sample = 'let x = 10;\n  x == "a\nb";\nx'
+        expected = [
+            (1, 1), (1, 5), (1, 7), (1, 9), (1, 11),
+            (2, 3), (2, 5), (2, 8), (3, 3),
+            (4, 1), (4, 2),
+        ]
+        returned = [(t.line, t.column) for t in self.Lexer(sample)]
+        self.assertEqual(returned, expected)
+
+    def test_streams(self):
+        sample = 'let add = fn(x, y) { x + y; };\nlet s = "héllo wörld"; 10 == 10 != 9;\n' * 20
+        expected = lex(sample)
+        positions = [(t.line, t.column) for t in expected]
+
+        # Small chunks, so tokens, "==" and multi-byte characters all end up
+        # split between two of them
+        for chunk_size in [1, 2, 3, 7, 64]:
+            for source in [io.StringIO(sample), io.BytesIO(sample.encode())]:
+                returned = list(self.Lexer(source, chunk_size))
+                self.assertEqual(returned, expected, f"chunk_size={chunk_size}, {type(source).__name__}")
+                self.assertEqual([(t.line, t.column) for t in returned], positions)
+
+        with tempfile.TemporaryFile() as f:
+            f.write(sample.encode())
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                self.assertEqual(list(self.Lexer(m, 16)), expected)
+                m.seek(0)
+                self.assertEqual(parse(m), parse(sample))
+
+# Everything again with the other backend
+class Test_RegexLexer(Test_Lexer):
+    Lexer = RegexLexer
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
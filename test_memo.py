@@ -0,0 +1,140 @@
+import unittest
+
+import evaluator
+import mobject as obj
+import stack_evaluator
+from closure_compiler import evaluate
+from compiler import compile
+from environment import Environment
+from parser import parse
+from vm import VM
+
+FIB = "let fib = memo(fn(n) { if (n < 2) { n } else { fib(n - 1) + fib(n - 2) } });"
+
+def run(source, engine=evaluator.Eval):
+    env = Environment()
+    return engine(env, parse(source)), env
+
+def stats(env, name):
+    return env.get(name).fn.stats()
+
+class Test_Memo(unittest.TestCase):
+    def test_fib(self):
+        for engine in [evaluator.Eval, evaluate, stack_evaluator.evaluate]:
+            result, env = run(FIB + "fib(60);", engine)
+            self.assertEqual(result, obj.Integer(1548008755920))
+            s = stats(env, "fib")
+            self.assertEqual((s["hits"], s["misses"], s["pure"]), (58, 61, True))
+
+            # And again, straight from the cache
+            result, _ = run("fib(60)", lambda _, program: engine(env, program))
+            self.assertEqual(result, obj.Integer(1548008755920))
+            self.assertEqual(stats(env, "fib")["hits"], 59)
+
+    def test_pure(self):
+        tests = [
+            ("fn(n) { n + 1 }", True),
+            ("fn(a, b) { let c = [a, b]; len(rest(push(c, 1))) }", True),
+            ('fn(s) { {"k": s}["k"] + "!" }', True),
+            ("fn(n) { fn(x) { x + n }(1) }", True),
+            ("fn(n) { helper(n) }", True),
+            ("fn(n) { other(n) }", True),
+            ("fn(n) { puts(n); n }", False),
+            ("fn(n) { noisy(n) }", False),
+            ("fn(f, n) { f(n) }", False),
+            ("fn(n) { n + limit }", False),
+            ("fn(n) { fn() { 1 }()() }", False),
+            ("fn(n) { [helper][0](n) }", False),
+            ("fn(n) { undefined(n) }", False),
+        ]
+        prelude = """
+let limit = 10;
+let helper = fn(n) { n * 2 };
+let other = memo(fn(n) { helper(n) });
+let noisy = fn(n) { puts(n) };
+"""
+        for function, pure in tests:
+            _, env = run(prelude + f"let f = memo({function}); f(1, 2);")
+            self.assertEqual(stats(env, "f")["pure"], pure, function)
+
+    def test_closed_over(self):
+        # The returned function reads n from the call that made it, which
+        # a later let could change
+        _, env = run("let make = fn(n) { memo(fn(x) { x + n }) }; let f = make(1); f(1);")
+        self.assertEqual(stats(env, "f")["pure"], False)
+
+    def test_fallback(self):
+        # When the let doesn't run, x is the global, which gets rebound
+        sample = """
+let x = 1;
+let f = memo(fn(n) { if (n > 100) { let x = 2; }; x + n });
+let a = f(1);
+let x = 10;
+[a, f(1)]
+"""
+        for engine in [evaluator.Eval, evaluate, stack_evaluator.evaluate]:
+            result, env = run(sample, engine)
+            self.assertEqual(obj.inspect(result), "[2, 11]")
+            self.assertEqual(stats(env, "f")["pure"], False)
+
+        # One that falls back to nothing at all is still pure
+        _, env = run("let f = memo(fn(n) { if (n > 100) { let y = 2; }; n }); f(1);")
+        self.assertEqual(stats(env, "f")["pure"], True)
+
+    def test_uncached(self):
+        result, env = run("let f = memo(fn(a) { len(a) }); f([1, 2]) + f([1, 2]) + f(\"ab\");")
+        self.assertEqual(result, obj.Integer(6))
+        s = stats(env, "f")
+        self.assertEqual((s["hits"], s["misses"], s["uncached"]), (0, 1, 2))
+
+    def test_lru(self):
+        _, env = run("let f = memo(fn(n) { n }, 2); f(1); f(2); f(1); f(3); f(2); f(1);")
+        s = stats(env, "f")
+        # 2 was the least recently used when 3 came in, then 1 was
+        self.assertEqual((s["hits"], s["misses"], s["evictions"], s["size"]), (1, 5, 3, 2))
+
+    def test_rebound(self):
+        source = """
+let g = fn(n) { n + 1 };
+let f = memo(fn(n) { g(n) });
+let a = f(1);
+let unrelated = 0;
+let b = f(1);
+let g = fn(n) { puts(n); n };
+let c = f(1);
+[a, b, c]
+"""
+        result, env = run(source)
+        self.assertEqual(obj.inspect(result), "[2, 2, 1]")
+        s = stats(env, "f")
+        self.assertEqual((s["hits"], s["misses"], s["uncached"], s["pure"]), (1, 1, 1, False))
+
+    def test_errors(self):
+        tests = [
+            ("memo(1)", "argument to `memo` must be FUNCTION, got INTEGER"),
+            ("memo(fn() { 1 }, 0)", "size given to `memo` must be a positive INTEGER, got 0"),
+            ("memo()", "wrong number of arguments; got 0 but wanted 1 or 2"),
+            ("memo_stats(len)", "argument to `memo_stats` must be a function from `memo`, got BUILTIN"),
+        ]
+        for source, message in tests:
+            result, _ = run(source)
+            self.assertEqual(result, obj.Error(message), source)
+
+        # Errors aren't remembered
+        result, env = run("let f = memo(fn(n) { n + true }); f(1)")
+        self.assertEqual(result, obj.Error("type mismatch: INTEGER + BOOLEAN"))
+        evaluator.Eval(env, parse("f(1)"))
+        self.assertEqual((stats(env, "f")["misses"], stats(env, "f")["size"]), (2, 0))
+
+        # Works in the VM, but there's no checking bytecode is pure, so
+        # nothing's remembered
+        result = VM(compile(parse("let f = memo(fn(n) { n + 1 }); f(1) + f(1)"))).run()
+        self.assertEqual(result, obj.Integer(4))
+
+    def test_memo_stats(self):
+        result, _ = run(FIB + "fib(10); memo_stats(fib)")
+        self.assertEqual(obj.inspect(result),
+            "{ 'hits':'8', 'misses':'11', 'evictions':'0', 'uncached':'0', 'size':'11', 'maxsize':'1024', 'pure':'true' }")
+
+if __name__ == '__main__':
+    unittest.main()
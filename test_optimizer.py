@@ -0,0 +1,109 @@
+import unittest
+
+import mast as ast
+import mobject as obj
+from parser import parse
+from optimizer import optimize
+from evaluator import Eval
+from environment import Environment
+from compiler import compile, CompileError
+from vm import VM
+from closure_compiler import evaluate
+import stack_evaluator
+
+def run_all(program):
+    def vm(program):
+        try:
+            return VM(compile(program)).run()
+        except CompileError as e:
+            return obj.Error(str(e))
+
+    return [
+        Eval(Environment(), program),
+        evaluate(Environment(), program),
+        stack_evaluator.evaluate(Environment(), program),
+        vm(program),
+    ]
+
+def statements(sample):
+    return optimize(parse(sample)).statements
+
+class Test_Optimizer(unittest.TestCase):
+    def test_folding(self):
+        tests = [
+            ("1 + 2 * 3", ast.IntegerLiteral(7)),
+            ("!true", ast.Boolean(False)),
+            ("!!5", ast.Boolean(True)),
+            ("-(2 - 5)", ast.IntegerLiteral(3)),
+            ('"a" + "b"', ast.StringLiteral("ab")),
+            ("1 < 2 == true", ast.Boolean(True)),
+            ("if (true) { 10 } else { 20 }", ast.IntegerLiteral(10)),
+            ("if (1 > 2) { 10 } else { 2 * 10 }", ast.IntegerLiteral(20)),
+            ("let x = 5; let y = x * 2; y + x", ast.IntegerLiteral(15)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = statements(sample)[-1].expr
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_errors_left_alone(self):
+        # Division by zero isn't even a Monkey error, it's a ZeroDivisionError
+        # out of the evaluator. Still has to be.
+        for sample in ["1 / 0", "1 + true", "-true", '"a" - "b"', "true + false"]:
+            program = parse(sample)
+            self.assertEqual(optimize(program), program, sample)
+
+    def test_dead_branches(self):
+        # Only the branch that runs is left
+        returned = statements("if (1 > 2) { 10 } else { let y = 3; y * 2 }")[0].expr
+        self.assertEqual(returned.condition, ast.Boolean(True))
+        self.assertIsNone(returned.alternative)
+        self.assertEqual(returned.consequence.statements[-1].expr, parse("y * 2").statements[0].expr)
+
+        returned = statements("if (false) { 10 }")[0].expr
+        self.assertEqual(returned.consequence.statements, [])
+
+    def test_inlining(self):
+        tests = [
+            # Rebound, or bound somewhere that might not run
+            ("let x = 5; let x = 6; x", ast.Identifier("x")),
+            ("let q = 1; if (false) { let q = 2; } q", ast.Identifier("q")),
+            ("if (true) { let z = 1; } z", ast.Identifier("z")),
+            ("let f = fn(x) { let x = 3; x }; f", ast.Identifier("f")),
+            # Referenced from a function made before the let ran
+            ("let f = fn() { x }; let x = 5; f", ast.Identifier("f")),
+            ("let f = fn(a) { let x = 2; fn() { x + a } }; f", ast.Identifier("f")),
+        ]
+        for i, (sample, expected) in enumerate(tests):
+            returned = statements(sample)[-1].expr
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+        body = statements("let f = fn() { x }; let x = 5; f")[0].expr.body
+        self.assertEqual(body.statements[0].expr, ast.Identifier("x"))
+
+        inner = statements("let f = fn(a) { let x = 2; fn() { x + a } }; f")[0].expr.body.statements[1].expr
+        self.assertEqual(inner.body.statements[0].expr, ast.InfixExpression(ast.IntegerLiteral(2), "+", ast.Identifier("a")))
+
+    def test_same_results(self):
+        samples = [
+            "1 + 2 * 3",
+            "let f = fn() { 1 + true }; 1 + 1; f()",
+            "let f = fn() { x }; let x = 5; f()",
+            "let f = fn() { let g = fn() { x }; let x = 5; g() }; f()",
+            "let f = fn(a) { let x = 2; let h = fn() { x + a }; h() }; f(1)",
+            "if (true) { let z = 1; } z",
+            "let q = 1; if (false) { let q = 2; } q",
+            "{1 + 1: 1, 2: 2}",
+            "{1 + 1: 1, 3: 2}[2]",
+            "let a = 2; {a: 1, 2: 2}",
+            "let f = fn(x) { if (true) { return x; } 5 }; f(3)",
+            "if (false) { 10 }",
+            'len("ab" + "c")',
+            "[1 + 2, -3, !5][0]",
+        ]
+        for sample in samples:
+            program = parse(sample)
+            self.assertEqual(run_all(optimize(program)), run_all(program), sample)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import dataclasses
+import unittest
+
+import mast as ast
+from lexer import Lexer
+from parser import Parser, ParseError, parse, check
+
+SAMPLES = [
+    "-a * b",
+    "!-a",
+    "a + b + c - d",
+    "a + b * c + d / e - f",
+    "5 > 4 == 3 < 4",
+    "3 + 4 * 5 == 3 * 1 + 4 * 5",
+    "1 + (2 + 3) + 4",
+    "-(5 + 5)",
+    "!(true == true)",
+    "a + add(b * c) + d",
+    "add(a, b, 1, 2 * 3, 4 + 5, add(6, 7 * 8))",
+    "add(a + b + c * d / f + g)",
+    "a * [1, 2, 3, 4][b * c] * d",
+    "add(a * b[2], b[1], 2 * [1, 2][1])",
+    'f()()[0]({"a": 1, 2: [], true: {}}, fn(x) { x }, [])',
+    "let x = if (a < b) { a } else { -b }; return x;",
+    "{1: {2: (3)}}[1][2]",
+    # Broken ones, trees with None holes and errors
+    "(1 + 2",
+    "f(1, 2",
+    "[1, 2",
+    "a[1",
+    "{1 2}",
+    "{1: 2 3}",
+    "1 + ;",
+    "let = 5;",
+    "(]",
+]
+
+def fields(node):
+    # Everything, positions included, which == leaves out
+    if isinstance(node, list):
+        return [fields(n) for n in node]
+    if isinstance(node, dict):
+        return [(fields(k), fields(v)) for k, v in node.items()]
+    if dataclasses.is_dataclass(node):
+        return (type(node).__name__, *(fields(getattr(node, f.name)) for f in dataclasses.fields(node)))
+    return node
+
+def parse_with(source, iterative):
+    parser = Parser(Lexer(source), iterative)
+    return parser.parse_program(), parser.errors
+
+def depth(node, child):
+    # Without recursion, == and repr on these trees would need it
+    d = 0
+    while node is not None and not isinstance(node, ast.IntegerLiteral):
+        node = child(node)
+        d += 1
+    return d
+
+class Test_Parser(unittest.TestCase):
+    def test_iterative_matches_recursive(self):
+        for source in SAMPLES:
+            recursive, errors = parse_with(source, False)
+            iterative, iterative_errors = parse_with(source, True)
+            self.assertEqual(fields(iterative), fields(recursive), source)
+            self.assertEqual([str(e) for e in iterative_errors], [str(e) for e in errors], source)
+
+    def test_operator_precedence(self):
+        self.assertEqual(parse("a + b * c", iterative=True), parse("(a + (b * c))"))
+        self.assertEqual(str(parse("-a * b", iterative=True).statements[0]), "((-a)*b);")
+
+    def test_deep_nesting(self):
+        n = 100_000
+        tests = [
+            ("(" * n + "1" + ")" * n, 0, lambda e: e),
+            ("-" * n + "1", n, lambda e: e.right),
+            ("f(" * n + "1" + ")" * n, n, lambda e: e.arguments[0]),
+            ("[" * n + "1" + "]" * n, n, lambda e: e.elements[0]),
+            ("1" + " + 1" * n, n, lambda e: e.left),
+            ("1" + " + (1" * n + ")" * n, n, lambda e: e.right),
+        ]
+        for source, expected, child in tests:
+            program, errors = parse_with(source, True)
+            self.assertEqual(errors, [])
+            self.assertEqual(depth(program.statements[0].expr, child), expected, source[:20])
+
+            # And through parse(), which resolves the tree too
+            program = parse(source, iterative=True)
+            self.assertEqual(depth(program.statements[0].expr, child), expected, source[:20])
+
+    def test_deep_nesting_resolved(self):
+        n = 100_000
+        program = parse("+".join(["1"] * n), iterative=True)
+        self.assertEqual(depth(program.statements[0].expr, lambda e: e.left), n - 1)
+
+        # Identifiers at the bottom of a deep expression in a function body
+        # still get their slots, and lets in there are found
+        program = parse("fn(x) { " + "-" * n + "x; if (x) { let y = " + "[" * n + "y" + "]" * n + "; } }", iterative=True)
+        function = program.statements[0].expr
+        self.assertEqual(function.num_locals, 2)
+        node = function.body.statements[0].expr
+        while type(node) is ast.PrefixExpression:
+            node = node.right
+        self.assertEqual((node.value, node.depth, node.slot), ("x", 0, 0))
+
+BROKEN = """let a = 1;
+let b = {1 2};
+let f = fn(x) {
+  let y = ;
+  x + 1
+};
+let c = (1 + 2;
+f(a)
+"""
+
+class Test_ParseErrors(unittest.TestCase):
+    def errors(self, errors):
+        return [(e.line, e.column, e.message) for e in errors]
+
+    def test_continue(self):
+        parser = Parser(Lexer(BROKEN))
+        program = parser.parse_program()
+        self.assertEqual(len(program.statements), 7)
+        self.assertEqual(self.errors(parser.errors)[0],
+                         (2, 12, "expected next token to be TokenType.COLON, got TokenType.INT instead"))
+        self.assertEqual(len(parser.errors), 4)
+
+    def test_raise(self):
+        with self.assertRaises(ParseError) as cm:
+            parse(BROKEN, on_error="raise")
+        self.assertEqual((cm.exception.line, cm.exception.column), (2, 12))
+        self.assertEqual(str(cm.exception),
+                         "line 2, column 12: expected next token to be TokenType.COLON, got TokenType.INT instead")
+
+        # Stops reading there too
+        lexer = Lexer("1 +; " + "x; " * 10000)
+        with self.assertRaises(ParseError):
+            Parser(lexer, on_error="raise").parse_program()
+        self.assertLess(lexer.position, 100)
+
+        self.assertEqual(parse("let x = 1; x", on_error="raise"), parse("let x = 1; x"))
+
+    def test_recover(self):
+        self.assertEqual(self.errors(check(BROKEN)), [
+            (2, 12, "expected next token to be TokenType.COLON, got TokenType.INT instead"),
+            (4, 11, "No prefix parse function for TokenType.SEMICOLON found"),
+            (7, 15, "expected next token to be TokenType.RPAREN, got TokenType.SEMICOLON instead"),
+        ])
+
+        # The statements that parsed are all there, bad ones are left out
+        program = parse(BROKEN, on_error="recover")
+        self.assertEqual([str(s) for s in program.statements], [
+            "let a = 1;",
+            "let f = fn (x) { { (x+1); } };",
+            "(f)(a);",
+        ])
+
+    def test_recover_block_ends(self):
+        tests = [
+            # The error is on the block's closing brace
+            ("let f = fn() { 1 + }; let g = 2;", 1),
+            ("if (x) { let = 1 } else { 2 }; 3;", 1),
+            ("}; 1; }", 2),
+            ("{1: {2 3}, 4: 5}; 6;", 1),
+            ("let x = fn() { {1 2} }; x;", 1),
+            ("let x = 1 +", 1),
+            ("", 0),
+        ]
+        for source, count in tests:
+            self.assertEqual(len(check(source)), count, source)
+
+        program = parse("let f = fn() { 1 + }; let g = 2;", on_error="recover")
+        self.assertEqual(len(program.statements), 2)
+
+    def test_iterative(self):
+        for on_error in ["raise", "recover"]:
+            for source in SAMPLES + [BROKEN]:
+                results = []
+                for iterative in [False, True]:
+                    parser = Parser(Lexer(source), iterative, on_error)
+                    try:
+                        program = fields(parser.parse_program())
+                    except ParseError as e:
+                        program = str(e)
+                    results.append((program, [str(e) for e in parser.errors]))
+                self.assertEqual(results[0], results[1], source)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import sys
+import unittest
+
+import evaluator
+import mast as ast
+import mobject as obj
+from environment import Environment
+from parser import parse
+from optimizer import optimize
+from profiler import Profiler, profile
+
+SAMPLE = """let fib = fn(n) {
+  if (n < 2) { return n; }
+  fib(n - 1) + fib(n - 2)
+};
+let twice = fn(f, x) {
+  f(f(x))
+};
+"""
+
+class Test_Positions(unittest.TestCase):
+    def test_positions(self):
+        program = parse(SAMPLE + "twice(fn(x) { x + 1 }, 3);")
+        fib, twice, call = program.statements
+
+        self.assertEqual((fib.line, fib.column), (1, 1))
+        self.assertEqual((fib.expr.line, fib.expr.column), (1, 11))
+        _if, add = fib.expr.body.statements
+        self.assertEqual((_if.line, _if.column), (2, 3))
+        self.assertEqual((add.line, add.column), (3, 3))
+        # A call is at its "("
+        self.assertEqual((add.expr.left.line, add.expr.left.column), (3, 6))
+
+        self.assertEqual((call.line, call.column), (8, 1))
+        self.assertEqual((call.expr.line, call.expr.column), (8, 6))
+        self.assertEqual(call.expr.arguments[0].line, 8)
+
+    def test_positions_survive_passes(self):
+        program = optimize(parse(SAMPLE))
+        self.assertEqual(program.statements[1].line, 5)
+        self.assertEqual(program.statements[1].expr.body.statements[0].line, 6)
+
+    def test_positions_dont_change_equality(self):
+        self.assertEqual(parse("let x = 1;\nx;"), parse("let x = 1; x;"))
+
+class Test_Profiler(unittest.TestCase):
+    def probe_profile(self, source):
+        # Takes a sample at a known point, from a builtin the program calls,
+        # instead of leaving it to the timer
+        program = parse(source)
+        profiler = Profiler(program)
+        env = Environment()
+        env.put("probe", obj.Builtin(lambda *args: profiler.sample(sys._getframe(1))))
+        evaluator.Eval(env, program)
+        return profiler
+
+    def test_sample(self):
+        profiler = self.probe_profile(SAMPLE + """
+let inner = fn(n) {
+  probe();
+  n
+};
+twice(inner, 1);
+""")
+        self.assertEqual(profiler.samples, 2)
+        self.assertEqual(profiler.stacks, {("<main>", "twice:5", "inner:9"): 2})
+        self.assertEqual(profiler.lines, {("inner:9", 10): 2})
+        self.assertEqual(profiler.collapsed(), "<main>;twice:5;inner:9 2\n")
+
+    def test_self_and_cumulative(self):
+        profiler = self.probe_profile("""
+let down = fn(n) {
+  if (n == 0) { probe(); return 0; }
+  down(n - 1)
+};
+down(2);
+probe();
+fn() { probe() }();
+""")
+        self.assertEqual(profiler.samples, 3)
+        self.assertEqual(profiler.functions(), {
+            "<main>": (1, 3),
+            # Recursion counts once toward cumulative time
+            "down:2": (1, 1),
+            "fn:8": (1, 1),
+        })
+        self.assertEqual(profiler.top(1), [("<main>", 1, 3)])
+        self.assertIn(("down:2", 3, 1), profiler.top_lines())
+
+    def test_profile(self):
+        program = parse(SAMPLE + "fib(15);")
+        result, profiler = profile(program, interval=0.0005)
+        self.assertEqual(result, obj.Integer(610))
+        self.assertGreater(profiler.samples, 0)
+        self.assertEqual(profiler.top(1)[0][0], "fib:1")
+        for line in profiler.collapsed().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("<main>"))
+            self.assertGreater(int(count), 0)
+        self.assertIn("fib:1", profiler.report())
+
+if __name__ == '__main__':
+    unittest.main()
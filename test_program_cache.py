@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import program_cache
+from program_cache import ProgramCache, HEADER
+from parser import parse
+
+SAMPLE = "let add = fn(a, b) { a + b }; add(1, 2);"
+
+class Test_ProgramCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def files(self):
+        return [f for f in os.listdir(self.directory) if f.endswith(".mkc")]
+
+    def test_memory(self):
+        cache = ProgramCache(maxsize=2)
+        program = cache.parse(SAMPLE)
+        self.assertEqual(program, parse(SAMPLE))
+        self.assertIs(cache.parse(SAMPLE), program)
+        self.assertEqual(cache.stats(), {"hits": 1, "disk_hits": 0, "misses": 1, "size": 1})
+
+        # Least recently used goes first
+        cache.parse("1")
+        cache.parse(SAMPLE)
+        cache.parse("2")
+        self.assertEqual(cache.stats()["size"], 2)
+        self.assertIs(cache.parse(SAMPLE), program)
+        cache.parse("1")
+        self.assertEqual(cache.misses, 4)
+
+    def test_disk(self):
+        program = ProgramCache(self.directory).parse(SAMPLE)
+        self.assertEqual(len(self.files()), 1)
+
+        cache = ProgramCache(self.directory)
+        self.assertEqual(cache.parse(SAMPLE), program)
+        self.assertEqual(cache.stats(), {"hits": 0, "disk_hits": 1, "misses": 0, "size": 1})
+
+        # Resolved identifiers survive the round trip
+        function = cache.parse(SAMPLE).statements[0].expr
+        self.assertEqual([p.slot for p in function.parameters], [0, 1])
+
+    def test_invalid_files(self):
+        ProgramCache(self.directory).parse(SAMPLE)
+        path = os.path.join(self.directory, self.files()[0])
+        with open(path, "rb") as f:
+            data = f.read()
+
+        bad = [
+            b"",
+            data[: HEADER.size - 1],
+            data[: HEADER.size + 10],
+            b"XXXX" + data[4:],
+            data[:4] + b"\xff\xff" + data[6:],
+            data[:6] + bytes(32) + data[38:],
+        ]
+        for i, contents in enumerate(bad):
+            with open(path, "wb") as f:
+                f.write(contents)
+
+            cache = ProgramCache(self.directory)
+            self.assertEqual(cache.parse(SAMPLE), parse(SAMPLE), f"bad[{i}]")
+            self.assertEqual(cache.misses, 1, f"bad[{i}]")
+
+            # and it's been rewritten
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), data, f"bad[{i}]")
+
+    def test_interpreter_version(self):
+        ProgramCache(self.directory).parse(SAMPLE)
+
+        version = program_cache.interpreter_version()
+        program_cache._interpreter_version = bytes(32)
+        try:
+            cache = ProgramCache(self.directory)
+            cache.parse(SAMPLE)
+            self.assertEqual(cache.misses, 1)
+        finally:
+            program_cache._interpreter_version = version
+
+if __name__ == '__main__':
+    unittest.main()
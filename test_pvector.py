@@ -0,0 +1,55 @@
+import unittest
+
+from pvector import PersistentVector, EMPTY
+
+# Sizes either side of where the tail fills up and the trie grows a level
+SIZES = [0, 1, 31, 32, 33, 64, 65, 1024, 1056, 1057, 32 * 32 * 32 + 33]
+
+class Test_PersistentVector(unittest.TestCase):
+    def test_from_iterable(self):
+        for n in SIZES:
+            v = PersistentVector.from_iterable(range(n))
+            self.assertEqual(len(v), n)
+            self.assertEqual(list(v), list(range(n)), f"size {n}")
+            self.assertEqual([v[i] for i in range(n)], list(range(n)), f"size {n}")
+
+    def test_push(self):
+        v = EMPTY
+        for i in range(SIZES[-1]):
+            v = v.push(i)
+        self.assertEqual(list(v), list(range(SIZES[-1])))
+        self.assertEqual(v, PersistentVector.from_iterable(range(SIZES[-1])))
+
+    def test_push_shares(self):
+        for n in SIZES:
+            v = PersistentVector.from_iterable(range(n))
+            w = v.push("x")
+            self.assertEqual(list(v), list(range(n)), f"size {n}")
+            self.assertEqual(list(w), list(range(n)) + ["x"], f"size {n}")
+
+    def test_rest(self):
+        for n in SIZES[2:]:
+            v = PersistentVector.from_iterable(range(n)).rest().rest()
+            self.assertEqual(len(v), n - 2)
+            self.assertEqual(v[0], 2)
+            self.assertEqual(v[-1], n - 1)
+            self.assertEqual(list(v), list(range(2, n)))
+            self.assertEqual(list(v.push(-1)), list(range(2, n)) + [-1])
+
+        self.assertIs(EMPTY.rest(), EMPTY)
+
+    def test_index(self):
+        v = PersistentVector.from_iterable("abc")
+        self.assertEqual(v[-1], "c")
+        with self.assertRaises(IndexError):
+            v[3]
+        with self.assertRaises(IndexError):
+            v.rest().rest().rest()[0]
+
+    def test_equality(self):
+        v = PersistentVector.from_iterable([1, 2, 3])
+        self.assertEqual(v, [1, 2, 3])
+        self.assertEqual([1, 2, 3], v)
+        self.assertEqual(v, PersistentVector.from_iterable([0, 1, 2, 3]).rest())
+        self.assertNotEqual(v, [1, 2])
+        self.assertEqual(repr(v), "[1, 2, 3]")
@@ -0,0 +1,68 @@
+import unittest
+
+import mobject as obj
+from parser import parse
+from evaluator import Eval
+from environment import Environment
+from stack_evaluator import evaluate
+
+class Test_StackEvaluator(unittest.TestCase):
+    def test_same_as_eval(self):
+        samples = [
+            "(5 + 10 * 2 + 15 / 3) * 2 + -10",
+            "!!5",
+            "if (1 > 2) { 10 } else { 20 }",
+            "if (false) { 10 }",
+            "9; return 2 * 5; 9;",
+            "if (10 > 1) { if (10 > 1) { return 10; } return 1; }",
+            "if (10 > 1) { if (10 > 1) { return true + false; } return 1; }",
+            "5 + true; 5;",
+            "-true",
+            "foobar",
+            '"Hello" + " " + "World!"',
+            '{"name": "Monkey"}[fn(x) { x }];',
+            "let a = 5; let b = a; let c = a + b + 5; c;",
+            "let add = fn(x, y) { x + y; }; add(5 + 5, add(5, 5));",
+            "let f = fn(x) { return x; 10 }; f(5) + 1",
+            "let f = fn(x) { if (x) { return 1; } 2 }; [f(true), f(false)]",
+            "let newAdder = fn(x) { fn(y) { x + y }; }; let addTwo = newAdder(2); addTwo(2);",
+            "let x = 1; let f = fn() { let y = x; let x = 2; y + x }; f()",
+            'len("one", "two")',
+            "[1, 2 * 2, 3 + 3][1]",
+            'let two = "two"; {"one": 10 - 9, two: 1 + 1, true: 5}[two]',
+            "1(2)",
+        ]
+
+        for i, sample in enumerate(samples):
+            expected = Eval(Environment(), parse(sample))
+            returned = evaluate(Environment(), parse(sample))
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_deep_recursion(self):
+        tests = [
+            # Not a tail call, the stack just grows on the heap
+            ("let sum = fn(n) { if (n == 0) { 0 } else { n + sum(n - 1) } }; sum(100000)", obj.Integer(5000050000)),
+            # Tail calls, explicit and implicit
+            ("let count = fn(n, acc) { if (n == 0) { return acc; } return count(n - 1, acc + 1); }; count(100000, 0)", obj.Integer(100000)),
+            ("let count = fn(n) { if (n == 0) { 0 } else { count(n - 1) } }; count(100000)", obj.Integer(0)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = evaluate(Environment(), parse(sample))
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_tail_call_keeps_callers_return(self):
+        # The tail call replaces g's frame, but the value still has to come
+        # back through f
+        sample = """
+let g = fn(x) { return h(x + 1); 99 };
+let h = fn(x) { x * 2 };
+let f = fn(x) { let y = g(x); y + 1 };
+f(1)
+"""
+        expected = obj.Integer(5)
+        returned = evaluate(Environment(), parse(sample))
+        self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import mobject as obj
+from parser import parse
+from compiler import compile, Compiler, CompileError
+from mcode import Opcode, make, disassemble
+from vm import VM
+import repl
+
+def run(sample):
+    try:
+        bytecode = compile(parse(sample))
+    except CompileError as e:
+        return obj.Error(str(e))
+    return VM(bytecode).run()
+
+class Test_Code(unittest.TestCase):
+    def test_make(self):
+        tests = [
+            (Opcode.CONSTANT, [65534], bytes([Opcode.CONSTANT, 255, 254])),
+            (Opcode.ADD, [], bytes([Opcode.ADD])),
+            (Opcode.GET_LOCAL, [255], bytes([Opcode.GET_LOCAL, 255])),
+            (Opcode.CLOSURE, [65534, 255], bytes([Opcode.CLOSURE, 255, 254, 255])),
+        ]
+
+        for i, (op, operands, expected) in enumerate(tests):
+            returned = make(op, *operands)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_disassemble(self):
+        instructions = b"".join([
+            make(Opcode.ADD),
+            make(Opcode.GET_LOCAL, 1),
+            make(Opcode.CONSTANT, 2),
+            make(Opcode.CONSTANT, 65535),
+            make(Opcode.CLOSURE, 65535, 255),
+        ])
+        expected = """0000 OpAdd
+0001 OpGetLocal 1
+0003 OpConstant 2
+0006 OpConstant 65535
+0009 OpClosure 65535 255"""
+
+        returned = disassemble(instructions)
+        self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
+
+class Test_VM(unittest.TestCase):
+    def test_integer_arithmetic(self):
+        tests = [
+            ("5", obj.Integer(5)),
+            ("-10", obj.Integer(-10)),
+            ("5 + 5 + 5 + 5 - 10", obj.Integer(10)),
+            ("2 * 2 * 2 * 2 * 2", obj.Integer(32)),
+            ("50 / 2 * 2 + 10", obj.Integer(60)),
+            ("(5 + 10 * 2 + 15 / 3) * 2 + -10", obj.Integer(50)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_boolean_expressions(self):
+        tests = [
+            ("1 < 2", obj.Boolean(True)),
+            ("1 > 2", obj.Boolean(False)),
+            ("1 != 2", obj.Boolean(True)),
+            ("true != false", obj.Boolean(True)),
+            ("(1 < 2) == true", obj.Boolean(True)),
+            ("!5", obj.Boolean(False)),
+            ("!!true", obj.Boolean(True)),
+            ("!(if (false) { 5; })", obj.Boolean(True)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_conditionals(self):
+        tests = [
+            ("if (true) { 10 }", obj.Integer(10)),
+            ("if (false) { 10 }", obj.Null()),
+            ("if (1) { 10 }", obj.Integer(10)),
+            ("if (1 > 2) { 10 } else { 20 }", obj.Integer(20)),
+            ("if ((if (false) { 10 })) { 10 } else { 20 }", obj.Integer(20)),
+            ("if (true) { let a = 1; }", obj.Null()),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_return_statements(self):
+        tests = [
+            ("return 10; 9;", obj.Integer(10)),
+            ("9; return 2 * 5; 9;", obj.Integer(10)),
+            ("if (10 > 1) { if (10 > 1) { return 10; } return 1; }", obj.Integer(10)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_errors(self):
+        tests = [
+            ("5 + true; 5;", obj.Error("type mismatch: INTEGER + BOOLEAN")),
+            ("-true", obj.Error("unknown operator: -BOOLEAN")),
+            ("5; true + false; 5", obj.Error("unknown operator: BOOLEAN + BOOLEAN")),
+            ("if (10 > 1) { if (10 > 1) { return true + false; } return 1; }", obj.Error("unknown operator: BOOLEAN + BOOLEAN")),
+            ("foobar", obj.Error("identifier not found: foobar")),
+            # Known to the compiler (lets are hoisted), not bound yet when it runs
+            ("let f = fn() { later }; f(); let later = 1;", obj.Error("identifier not found: later")),
+            ("x; let x = 1;", obj.Error("identifier not found: x")),
+            ('"Hello" - "World"', obj.Error("unknown operator: STRING - STRING")),
+            ('{"name": "Monkey"}[fn(x) { x }];', obj.Error("unusable as hash key: FUNCTION")),
+            ('len(1); 5', obj.Error("argument to `len` not supported, got INTEGER")),
+            ("1(2)", obj.Error("not a function: INTEGER")),
+            ("fn(x) { x }(1, 2)", obj.Error("wrong number of arguments: want=1, got=2")),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_global_let_statements(self):
+        tests = [
+            ("let one = 1; one", obj.Integer(1)),
+            ("let one = 1; let two = one + one; one + two", obj.Integer(3)),
+            ("let a = 1; let a = a + 1; a", obj.Integer(2)),
+            ("let f = fn() { g() }; let g = fn() { 5 }; f()", obj.Integer(5)),
+            ("if (true) { let a = 5; } a", obj.Integer(5)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_strings_arrays_hashes(self):
+        tests = [
+            ('"mon" + "key" + "banana"', obj.String("monkeybanana")),
+            ("[1, 2 * 2, 3 + 3]", obj.Array([obj.Integer(1), obj.Integer(4), obj.Integer(6)])),
+            ("[]", obj.Array([])),
+            ("[1, 2, 3][1 + 1]", obj.Integer(3)),
+            ("[1, 2, 3][3]", obj.Null()),
+            ('let two = "two"; {"one": 1, two: 2}[two]', obj.Integer(2)),
+            ("{1: 1}[0]", obj.Null()),
+            ("{true: 5}[true]", obj.Integer(5)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_functions(self):
+        tests = [
+            ("let f = fn() { 5 + 10; }; f();", obj.Integer(15)),
+            ("let f = fn() { return 99; 100; }; f();", obj.Integer(99)),
+            ("let f = fn() { }; f();", obj.Null()),
+            ("let add = fn(x, y) { x + y; }; add(5 + 5, add(5, 5));", obj.Integer(20)),
+            ("fn(x) { x; }(5)", obj.Integer(5)),
+            ("let f = fn(a) { let b = a * 2; let c = b + 1; c }; f(3) + f(4)", obj.Integer(16)),
+            ("let g = 50; let f = fn() { let g = 1; g }; f() + g", obj.Integer(51)),
+            ("let first = fn() { 1 }; let second = fn() { first() + 1 }; second()", obj.Integer(2)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_closures(self):
+        tests = [
+            ("let newAdder = fn(x) { fn(y) { x + y }; }; let addTwo = newAdder(2); addTwo(2);", obj.Integer(4)),
+            ("""
+let newAdderOuter = fn(a, b) {
+    let c = a + b;
+    fn(d) {
+        let e = d + c;
+        fn(f) { e + f; };
+    };
+};
+let newAdderInner = newAdderOuter(1, 2)
+let adder = newAdderInner(3);
+adder(8);
+""", obj.Integer(14)),
+            ("""
+let wrapper = fn() {
+    let countDown = fn(x) { if (x == 0) { return 0; } else { countDown(x - 1); } };
+    countDown(1);
+};
+wrapper();
+""", obj.Integer(0)),
+            # A local whose let hasn't run reads as the outer binding
+            ("let x = 10; let f = fn(z) { if (false) { let x = 5; }; x }; f(0)", obj.Integer(10)),
+            ("let x = 10; let f = fn(z) { if (true) { let x = 5; }; x }; f(0)", obj.Integer(5)),
+            ("let x = 1; let f = fn(z) { let g = fn(z) { x }; let r = g(0); let x = 2; r }; f(0)", obj.Integer(1)),
+            ("let x = 10; let f = fn(b) { if (b) { let x = 5; }; fn() { x } }; f(false)() + f(true)()", obj.Integer(15)),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_builtin_functions(self):
+        tests = [
+            ('len("four")', obj.Integer(4)),
+            ("len([1, 2, 3])", obj.Integer(3)),
+            ("first([1, 2, 3])", obj.Integer(1)),
+            ("last([1, 2, 3])", obj.Integer(3)),
+            ("rest([1, 2, 3])", obj.Array([obj.Integer(2), obj.Integer(3)])),
+            ("push([], 1)", obj.Array([obj.Integer(1)])),
+            ('len("one", "two")', obj.Error("wrong number of arguments; got 2 but wanted 1")),
+            ("let len = fn(x) { 42 }; len([])", obj.Integer(42)),
+            ("range(1, 3)", obj.Array([obj.Integer(1), obj.Integer(2)])),
+        ]
+
+        for i, (sample, expected) in enumerate(tests):
+            returned = run(sample)
+            self.assertEqual(returned, expected, f"tests[{i}]: expected {expected}, got {returned}")
+
+    def test_higher_order_builtins(self):
+        tests = [
+            ("map([1, 2, 3], fn(x) { x * 2 })", "[2, 4, 6]"),
+            ("let k = 10; filter(range(6), fn(x) { x + k > 12 })", "[3, 4, 5]"),
+            ("reduce([1, 2, 3], 10, fn(acc, x) { acc + x })", "16"),
+            ("each([1, 2], fn(x) { x })", "null"),
+            ('map(["a", [1, 2]], len)', "[1, 2]"),
+            # Callbacks that call builtins that call back, and recursion
+            ("map([[1, 2], [3]], fn(a) { reduce(map(a, fn(x) { x * x }), 0, fn(s, x) { s + x }) })", "[5, 9]"),
+            ("let f = fn(n) { if (n == 0) { 0 } else { n + f(n - 1) } }; map([3, 4], f)", "[6, 10]"),
+            ("map([1], fn(a, b) { a })", "function given to `map` must take 1 argument, got 2"),
+            ("each([1], fn(x) { x + true })", "type mismatch: INTEGER + BOOLEAN"),
+            ("let f = memo(fn(n) { n * 2 }); [f(1), f(1), memo_stats(f)[\"uncached\"]]", "[2, 2, 2]"),
+        ]
+
+        for sample, expected in tests:
+            returned = run(sample)
+            if isinstance(returned, obj.Error):
+                returned = returned.message
+            else:
+                returned = obj.inspect(returned)
+            self.assertEqual(returned, expected, sample)
+
+        # The rest of the program carries on where it was
+        self.assertEqual(run("let a = 1; let b = map([1, 2], fn(x) { x + a }); let c = 3; [a, b, c]"),
+                         run("[1, [2, 3], 3]"))
+
+    def test_recursive_fibonacci(self):
+        sample = """
+let fibonacci = fn(x) {
+    if (x == 0) { return 0; }
+    if (x == 1) { return 1; }
+    fibonacci(x - 1) + fibonacci(x - 2);
+};
+fibonacci(15);
+"""
+        expected = obj.Integer(610)
+        returned = run(sample)
+        self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
+
+    def test_deep_recursion(self):
+        # The VM doesn't recurse in Python, so this is fine where Eval isn't
+        sample = "let count = fn(n) { if (n == 0) { 0 } else { count(n - 1) } }; count(5000)"
+        expected = obj.Integer(0)
+        returned = run(sample)
+        self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
+
+    def test_keeps_state(self):
+        compiler = Compiler()
+        globals = [None] * 16
+        for line, expected in [("let a = 5;", None), ("a * 2", obj.Integer(10))]:
+            compiler = Compiler(compiler.symbol_table, compiler.constants)
+            compiler.compile(parse(line))
+            returned = VM(compiler.bytecode(), globals).run()
+            self.assertEqual(returned, expected, f"Expected {expected}, got {returned}")
+
+    def test_repl_recovers(self):
+        # A compile error in a function body leaves the next lines working
+        lines = ["let a = 1;", "let f = fn() { nope };", "let b = 2;", "a + b", ""]
+        out = io.StringIO()
+        with mock.patch("builtins.input", side_effect=lines), redirect_stdout(out):
+            repl.start_vm()
+        self.assertEqual(out.getvalue().splitlines(), ["ERROR: identifier not found: nope", "3"])
+
+if __name__ == '__main__':
+    unittest.main()
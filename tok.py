@@ -1,5 +1,5 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 class TokenType(Enum):
     # Meta
@@ -43,10 +43,14 @@ class TokenType(Enum):
     ELSE = "ELSE"
     RETURN = "RETURN"
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     type: TokenType
     text: str
+    # Where the token starts, both 1-based. Not part of equality, tests
+    # only care about what was lexed.
+    line: int = field(default=0, compare=False)
+    column: int = field(default=0, compare=False)
 
     # For tuple unpacking
     def __iter__(self):
@@ -0,0 +1,331 @@
+from dataclasses import dataclass
+
+import mobject as obj
+import evaluator
+from mbuiltins import builtinfns, TAKES_VM
+from mcode import Opcode, operators
+from evaluator import NULL, TRUE, FALSE, is_truthy
+
+GLOBALS_SIZE = 65536
+MAX_FRAMES = 65536
+
+builtins = list(builtinfns.values())
+
+@dataclass
+class Frame:
+    cl: obj.Closure
+    ip: int = 0
+    base_pointer: int = 0
+
+class VM:
+    # Pass the previous globals along to keep state between runs, like the
+    # REPL does.
+    def __init__(self, bytecode, globals=None):
+        main_fn = obj.CompiledFunction(bytecode.instructions)
+        self.constants = bytecode.constants
+        self.global_names = bytecode.global_names
+        self.globals = globals if globals is not None else [None] * GLOBALS_SIZE
+        self.stack = []
+        self.frames = [Frame(obj.Closure(main_fn, []))]
+        self.last_popped = None
+
+    def run(self, floor=0):
+        """Run until the main function is done, a top-level `return` or
+        the first error. Returns whichever value that left us with. With a
+        floor, returning to that many frames is done too, see call()."""
+        # This loop is the whole point of the VM, so everything it touches
+        # lives in local variables. Frame state is only written back when
+        # we call or return.
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        constants = self.constants
+        globals = self.globals
+
+        frame = frames[-1]
+        ins = frame.cl.fn.instructions
+        free = frame.cl.free
+        ip = frame.ip
+        bp = frame.base_pointer
+        end = len(ins)
+
+        Integer = obj.Integer
+        new_integer = obj.new_integer
+        Closure = obj.Closure
+        Builtin = obj.Builtin
+        Error = obj.Error
+
+        CONSTANT = int(Opcode.CONSTANT)
+        POP = int(Opcode.POP)
+        ADD = int(Opcode.ADD)
+        SUB = int(Opcode.SUB)
+        MUL = int(Opcode.MUL)
+        DIV = int(Opcode.DIV)
+        EQUAL = int(Opcode.EQUAL)
+        NOT_EQUAL = int(Opcode.NOT_EQUAL)
+        GREATER_THAN = int(Opcode.GREATER_THAN)
+        LESS_THAN = int(Opcode.LESS_THAN)
+        MINUS = int(Opcode.MINUS)
+        BANG = int(Opcode.BANG)
+        TRUE_ = int(Opcode.TRUE)
+        FALSE_ = int(Opcode.FALSE)
+        NULL_ = int(Opcode.NULL)
+        JUMP_NOT_TRUTHY = int(Opcode.JUMP_NOT_TRUTHY)
+        JUMP = int(Opcode.JUMP)
+        GET_GLOBAL = int(Opcode.GET_GLOBAL)
+        SET_GLOBAL = int(Opcode.SET_GLOBAL)
+        GET_LOCAL = int(Opcode.GET_LOCAL)
+        SET_LOCAL = int(Opcode.SET_LOCAL)
+        GET_BUILTIN = int(Opcode.GET_BUILTIN)
+        GET_FREE = int(Opcode.GET_FREE)
+        CURRENT_CLOSURE = int(Opcode.CURRENT_CLOSURE)
+        ARRAY = int(Opcode.ARRAY)
+        HASH = int(Opcode.HASH)
+        INDEX = int(Opcode.INDEX)
+        CALL = int(Opcode.CALL)
+        RETURN_VALUE = int(Opcode.RETURN_VALUE)
+        RETURN = int(Opcode.RETURN)
+        CLOSURE = int(Opcode.CLOSURE)
+        GET_LOCAL_OR = int(Opcode.GET_LOCAL_OR)
+
+        while ip < end:
+            op = ins[ip]
+
+            if op == GET_LOCAL:
+                push(stack[bp + ins[ip + 1]])
+                ip += 2
+
+            elif op == CONSTANT:
+                push(constants[(ins[ip + 1] << 8) | ins[ip + 2]])
+                ip += 3
+
+            elif op == GET_GLOBAL:
+                value = globals[(ins[ip + 1] << 8) | ins[ip + 2]]
+                if value is None:
+                    name = self.global_names[(ins[ip + 1] << 8) | ins[ip + 2]]
+                    return self.halt(Error(f"identifier not found: {name}"))
+                push(value)
+                ip += 3
+
+            elif op == GET_LOCAL_OR:
+                # Set: push it and skip the fallback load that follows
+                value = stack[bp + ins[ip + 1]]
+                if value is not None:
+                    push(value)
+                    ip = (ins[ip + 2] << 8) | ins[ip + 3]
+                else:
+                    ip += 4
+
+            elif op == GET_FREE:
+                push(free[ins[ip + 1]])
+                ip += 2
+
+            elif ADD <= op <= LESS_THAN:
+                right = pop()
+                left = stack[-1]
+                if type(left) is Integer and type(right) is Integer:
+                    if op == ADD:
+                        stack[-1] = new_integer(left.value + right.value)
+                    elif op == SUB:
+                        stack[-1] = new_integer(left.value - right.value)
+                    elif op == LESS_THAN:
+                        stack[-1] = TRUE if left.value < right.value else FALSE
+                    elif op == GREATER_THAN:
+                        stack[-1] = TRUE if left.value > right.value else FALSE
+                    elif op == EQUAL:
+                        stack[-1] = TRUE if left.value == right.value else FALSE
+                    elif op == NOT_EQUAL:
+                        stack[-1] = TRUE if left.value != right.value else FALSE
+                    elif op == MUL:
+                        stack[-1] = new_integer(left.value * right.value)
+                    else:
+                        stack[-1] = new_integer(left.value // right.value)
+                else:
+                    result = evaluator.eval_infix_expression(operators[op], left, right)
+                    if type(result) is Error:
+                        return self.halt(result)
+                    stack[-1] = result
+                ip += 1
+
+            elif op == JUMP_NOT_TRUTHY:
+                condition = pop()
+                if condition is FALSE or condition is NULL or not is_truthy(condition):
+                    ip = (ins[ip + 1] << 8) | ins[ip + 2]
+                else:
+                    ip += 3
+
+            elif op == JUMP:
+                ip = (ins[ip + 1] << 8) | ins[ip + 2]
+
+            elif op == CALL:
+                nargs = ins[ip + 1]
+                ip += 2
+                callee = stack[-1 - nargs]
+
+                if type(callee) is Closure:
+                    fn = callee.fn
+                    if nargs != fn.num_parameters:
+                        return self.halt(Error(f"wrong number of arguments: want={fn.num_parameters}, got={nargs}"))
+                    if len(frames) >= MAX_FRAMES:
+                        return self.halt(Error("stack overflow"))
+
+                    frame.ip = ip
+                    frame = Frame(callee, 0, len(stack) - nargs)
+                    frames.append(frame)
+                    if fn.num_locals > nargs:
+                        stack.extend([None] * (fn.num_locals - nargs))
+
+                    ins = fn.instructions
+                    free = callee.free
+                    ip = 0
+                    bp = frame.base_pointer
+                    end = len(ins)
+
+                elif type(callee) is Builtin:
+                    start = len(stack) - nargs
+                    if callee.fn in TAKES_VM:
+                        result = callee.fn(*stack[start:], vm=self)
+                    else:
+                        result = callee.fn(*stack[start:])
+                    del stack[start - 1:]
+                    if type(result) is Error:
+                        return self.halt(result)
+                    push(result if result is not None else NULL)
+
+                else:
+                    return self.halt(Error(f"not a function: {obj.typeof(callee)}"))
+
+            elif op == RETURN_VALUE or op == RETURN:
+                value = pop() if op == RETURN_VALUE else NULL
+                if len(frames) == 1:
+                    return self.halt(value)
+
+                frames.pop()
+                del stack[bp - 1:]
+                if len(frames) == floor:
+                    return value
+                push(value)
+
+                frame = frames[-1]
+                ins = frame.cl.fn.instructions
+                free = frame.cl.free
+                ip = frame.ip
+                bp = frame.base_pointer
+                end = len(ins)
+
+            elif op == SET_GLOBAL:
+                globals[(ins[ip + 1] << 8) | ins[ip + 2]] = pop()
+                ip += 3
+
+            elif op == SET_LOCAL:
+                stack[bp + ins[ip + 1]] = pop()
+                ip += 2
+
+            elif op == POP:
+                self.last_popped = pop()
+                ip += 1
+
+            elif op == TRUE_:
+                push(TRUE)
+                ip += 1
+
+            elif op == FALSE_:
+                push(FALSE)
+                ip += 1
+
+            elif op == NULL_:
+                push(NULL)
+                ip += 1
+
+            elif op == GET_BUILTIN:
+                push(builtins[ins[ip + 1]])
+                ip += 2
+
+            elif op == CURRENT_CLOSURE:
+                push(frame.cl)
+                ip += 1
+
+            elif op == CLOSURE:
+                fn = constants[(ins[ip + 1] << 8) | ins[ip + 2]]
+                nfree = ins[ip + 3]
+                start = len(stack) - nfree
+                captured = stack[start:]
+                del stack[start:]
+                push(Closure(fn, captured))
+                ip += 4
+
+            elif op == MINUS or op == BANG:
+                result = evaluator.eval_prefix_expression("-" if op == MINUS else "!", pop())
+                if type(result) is Error:
+                    return self.halt(result)
+                push(result)
+                ip += 1
+
+            elif op == ARRAY:
+                start = len(stack) - ((ins[ip + 1] << 8) | ins[ip + 2])
+                elements = stack[start:]
+                del stack[start:]
+                push(obj.Array(elements))
+                ip += 3
+
+            elif op == HASH:
+                start = len(stack) - ((ins[ip + 1] << 8) | ins[ip + 2])
+                result = build_hash(stack[start:])
+                del stack[start:]
+                if type(result) is Error:
+                    return self.halt(result)
+                push(result)
+                ip += 3
+
+            elif op == INDEX:
+                index = pop()
+                result = evaluator.eval_index_expression(pop(), index)
+                if type(result) is Error:
+                    return self.halt(result)
+                push(result)
+                ip += 1
+
+            else:
+                return self.halt(Error(f"opcode {op} undefined"))
+
+        return self.last_popped
+
+    def call(self, closure, args):
+        # For builtins that are given a function, map and the like: runs
+        # closure on top of whatever's running, in a run() of its own that
+        # comes back here when it returns
+        fn = closure.fn
+        if len(args) != fn.num_parameters:
+            return obj.Error(f"wrong number of arguments: want={fn.num_parameters}, got={len(args)}")
+        stack, frames = self.stack, self.frames
+        if len(frames) >= MAX_FRAMES:
+            return obj.Error("stack overflow")
+
+        floor, height = len(frames), len(stack)
+        stack.append(closure)
+        stack.extend(args)
+        if fn.num_locals > len(args):
+            stack.extend([None] * (fn.num_locals - len(args)))
+        frames.append(Frame(closure, 0, height + 1))
+
+        result = self.run(floor)
+        if type(result) is obj.Error:
+            # Left where it was when it stopped
+            del frames[floor:]
+            del stack[height:]
+        return result
+
+    def halt(self, value):
+        self.last_popped = value
+        return value
+
+def build_hash(items):
+    pairs = {}
+    for i in range(0, len(items), 2):
+        key, value = items[i], items[i + 1]
+        if type(key) not in obj.HASHABLE:
+            return obj.Error(f"unusable as a hash key: {obj.typeof(key)}")
+        pairs[key] = value
+
+    return obj.Hash(pairs)